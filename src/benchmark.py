@@ -0,0 +1,329 @@
+import zmq
+import zmq.asyncio
+import sys
+import math
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+
+def percentile(ordered: list[float], pct: float) -> float:
+    """Nearest rank percentile of an already sorted list."""
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict:
+    """Throughput and latency distribution, latencies in milliseconds."""
+    ordered = sorted(latencies)
+    return {
+        "requests":len(ordered),
+        "errors":errors,
+        "throughput":len(ordered) / elapsed if elapsed else 0.0,
+        "p50":percentile(ordered, 50) * 1000,
+        "p95":percentile(ordered, 95) * 1000,
+        "p99":percentile(ordered, 99) * 1000,
+        "max":(ordered[-1] if ordered else 0.0) * 1000
+    }
+
+def build_payloads(list_size: int) -> dict:
+    tags = [f"BaseINTArray[{x}]" for x in range(list_size)]
+    return {
+        "read-single": {
+            "command": "read",
+            "msg": {"tag": "BaseINT", "count": 1, "datatype": 195}
+        },
+        "read-list": {
+            "command": "read",
+            "msg": {"tag": tags, "count": None, "datatype": None}
+        },
+        "write-single": {
+            "command": "write",
+            "msg": {"tag": "BaseINT", "value": 1, "datatype": 195}
+        },
+        "write-list": {
+            "command": "write",
+            "msg": [[x, idx] for idx, x in enumerate(tags)]
+        },
+        "tag-list": {
+            "command": "get-tag-list",
+            "msg": {"all_tags": True}
+        },
+        # a frame cut short, every one fails with an exception the
+        # service logs, like the error storm of a controller outage
+        "malformed": b'{"command": "read", "msg": {"tag": "BaseINT"'
+    }
+
+def parse_mix(mix: str, payloads: dict) -> list[tuple[str, int]]:
+    container = []
+    for entry in mix.split(","):
+        name, _, weight = entry.partition("=")
+        name = name.strip()
+        if name not in payloads:
+            raise SystemExit(f"unknown operation in mix: {name}, choose from {', '.join(payloads)}")
+        container.append((name, int(weight or 1)))
+    return container
+
+def is_success(msg) -> bool:
+    if isinstance(msg, list):
+        return all(x.get("status", None) == "Success" for x in msg)
+    return isinstance(msg, dict) and msg.get("status", None) == "Success"
+
+class Benchmark:
+    def __init__(self, url: str, clients: int, duration: float, mix: list, payloads: dict, seed: int) -> None:
+        self.url = url
+        self.clients = clients
+        self.duration = duration
+        self.mix = mix
+        self.payloads = {k: v if isinstance(v, bytes) else json.dumps(v).encode("utf-8") for k, v in payloads.items()}
+        self.seed = seed
+        self.ctx = zmq.asyncio.Context()
+        self.latencies: dict[str, list[float]] = {name: [] for name, _ in mix}
+        self.errors: dict[str, int] = {name: 0 for name, _ in mix}
+
+    async def connect(self, connect_msg: dict):
+        sock = self.ctx.socket(zmq.DEALER)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.connect(self.url)
+        await sock.send_multipart([json.dumps(connect_msg).encode("utf-8")])
+        server_id, raw_msg = await sock.recv_multipart()
+        sock.close()
+        decoded_msg = json.loads(raw_msg)
+        if not is_success(decoded_msg.get("msg", None)):
+            raise SystemExit(f"failed to connect: {decoded_msg}")
+
+    async def _client(self, idx: int, deadline: float):
+        """Closed loop client, one outstanding request at a time."""
+        rng = random.Random(self.seed + idx)
+        names = [name for name, _ in self.mix]
+        weights = [weight for _, weight in self.mix]
+        sock = self.ctx.socket(zmq.DEALER)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.connect(self.url)
+        try:
+            while time.perf_counter() < deadline:
+                name = rng.choices(names, weights)[0]
+                sent = time.perf_counter()
+                await sock.send_multipart([self.payloads[name]])
+                server_id, raw_msg = await sock.recv_multipart()
+                self.latencies[name].append(time.perf_counter() - sent)
+                if not is_success(json.loads(raw_msg).get("msg", None)):
+                    self.errors[name] += 1
+        finally:
+            sock.close()
+
+    async def loop_lag(self) -> dict | None:
+        """Event loop lag histogram of the service, kept while its watchdog runs."""
+        sock = self.ctx.socket(zmq.DEALER)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.connect(self.url)
+        try:
+            await sock.send_multipart([json.dumps({"command": "stats", "msg": None}).encode("utf-8")])
+            server_id, raw_msg = await sock.recv_multipart()
+        finally:
+            sock.close()
+        value = json.loads(raw_msg)["msg"]["value"]
+        # behind a front end the stats are the front end's own
+        return value.get("loop_lag", None) if isinstance(value, dict) else None
+
+    async def run(self) -> dict:
+        before = await self.loop_lag()
+        started = time.perf_counter()
+        deadline = started + self.duration
+        await asyncio.gather(*[self._client(x, deadline) for x in range(self.clients)])
+        elapsed = time.perf_counter() - started
+        after = await self.loop_lag()
+        self.ctx.term()
+        everything = [x for latencies in self.latencies.values() for x in latencies]
+        return {
+            "overall":summarize(everything, sum(self.errors.values()), elapsed),
+            "operations":{
+                name: summarize(self.latencies[name], self.errors[name], elapsed)
+                for name in self.latencies
+            },
+            "loop_lag":lag_during(before, after),
+            "elapsed":elapsed
+        }
+
+def lag_during(before: dict | None, after: dict | None) -> dict | None:
+    """Loop lag heartbeats of the run alone, in milliseconds. max is
+    the worst since the service started."""
+    if not before or not after or after["count"] == before["count"]:
+        return None
+    count = after["count"] - before["count"]
+    return {
+        "heartbeats":count,
+        "mean":(after["sum"] - before["sum"]) / count * 1000,
+        "max":after["max"] * 1000
+    }
+
+def compare(result: dict, baseline: dict, max_regression: float | None) -> bool:
+    """Print the change against a previous run, False when a
+    regression beyond max_regression percent was found."""
+    ok = True
+    print(f"\ncompared with {baseline.get('label', None)} ({baseline.get('timestamp', None)})")
+    for section, current in [("overall", result["overall"])] + list(result["operations"].items()):
+        before = baseline["overall"] if section == "overall" else baseline["operations"].get(section, None)
+        if not before:
+            continue
+        for key in ["throughput", "p50", "p95", "p99", "max"]:
+            if not before[key]:
+                continue
+            change = (current[key] - before[key]) / before[key] * 100
+            # higher throughput is better, higher latency is worse
+            regression = -change if key == "throughput" else change
+            flag = ""
+            if max_regression is not None and key != "max" and regression > max_regression:
+                flag = "  REGRESSION"
+                ok = False
+            print(f"{section:>14} {key:>10} {before[key]:>12.3f} -> {current[key]:>12.3f} ({change:+.1f}%){flag}")
+    return ok
+
+def report(result: dict):
+    print(f"{'operation':>14} {'requests':>9} {'errors':>7} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, x in [("overall", result["overall"])] + list(result["operations"].items()):
+        print(f"{name:>14} {x['requests']:>9} {x['errors']:>7} {x['throughput']:>10.1f} "
+              f"{x['p50']:>9.3f} {x['p95']:>9.3f} {x['p99']:>9.3f} {x['max']:>9.3f}")
+    lag = result.get("loop_lag", None)
+    if lag:
+        print(f"\nevent loop lag over {lag['heartbeats']} heartbeats: mean {lag['mean']:.3f} ms, max {lag['max']:.3f} ms")
+
+async def main(args):
+    url = args.server_url or f"tcp://{args.server_address}:{args.server_port}"
+    payloads = build_payloads(args.list_size)
+    mix = parse_mix(args.mix, payloads)
+    bench = Benchmark(url, args.clients, args.duration, mix, payloads, args.seed)
+    connect_msg = {"ip": args.plc_address, "slot": 0, "timeout": 5, "micro800": False}
+    if args.plc_port is not None:
+        connect_msg["port"] = args.plc_port
+    await bench.connect({
+        "command": "connect",
+        "msg": connect_msg
+    })
+    result = await bench.run()
+    result.update({
+        "label":args.label,
+        "timestamp":time.time(),
+        "python":platform.python_version(),
+        "parameters":{
+            "clients":args.clients,
+            "duration":args.duration,
+            "mix":args.mix,
+            "list_size":args.list_size,
+            "seed":args.seed
+        }
+    })
+    report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=4)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(result, baseline, args.max_regression):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="pylogix-as-service-benchmark",
+        description="Drives concurrent load against the pylogix as service wrapper."
+    )
+    parser.add_argument(
+        '--server-address',
+        dest="server_address",
+        required=False,
+        help="The address the service is bound to, eg. 127.0.0.1."
+    )
+    parser.add_argument(
+        '--server-port',
+        dest="server_port",
+        required=False,
+        help="The port the service listens on, eg. 7777."
+    )
+    parser.add_argument(
+        '--server-url',
+        dest="server_url",
+        default=None,
+        required=False,
+        help="Endpoint of the service instead of address and port, eg. ipc:///tmp/pylogix.ipc."
+    )
+    parser.add_argument(
+        '--plc-address',
+        dest="plc_address",
+        default="192.168.1.196",
+        help="The PLC the service connects to before the run."
+    )
+    parser.add_argument(
+        '--plc-port',
+        dest="plc_port",
+        type=int,
+        default=None,
+        help="EtherNet/IP port of the PLC, only needed for a stand-in like cipserver.py."
+    )
+    parser.add_argument(
+        '--clients',
+        dest="clients",
+        type=int,
+        default=32,
+        help="Number of concurrent DEALER clients."
+    )
+    parser.add_argument(
+        '--duration',
+        dest="duration",
+        type=float,
+        default=10,
+        help="Length of the run in seconds."
+    )
+    parser.add_argument(
+        '--mix',
+        dest="mix",
+        default="read-single=4,read-list=2,write-single=1,write-list=1,tag-list=1",
+        help="Weighted command mix, eg. read-single=4,read-list=2,write-single=1,write-list=1,tag-list=1. "
+             "malformed fails on purpose, read-single=9,malformed=1 is an error storm."
+    )
+    parser.add_argument(
+        '--list-size',
+        dest="list_size",
+        type=int,
+        default=10,
+        help="Number of tags in list reads and writes."
+    )
+    parser.add_argument(
+        '--seed',
+        dest="seed",
+        type=int,
+        default=0,
+        help="Seed for the command mix, so runs are repeatable."
+    )
+    parser.add_argument(
+        '--label',
+        dest="label",
+        default=None,
+        help="Name stored with the results, eg. the version under test."
+    )
+    parser.add_argument(
+        '--output',
+        dest="output",
+        default=None,
+        help="Write the results as JSON to this file."
+    )
+    parser.add_argument(
+        '--compare',
+        dest="compare",
+        default=None,
+        help="Compare against the JSON results of a previous run."
+    )
+    parser.add_argument(
+        '--max-regression',
+        dest="max_regression",
+        type=float,
+        default=None,
+        help="Exit with an error if throughput or a percentile regressed by more than this percentage."
+    )
+    args = parser.parse_args()
+    if not args.server_url and not (args.server_address and args.server_port):
+        parser.error("either --server-url or --server-address and --server-port are required")
+    asyncio.run(main(args=args))
@@ -0,0 +1,86 @@
+import json
+import queue
+import threading
+
+# capture file
+# ----------------------
+# one JSON object a line, appended in the order requests were answered
+# {"t": 1718291573.21, "client": "0080000029", "request": {"command": "read", ...},
+#  "duration": 0.0012, "response": {...}}
+# t is when the request was received, client the routing id of the
+# socket it came on. A request that was not valid JSON is kept as a
+# string under "raw" instead. response is only there when captured.
+
+class Capture:
+    """Appends every request the service answers to a file, for replay.py.
+    The lines are written by a thread of its own, the event loop only
+    splices the bytes it already has together and queues them. Past
+    max_bytes, or when the writer falls behind, requests are counted as
+    dropped instead of written."""
+
+    def __init__(self, path: str, responses: bool = False, max_bytes: int | None = None, max_queue: int = 10000) -> None:
+        self.path = path
+        self.responses = responses
+        self.max_bytes = max_bytes
+        self.written = 0
+        self.captured = 0
+        self.dropped = 0
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._file = open(path, "ab")
+        self._writer = threading.Thread(target=self._write, name="capture", daemon=True)
+        self._writer.start()
+
+    def record(self, client: list[bytes], raw: bytes, valid: bool, received: float, duration: float, response: bytes | None = None):
+        """raw and response are the encoded request and reply, valid
+        tells whether raw decoded as JSON and can be kept as it is."""
+        line = b'{"t": %r, "client": "%s", ' % (received, ".".join(x.hex() for x in client).encode("ascii"))
+        if valid:
+            # newlines can only be whitespace between the tokens of valid JSON
+            line += b'"request": ' + (raw.replace(b"\n", b" ").replace(b"\r", b" ") if b"\n" in raw or b"\r" in raw else raw)
+        else:
+            line += b'"raw": ' + json.dumps(raw.decode("utf-8", "replace")).encode("utf-8")
+        line += b', "duration": %r' % duration
+        if self.responses and response is not None:
+            line += b', "response": ' + response
+        try:
+            self.queue.put_nowait(line + b'}\n')
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self):
+        while True:
+            line = self.queue.get()
+            if line is None:
+                break
+            if self.max_bytes is not None and self.written + len(line) > self.max_bytes:
+                self.dropped += 1
+                continue
+            self._file.write(line)
+            self.written += len(line)
+            self.captured += 1
+            # flushed whenever the writer catches up
+            if self.queue.empty():
+                self._file.flush()
+        self._file.close()
+
+    def close(self):
+        self.queue.put(None)
+        self._writer.join(timeout=5)
+
+    def snapshot(self) -> dict:
+        return {
+            "path":self.path,
+            "responses":self.responses,
+            "captured":self.captured,
+            "bytes":self.written,
+            "dropped":self.dropped
+        }
+
+def read_capture(path: str):
+    """Yield the entries of a capture file, a partly written last line is skipped."""
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
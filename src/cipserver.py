@@ -0,0 +1,563 @@
+import sys
+import time
+import socket
+import struct
+import argparse
+import threading
+import socketserver
+from struct import pack, unpack_from
+
+from mock import load_mock_config, _Controller, _DataType, _TYPE_INFO
+
+# encapsulation commands
+_LIST_IDENTITY = 0x63
+_REGISTER_SESSION = 0x65
+_UNREGISTER_SESSION = 0x66
+_SEND_RR_DATA = 0x6F
+_SEND_UNIT_DATA = 0x70
+
+# cip services
+_GET_ATTRIBUTES_ALL = 0x01
+_GET_ATTRIBUTE_LIST = 0x03
+_SET_ATTRIBUTE_LIST = 0x04
+_MULTIPLE_SERVICE = 0x0A
+_READ_TAG = 0x4C
+_WRITE_TAG = 0x4D
+_READ_MODIFY_WRITE = 0x4E
+_FORWARD_CLOSE = 0x4E
+_READ_TAG_FRAGMENTED = 0x52
+_UNCONNECTED_SEND = 0x52
+_WRITE_TAG_FRAGMENTED = 0x53
+_FORWARD_OPEN = 0x54
+_GET_INSTANCE_ATTRIBUTE_LIST = 0x55
+_LARGE_FORWARD_OPEN = 0x5B
+
+# cip general status
+_SUCCESS = 0x00
+_CONNECTION_FAILURE = 0x01
+_PATH_SEGMENT_ERROR = 0x04
+_PATH_DESTINATION_UNKNOWN = 0x05
+_PARTIAL_TRANSFER = 0x06
+_SERVICE_NOT_SUPPORTED = 0x08
+_INVALID_ATTRIBUTE = 0x09
+_EMBEDDED_SERVICE_ERROR = 0x1E
+_INVALID_PARAMETER = 0x20
+
+_STRING_ID = 0x0fce
+_PROGRAM_SYMBOL = 0x1068
+_HEADER = struct.Struct("<HHII8sI")
+
+def _parse_path(path: bytes) -> tuple[str | None, int | None, int | None]:
+    """Symbolic name, class and instance addressed by an EPATH."""
+    names = []
+    cls = None
+    instance = None
+    idx = 0
+    while idx < len(path):
+        segment = path[idx]
+        if segment == 0x91:
+            length = path[idx + 1]
+            names.append(path[idx + 2:idx + 2 + length].decode("utf-8"))
+            idx += 2 + length + length % 2
+        elif segment == 0x28:
+            names[-1] += f"[{path[idx + 1]}]"
+            idx += 2
+        elif segment == 0x29:
+            names[-1] += f"[{unpack_from('<H', path, idx + 2)[0]}]"
+            idx += 4
+        elif segment == 0x2A:
+            names[-1] += f"[{unpack_from('<I', path, idx + 2)[0]}]"
+            idx += 6
+        elif segment == 0x20:
+            cls = path[idx + 1]
+            idx += 2
+        elif segment == 0x21:
+            cls = unpack_from('<H', path, idx + 2)[0]
+            idx += 4
+        elif segment == 0x24:
+            instance = path[idx + 1]
+            idx += 2
+        elif segment == 0x25:
+            instance = unpack_from('<H', path, idx + 2)[0]
+            idx += 4
+        else:
+            break
+    return ".".join(names) if names else None, cls, instance
+
+def _reply(service: int, status: int, data: bytes = b"") -> bytes:
+    return pack('<BBBB', service | 0x80, 0, status, 0) + data
+
+class _Session:
+    def __init__(self, handle: int) -> None:
+        self.handle = handle
+        self.connection_size = 504
+        self.ot_connection_id = None
+        self.to_connection_id = None
+
+class CIPServer:
+    """Loopback EtherNet/IP responder backed by a simulated controller,
+    so the real pylogix.PLC can be pointed at 127.0.0.1 and measured."""
+
+    def __init__(self, address: str = "127.0.0.1", port: int = 44818, config: dict | None = None) -> None:
+        self.address = address
+        self.port = port
+        self.controller = _Controller(address, config or load_mock_config())
+        self.database = self.controller.database
+        self._sessions = 0
+        self._lock = threading.Lock()
+        self._templates = self._build_templates()
+        server = self
+
+        class TCPHandler(socketserver.BaseRequestHandler):
+            def handle(self):
+                server._serve_connection(self.request)
+
+        class UDPHandler(socketserver.BaseRequestHandler):
+            def handle(self):
+                data, sock = self.request
+                if len(data) >= 24 and unpack_from('<H', data, 0)[0] == _LIST_IDENTITY:
+                    sock.sendto(server._list_identity(data), self.client_address)
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        socketserver.ThreadingTCPServer.daemon_threads = True
+        self.tcp = socketserver.ThreadingTCPServer((address, port), TCPHandler)
+        self.udp = socketserver.ThreadingUDPServer((address, port), UDPHandler)
+
+    # framing
+    # ----------------------
+    def _serve_connection(self, sock: socket.socket):
+        session = None
+        buffer = b""
+        while True:
+            while len(buffer) < 24:
+                part = sock.recv(65536)
+                if not part:
+                    return
+                buffer += part
+            length = unpack_from('<H', buffer, 2)[0]
+            while len(buffer) < 24 + length:
+                part = sock.recv(65536)
+                if not part:
+                    return
+                buffer += part
+            request, buffer = buffer[:24 + length], buffer[24 + length:]
+            command, _, handle, _, context, _ = _HEADER.unpack_from(request, 0)
+            payload = request[24:]
+            if command == _REGISTER_SESSION:
+                with self._lock:
+                    self._sessions += 1
+                    session = _Session(self._sessions)
+                response = self._encapsulate(command, session.handle, context, payload[:4])
+            elif command == _UNREGISTER_SESSION:
+                return
+            elif command == _LIST_IDENTITY:
+                response = self._list_identity(request)
+            elif session is None or handle != session.handle:
+                # invalid session handle
+                response = _HEADER.pack(command, 0, handle, 0x64, context, 0)
+            elif command == _SEND_RR_DATA:
+                cip = self._unconnected(session, self._cpf_data(payload, 0xB2))
+                response = self._encapsulate(
+                    command,
+                    session.handle,
+                    context,
+                    pack('<IHHHHHH', 0, 0, 2, 0, 0, 0xB2, len(cip)) + cip
+                )
+            elif command == _SEND_UNIT_DATA:
+                data = self._cpf_data(payload, 0xB1)
+                sequence, cip = unpack_from('<H', data, 0)[0], data[2:]
+                cip = self._connected(session, cip)
+                response = self._encapsulate(
+                    command,
+                    session.handle,
+                    context,
+                    pack('<IHHHHIHHH', 0, 0, 2, 0xA1, 4, session.to_connection_id or 0,
+                         0xB1, len(cip) + 2, sequence) + cip
+                )
+            else:
+                # unsupported command
+                response = _HEADER.pack(command, 0, handle, 0x01, context, 0)
+            self.controller.exchange(len(request), len(response), session.connection_size if session else 504)
+            sock.sendall(response)
+
+    def _encapsulate(self, command: int, handle: int, context: bytes, payload: bytes) -> bytes:
+        return _HEADER.pack(command, len(payload), handle, 0, context, 0) + payload
+
+    def _cpf_data(self, payload: bytes, item_type: int) -> bytes:
+        count = unpack_from('<H', payload, 6)[0]
+        idx = 8
+        for i in range(count):
+            typ, length = unpack_from('<HH', payload, idx)
+            if typ == item_type:
+                return payload[idx + 4:idx + 4 + length]
+            idx += 4 + length
+        return b""
+
+    # identity
+    # ----------------------
+    def _identity(self, product_name: str, serial_number: int) -> bytes:
+        is_controller = product_name.startswith("1756-L")
+        name = product_name.encode("utf-8")
+        return pack(
+            '<HHHBBHI',
+            1,
+            0x0E if is_controller else 0x0C,
+            167 if is_controller else 166,
+            20,
+            11,
+            0x3060,
+            serial_number
+        ) + pack('<B', len(name)) + name + pack('<B', 3)
+
+    def _module(self, slot: int) -> bytes | None:
+        product_name = self.controller.chassis.get(str(slot), None)
+        if product_name is None:
+            return None
+        return self._identity(product_name, (0xc0ff0000 + slot) & 0xffffffff)
+
+    def _list_identity(self, request: bytes) -> bytes:
+        product_name = self.controller.chassis.get("1", None) or self.controller.chassis.get("0", "1756-L84E/B")
+        identity = self._identity(product_name, 0xc0ff0001)
+        item = pack('<H', 1) + pack('>HH', socket.AF_INET, self.port) + socket.inet_aton(
+            self.address if self.address != "0.0.0.0" else "127.0.0.1") + bytes(8) + identity
+        payload = pack('<HHH', 1, 0x0C, len(item)) + item
+        # the context has to come back untouched, pylogix filters replies on it
+        return pack('<HH', _LIST_IDENTITY, len(payload)) + request[4:24] + payload
+
+    # unconnected messaging
+    # ----------------------
+    def _unconnected(self, session: _Session, cip: bytes) -> bytes:
+        service, words = cip[0], cip[1]
+        path, data = cip[2:2 + words * 2], cip[2 + words * 2:]
+        if service in (_FORWARD_OPEN, _LARGE_FORWARD_OPEN):
+            return self._forward_open(session, service, data)
+        if service == _FORWARD_CLOSE:
+            session.ot_connection_id = None
+            return _reply(service, _SUCCESS, data[4:10] + pack('<BB', 0, 0))
+        if service == _UNCONNECTED_SEND:
+            size = unpack_from('<H', data, 2)[0]
+            embedded = data[4:4 + size]
+            route = data[4 + size + size % 2:]
+            slot = route[3] if len(route) >= 4 else 0
+            module = self._module(slot)
+            if module is None:
+                return _reply(service, _CONNECTION_FAILURE)
+            if embedded[0] != _GET_ATTRIBUTES_ALL:
+                return _reply(embedded[0], _SERVICE_NOT_SUPPORTED)
+            return _reply(_GET_ATTRIBUTES_ALL, _SUCCESS, module)
+        if service == _GET_ATTRIBUTES_ALL:
+            return _reply(service, _SUCCESS, self._module(1) or self._module(0) or self._identity("1756-L84E/B", 0))
+        return _reply(service, _SERVICE_NOT_SUPPORTED)
+
+    def _forward_open(self, session: _Session, service: int, data: bytes) -> bytes:
+        if service == _FORWARD_OPEN:
+            fields = unpack_from('<BBIIHHIIIHIHB', data, 0)
+            session.connection_size = fields[9] & 0x1FF
+        else:
+            fields = unpack_from('<BBIIHHIIIIIIB', data, 0)
+            session.connection_size = fields[9] & 0xFFFF
+        with self._lock:
+            self._sessions += 1
+            session.ot_connection_id = 0x10000000 + self._sessions
+        session.to_connection_id = fields[3]
+        ot_rpi, to_rpi = fields[8], fields[10]
+        return _reply(service, _SUCCESS, pack(
+            '<IIHHIIIBB',
+            session.ot_connection_id,
+            session.to_connection_id,
+            fields[4],
+            fields[5],
+            fields[6],
+            ot_rpi,
+            to_rpi,
+            0,
+            0
+        ))
+
+    # connected messaging
+    # ----------------------
+    def _connected(self, session: _Session, cip: bytes) -> bytes:
+        service, words = cip[0], cip[1]
+        path, data = cip[2:2 + words * 2], cip[2 + words * 2:]
+        name, cls, instance = _parse_path(path)
+        limit = max(16, session.connection_size - 32)
+        if service == _MULTIPLE_SERVICE:
+            return self._multiple_service(session, data)
+        if cls == 0x6C:
+            if service == _GET_ATTRIBUTE_LIST:
+                return self._template_attributes(instance)
+            if service == _READ_TAG:
+                return self._template_read(instance, data, limit)
+        if cls == 0x6B and service == _GET_INSTANCE_ATTRIBUTE_LIST:
+            return self._symbol_upload(name, instance or 0, limit)
+        if cls == 0x8B:
+            return self._wall_clock(service, data)
+        if name is None:
+            return _reply(service, _PATH_SEGMENT_ERROR)
+        if service in (_READ_TAG, _READ_TAG_FRAGMENTED):
+            return self._read(service, name, data, limit)
+        if service in (_WRITE_TAG, _WRITE_TAG_FRAGMENTED):
+            return self._write(service, name, data)
+        if service == _READ_MODIFY_WRITE:
+            return self._read_modify_write(name, data)
+        return _reply(service, _SERVICE_NOT_SUPPORTED)
+
+    def _multiple_service(self, session: _Session, data: bytes) -> bytes:
+        count = unpack_from('<H', data, 0)[0]
+        offsets = [unpack_from('<H', data, 2 + i * 2)[0] for i in range(count)] + [len(data)]
+        replies = []
+        for i in range(count):
+            replies.append(self._connected(session, data[offsets[i]:offsets[i + 1]]))
+        body = pack('<H', count)
+        position = 2 + 2 * count
+        for x in replies:
+            body += pack('<H', position)
+            position += len(x)
+        status = _SUCCESS if all(x[2] in (_SUCCESS, _PARTIAL_TRANSFER) for x in replies) else _EMBEDDED_SERVICE_ERROR
+        return _reply(_MULTIPLE_SERVICE, status, body + b"".join(replies))
+
+    def _wall_clock(self, service: int, data: bytes) -> bytes:
+        if service == _GET_ATTRIBUTE_LIST:
+            plc_time = int(self.controller.now() * 1000000)
+            return _reply(service, _SUCCESS, pack('<HHHQ', 1, 0x0B, 0, plc_time))
+        if service == _SET_ATTRIBUTE_LIST:
+            plc_time = unpack_from('<Q', data, 4)[0]
+            now = time.time()
+            self.controller.clock_epoch = now
+            self.controller.model = {**self.controller.model, "clock_offset": plc_time / 1000000 - now}
+            return _reply(service, _SUCCESS, pack('<HHH', 1, 0x06, 0))
+        return _reply(service, _SERVICE_NOT_SUPPORTED)
+
+    # values
+    # ----------------------
+    def _type_value(self, type_name: str) -> int:
+        if type_name == "STRING":
+            return 0x8000 | _STRING_ID
+        if type_name in self.database.udts:
+            return 0x8000 | self.database.template_ids[type_name]
+        return _DataType[type_name].value
+
+    def _type_header(self, type_name: str) -> bytes:
+        if type_name == "STRING":
+            return pack('<BBH', 0xa0, 0x02, _STRING_ID)
+        if type_name in self.database.udts:
+            return pack('<BBH', 0xa0, 0x02, self.database.template_ids[type_name])
+        return pack('<BB', _DataType[type_name].value, 0)
+
+    def _encode(self, type_name: str, value) -> bytes:
+        if type_name == "STRING":
+            encoded = str(value).encode("utf-8")[:82]
+            return pack('<I', len(encoded)) + encoded.ljust(84, b"\x00")
+        if type_name == "BOOL":
+            return pack('<B', 1 if value else 0)
+        if type_name in self.database.udts:
+            container = b""
+            for member, (member_type, array, _) in self.database.udts[type_name].items():
+                values = value[member] if array else [value[member]]
+                container += b"".join(self._encode(member_type, x) for x in values)
+            return container
+        return pack(_TYPE_INFO[type_name][1], value)
+
+    def _decode(self, type_code: int, data: bytes, count: int) -> list:
+        if type_code == 0xa0:
+            values = []
+            for i in range(count):
+                length = unpack_from('<I', data, i * 88)[0]
+                values.append(data[i * 88 + 4:i * 88 + 4 + length].decode("utf-8"))
+            return values
+        type_name = _DataType(type_code).name
+        size, fmt = _TYPE_INFO[type_name]
+        if type_name == "BOOL":
+            return [bool(x) for x in data[:count]]
+        return [unpack_from(fmt, data, i * size)[0] for i in range(count)]
+
+    def _read(self, service: int, name: str, data: bytes, limit: int) -> bytes:
+        elements = unpack_from('<H', data, 0)[0] if len(data) >= 2 else 1
+        offset = unpack_from('<I', data, 2)[0] if service == _READ_TAG_FRAGMENTED and len(data) >= 6 else 0
+        with self.controller.lock:
+            location = self.database.locate(name)
+            if location is None:
+                return _reply(service, _PATH_DESTINATION_UNKNOWN)
+            value, size = self.database.read(name, max(elements, 1))
+        values = value if elements > 1 and isinstance(value, list) else [value]
+        payload = b"".join(self._encode(location.type_name, x) for x in values)
+        chunk = payload[offset:offset + limit]
+        status = _PARTIAL_TRANSFER if offset + limit < len(payload) else _SUCCESS
+        return _reply(service, status, self._type_header(location.type_name) + chunk)
+
+    def _write(self, service: int, name: str, data: bytes) -> bytes:
+        type_code = data[0]
+        idx = 2
+        if type_code == 0xa0:
+            idx += 2
+        count = unpack_from('<H', data, idx)[0]
+        idx += 2
+        offset = 0
+        if service == _WRITE_TAG_FRAGMENTED:
+            offset = unpack_from('<I', data, idx)[0]
+            idx += 4
+        try:
+            values = self._decode(type_code, data[idx:], count if service == _WRITE_TAG else (len(data) - idx) // (88 if type_code == 0xa0 else _TYPE_INFO[_DataType(type_code).name][0]))
+        except (ValueError, KeyError, struct.error):
+            return _reply(service, _INVALID_PARAMETER)
+        with self.controller.lock:
+            location = self.database.locate(name)
+            if location is None:
+                return _reply(service, _PATH_DESTINATION_UNKNOWN)
+            if offset:
+                element_size = 88 if type_code == 0xa0 else _TYPE_INFO[_DataType(type_code).name][0]
+                match = name.rsplit("[", 1)
+                start = int(match[1][:-1]) if len(match) == 2 and match[1].endswith("]") else 0
+                base = match[0] if len(match) == 2 else name
+                name = f"{base}[{start + offset // element_size}]"
+            try:
+                self.database.write(name, values if len(values) > 1 else values[0])
+            except (TypeError, ValueError):
+                return _reply(service, _INVALID_PARAMETER)
+        return _reply(service, _SUCCESS)
+
+    def _read_modify_write(self, name: str, data: bytes) -> bytes:
+        size = unpack_from('<H', data, 0)[0]
+        or_mask = int.from_bytes(data[2:2 + size], "little")
+        and_mask = int.from_bytes(data[2 + size:2 + size * 2], "little")
+        with self.controller.lock:
+            location = self.database.locate(name)
+            if location is None:
+                return _reply(_READ_MODIFY_WRITE, _PATH_DESTINATION_UNKNOWN)
+            value, _ = self.database.read(name)
+            bits = size * 8
+            value = ((value & ((1 << bits) - 1)) | or_mask) & and_mask
+            self.database.write(name, value)
+        return _reply(_READ_MODIFY_WRITE, _SUCCESS)
+
+    # symbols and templates
+    # ----------------------
+    def _symbols(self, program: str | None) -> list[tuple[str, int, int]]:
+        """(name, symbol type, array size) in instance order."""
+        container = []
+        programs = []
+        for name, (type_name, array) in self.database.tags.items():
+            if name.startswith("Program:"):
+                prefix, _, rest = name.partition(".")
+                if program == prefix:
+                    container.append((rest, type_name, array))
+                elif program is None and prefix not in programs:
+                    programs.append(prefix)
+            elif program is None:
+                container.append((name, type_name, array))
+        symbols = []
+        for name, type_name, array in container:
+            symbol_type = self._type_value(type_name)
+            if array:
+                symbol_type |= 1 << 13
+            symbols.append((name, symbol_type, array))
+        return symbols + [(x, _PROGRAM_SYMBOL, 0) for x in programs]
+
+    def _symbol_upload(self, program: str | None, start: int, limit: int) -> bytes:
+        symbols = self._symbols(program)
+        if program is not None and not symbols:
+            return _reply(_GET_INSTANCE_ATTRIBUTE_LIST, _PATH_DESTINATION_UNKNOWN)
+        body = b""
+        status = _SUCCESS
+        for instance, (name, symbol_type, array) in enumerate(symbols, start=1):
+            if instance < start:
+                continue
+            encoded = name.encode("utf-8")
+            entry = pack('<IH', instance, len(encoded)) + encoded + pack('<HIII', symbol_type, array, 0, 0)
+            if body and len(body) + len(entry) > limit:
+                status = _PARTIAL_TRANSFER
+                break
+            body += entry
+        return _reply(_GET_INSTANCE_ATTRIBUTE_LIST, status, body)
+
+    def _build_templates(self) -> dict[int, bytes]:
+        definitions = {_STRING_ID: ("STRING", [("LEN", "DINT", 0), ("DATA", "SINT", 82)])}
+        for name, members in self.database.udts.items():
+            definitions[self.database.template_ids[name]] = (
+                name,
+                [(member, x[0], x[1]) for member, x in members.items()]
+            )
+        templates = {}
+        for template_id, (name, members) in definitions.items():
+            defs = b""
+            offset = 0
+            for member, type_name, array in members:
+                type_value = self._type_value(type_name)
+                if array:
+                    type_value |= 1 << 13
+                defs += pack('<HHI', array, type_value, offset)
+                offset += self.database.size_of(type_name, array)
+            names = b"\x00".join(x.encode("utf-8") for x in [name] + [m[0] for m in members]) + b"\x00"
+            templates[template_id] = (defs + names, len(members), offset)
+        return templates
+
+    def _template_attributes(self, instance: int) -> bytes:
+        template = self._templates.get(instance, None)
+        if template is None:
+            return _reply(_GET_ATTRIBUTE_LIST, _PATH_DESTINATION_UNKNOWN)
+        blob, member_count, size = template
+        # definition size in 32 bit words, pylogix reads back (words * 4) - 23 bytes
+        words = (len(blob) + 23 + 3) // 4
+        # laid out the way pylogix parses it, structure size as a 16 bit value
+        return _reply(_GET_ATTRIBUTE_LIST, _SUCCESS, pack(
+            '<HHHIHHHHHHHHH',
+            4,
+            4, 0, words,
+            3, 0, size & 0xffff,
+            2, 0, member_count,
+            1, 0, instance
+        ))
+
+    def _template_read(self, instance: int, data: bytes, limit: int) -> bytes:
+        template = self._templates.get(instance, None)
+        if template is None:
+            return _reply(_READ_TAG, _PATH_DESTINATION_UNKNOWN)
+        offset, length = unpack_from('<IH', data, 0)
+        blob = template[0].ljust(offset + length, b"\x00")
+        chunk = blob[offset:offset + min(length, limit)]
+        status = _PARTIAL_TRANSFER if len(chunk) < length else _SUCCESS
+        return _reply(_READ_TAG, status, chunk)
+
+    # lifecycle
+    # ----------------------
+    def start(self):
+        for server in [self.tcp, self.udp]:
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def close(self):
+        for server in [self.tcp, self.udp]:
+            server.shutdown()
+            server.server_close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="pylogix-as-service-cipserver",
+        description="EtherNet/IP stand-in for a ControlLogix, lets the real pylogix path be benchmarked locally."
+    )
+    parser.add_argument(
+        '--address',
+        dest="address",
+        default="127.0.0.1",
+        help="The address to listen on, eg. 127.0.0.1."
+    )
+    parser.add_argument(
+        '--port',
+        dest="port",
+        type=int,
+        default=44818,
+        help="The EtherNet/IP port to listen on, eg. 44818."
+    )
+    parser.add_argument(
+        '--mock-config',
+        dest="mock_config",
+        default=None,
+        help="JSON file describing the tags, latency model and seed, the same format as the service uses."
+    )
+    args = parser.parse_args()
+    server = CIPServer(args.address, args.port, load_mock_config(args.mock_config))
+    server.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.close()
+        sys.exit(0)
@@ -0,0 +1,249 @@
+import json
+import asyncio
+import itertools
+
+import zmq
+import zmq.asyncio
+
+from columnar import decode
+
+# only these are sent again after a timeout without being asked to,
+# repeating a write or a set-plc-time could apply it twice
+_IDEMPOTENT = {
+    "get-connection-size",
+    "read",
+    "get-plc-time",
+    "get-tag-list",
+    "get-program-tag-list",
+    "get-programs-list",
+    "discover",
+    "get-module-properties",
+    "get-device-properties",
+    "history",
+    "stats",
+    "find-tags",
+    "scan-chassis",
+    "ready",
+    "set-scaling"
+}
+
+class RequestTimeout(Exception):
+    """No reply arrived in time, including any retries."""
+
+class Client:
+    """asyncio client of the service. Any number of requests can be
+    outstanding on its one DEALER socket, every request carries an id
+    the service echoes back and replies are matched on it.
+
+        async with Client("tcp://127.0.0.1:7777") as client:
+            await client.connect("192.168.1.196")
+            values = await asyncio.gather(*[client.read(x) for x in tags])
+
+    The helpers return the msg part of the response, eg.
+    {"name": "BaseDINT", "value": 42, "status": "Success"}."""
+
+    def __init__(self, url: str, timeout: float = 10, retries: int = 1, ctx: zmq.asyncio.Context | None = None) -> None:
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.ctx = ctx or zmq.asyncio.Context.instance()
+        self.sock: zmq.asyncio.Socket | None = None
+        self.pending: dict[int, asyncio.Future | asyncio.Queue] = {}
+        self._ids = itertools.count(1)
+        self._receiver: asyncio.Task | None = None
+
+    async def __aenter__(self):
+        self.open()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    def open(self):
+        self.sock = self.ctx.socket(zmq.DEALER)
+        self.sock.setsockopt(zmq.LINGER, 0)
+        self.sock.connect(self.url)
+        self._receiver = asyncio.ensure_future(self._receive())
+
+    async def aclose(self):
+        if self._receiver is not None:
+            self._receiver.cancel()
+            try:
+                await self._receiver
+            except asyncio.CancelledError:
+                pass
+            self._receiver = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        for waiter in self.pending.values():
+            if isinstance(waiter, asyncio.Future) and not waiter.done():
+                waiter.cancel()
+        self.pending.clear()
+
+    async def _receive(self):
+        while True:
+            # the empty delimiter, the reply and for format arrow its Arrow frame
+            _, raw_msg, *frames = await self.sock.recv_multipart()
+            decoded_msg = json.loads(raw_msg)
+            if frames and isinstance(decoded_msg, dict):
+                decoded_msg["frame"] = frames[0]
+            waiter = self.pending.get(decoded_msg.get("id", None), None) if isinstance(decoded_msg, dict) else None
+            # late replies to requests that timed out have nobody waiting
+            if isinstance(waiter, asyncio.Queue):
+                waiter.put_nowait(decoded_msg)
+            elif waiter is not None and not waiter.done():
+                waiter.set_result(decoded_msg)
+
+    async def _send(self, request_id: int, command: str, msg, envelope: dict):
+        payload = {"command": command, "msg": msg, "id": request_id, **envelope}
+        await self.sock.send_multipart([json.dumps(payload).encode("utf-8")])
+
+    async def request(self, command: str, msg=None, timeout: float | None = None, retries: int | None = None, **envelope) -> dict:
+        """Send one request and return the whole response. envelope
+        takes the other request fields, eg. trace=True. Only read only
+        commands are retried unless retries is given."""
+        timeout = timeout if timeout is not None else self.timeout
+        if retries is None:
+            retries = self.retries if command in _IDEMPOTENT else 0
+        for attempt in range(retries + 1):
+            request_id = next(self._ids)
+            future = asyncio.get_running_loop().create_future()
+            self.pending[request_id] = future
+            try:
+                await self._send(request_id, command, msg, envelope)
+                return await asyncio.wait_for(future, timeout)
+            except asyncio.TimeoutError:
+                continue
+            finally:
+                self.pending.pop(request_id, None)
+        raise RequestTimeout(f"{command} got no reply within {timeout}s after {retries + 1} attempts")
+
+    async def stream(self, command: str, msg=None, chunk_size: int | None = None, timeout: float | None = None):
+        """Yield the entries of a streamed reply as the chunks arrive,
+        timeout applies to the gap between chunks. A reply that is not
+        a success raises RuntimeError with its msg."""
+        timeout = timeout if timeout is not None else self.timeout
+        request_id = next(self._ids)
+        queue = asyncio.Queue()
+        self.pending[request_id] = queue
+        envelope = {"stream": True}
+        if chunk_size is not None:
+            envelope["chunk_size"] = chunk_size
+        try:
+            await self._send(request_id, command, msg, envelope)
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    raise RequestTimeout(f"{command} stream stalled for {timeout}s")
+                chunk_msg = chunk.get("msg", chunk)
+                if chunk_msg.get("status", None) != "Success":
+                    raise RuntimeError(chunk_msg)
+                for x in chunk_msg["value"]:
+                    yield x
+                if chunk.get("end", True):
+                    return
+        finally:
+            self.pending.pop(request_id, None)
+
+    async def _msg(self, command: str, msg=None, **kwargs):
+        response = await self.request(command, msg, **kwargs)
+        # malformed and unknown requests are answered with the msg alone
+        return response.get("msg", response)
+
+    # one helper per command
+    # ----------------------
+    async def connect(self, ip: str, slot: int = 0, timeout: float = 5, micro800: bool = False, port: int | None = None):
+        msg = {"ip": ip, "slot": slot, "timeout": timeout, "micro800": micro800}
+        if port is not None:
+            msg["port"] = port
+        return await self._msg("connect", msg)
+
+    async def close_plc(self):
+        """The close command, ends the plc session. aclose closes this client."""
+        return await self._msg("close")
+
+    async def get_connection_size(self):
+        return await self._msg("get-connection-size")
+
+    async def set_connection_size(self, connection_size: int):
+        return await self._msg("set-connection-size", {"connection_size": connection_size})
+
+    async def read(self, tag: str | list[str], count: int | None = None, datatype: int | None = None):
+        """A list of tags is read in one request and answered with a list."""
+        return await self._msg("read", {"tag": tag, "count": count, "datatype": datatype})
+
+    async def write(self, tag: str, value, datatype: int | None = None):
+        return await self._msg("write", {"tag": tag, "value": value, "datatype": datatype})
+
+    async def write_list(self, pairs: list):
+        """pairs of [tag, value]."""
+        return await self._msg("write", [list(x) for x in pairs])
+
+    async def get_plc_time(self, raw: bool = False, live: bool | None = None):
+        msg = {"raw": raw}
+        if live is not None:
+            msg["live"] = live
+        return await self._msg("get-plc-time", msg)
+
+    async def set_plc_time(self):
+        return await self._msg("set-plc-time")
+
+    async def get_tag_list(self, all_tags: bool = True):
+        return await self._msg("get-tag-list", {"all_tags": all_tags})
+
+    async def get_program_tag_list(self, program_name: str):
+        return await self._msg("get-program-tag-list", {"program_name": program_name})
+
+    async def get_programs_list(self):
+        return await self._msg("get-programs-list")
+
+    async def discover(self, live: bool | None = None):
+        return await self._msg("discover", {"live": live} if live is not None else None)
+
+    async def get_module_properties(self, slot: int):
+        return await self._msg("get-module-properties", {"slot": slot})
+
+    async def get_device_properties(self):
+        return await self._msg("get-device-properties")
+
+    async def read_table(self, tag: str | list[str], count: int | None = None, datatype: int | None = None):
+        """The read results as a pyarrow Table of tag, timestamp, value
+        and status columns, RuntimeError with the msg when there is none."""
+        return await self._table("read", {"tag": tag, "count": count, "datatype": datatype})
+
+    async def history_table(self, tag: str | list[str] | None = None, start: float | None = None, end: float | None = None,
+                            limit: int | None = None, ip: str | None = None):
+        return await self._table("history", {"tag": tag, "start": start, "end": end, "limit": limit, "ip": ip})
+
+    async def _table(self, command: str, msg: dict):
+        response = await self.request(command, msg, format="arrow")
+        if "frame" not in response:
+            raise RuntimeError(response.get("msg", response))
+        return decode(response["frame"])
+
+    async def history(self, tag: str | list[str] | None = None, start: float | None = None, end: float | None = None,
+                      limit: int | None = None, ip: str | None = None):
+        return await self._msg("history", {"tag": tag, "start": start, "end": end, "limit": limit, "ip": ip})
+
+    async def stats(self):
+        return await self._msg("stats")
+
+    async def find_tags(self, **filters):
+        """filters are prefix, glob, datatype, array, struct, program, offset, limit and refresh."""
+        return await self._msg("find-tags", filters)
+
+    async def ready(self):
+        return await self._msg("ready")
+
+    async def set_scaling(self, tag: str | list[str], scaling: dict | None):
+        """scaling as in config.py, eg. {"linear": {"raw_min": 0, "raw_max": 27648,
+        "eu_min": 0, "eu_max": 100}}, None removes it."""
+        return await self._msg("set-scaling", {"tag": tag, "scaling": scaling})
+
+    async def scan_chassis(self, slots: int | None = None, concurrency: int | None = None, refresh: bool | None = None):
+        msg = {"slots": slots, "concurrency": concurrency}
+        if refresh is not None:
+            msg["refresh"] = refresh
+        return await self._msg("scan-chassis", msg)
@@ -0,0 +1,54 @@
+import json
+
+# pyarrow is optional, without it requests for format arrow are
+# answered as not enabled and everything else works as before
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# the Arrow frame travels next to the JSON reply, under a key no
+# decoded request can contain
+FRAME = ("frame",)
+
+COLUMNS = ["tag", "timestamp", "value", "status"]
+
+def available() -> bool:
+    return pyarrow is not None
+
+def _values(values: list):
+    """One typed column when the values share a type, ints and floats
+    become doubles, otherwise strings of the JSON encoded values."""
+    try:
+        return pyarrow.array(values), "native"
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+        return pyarrow.array([json.dumps(x) for x in values], pyarrow.string()), "json"
+
+def encode(tags: list[str], timestamps: list[float | None], values: list, statuses: list[str]):
+    """Arrow IPC stream of one record batch with tag, timestamp, value
+    and status columns, timestamps are seconds since the epoch. The
+    returned buffer can be sent as a frame as it is."""
+    value_column, encoding = _values(values)
+    table = pyarrow.Table.from_arrays(
+        [
+            pyarrow.array(tags, pyarrow.string()),
+            pyarrow.array([None if x is None else round(x * 1e6) for x in timestamps], pyarrow.timestamp("us", tz="UTC")),
+            value_column,
+            # a handful of distinct statuses over many rows
+            pyarrow.array(statuses, pyarrow.string()).dictionary_encode()
+        ],
+        names=COLUMNS,
+        metadata={"value_encoding": encoding}
+    )
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+def decode(frame):
+    """The table in a frame written by encode, eg. for pandas
+    decode(frame).to_pandas(). When the schema metadata has
+    value_encoding json the values are JSON strings."""
+    if pyarrow is None:
+        raise RuntimeError("decoding Arrow frames needs the pyarrow package, pip install pyarrow")
+    return pyarrow.ipc.open_stream(frame).read_all()
@@ -0,0 +1,154 @@
+import json
+
+from schema import compile_schema, SCALING_SCHEMA
+from scaling import Scaling
+
+# startup configuration
+# ----------------------
+# {
+#     "controllers": [
+#         {"ip": "192.168.1.196", "slot": 0, "timeout": 5, "micro800": false,
+#          "connection_size": 4002, "prewarm": ["tag_index", "clock", "chassis"],
+#          "rate_limit": {"requests": 200, "bytes": 200000},
+#          "scaling": {"AI_Flow": {"linear": {"raw_min": 0, "raw_max": 27648, "eu_min": 0, "eu_max": 250}}}}
+#     ],
+#     "scan_classes": {"fast": {"period": 0.1, "max_period": 1}, "slow": {"period": 5, "adaptive": false}},
+#     "tag_groups": [
+#         {"name": "line1", "controller": "192.168.1.196", "scan_class": "fast", "tags": ["BaseDINT", "BaseREAL"],
+#          "max_period": 0.5, "scaling": {"clamp": {"min": 0}}}
+#     ],
+#     "caches": {"chassis_ttl": 300}
+# }
+PREWARM_STEPS = ["tag_index", "clock", "chassis"]
+
+# bounds of the adaptive poll period, set on a scan class or a tag group
+_POLL_BOUNDS = {
+    "min_period": {"type": "number", "minimum": 0.001},
+    "max_period": {"type": "number", "minimum": 0.001},
+    "adaptive": {"type": "boolean"}
+}
+
+_CONTROLLER = {
+    "type": "object",
+    "properties": {
+        "ip": {"type": "string"},
+        "slot": {"type": "integer"},
+        "timeout": {"type": "number"},
+        "micro800": {"type": "boolean"},
+        "port": {"type": ["integer", "null"]},
+        "connection_size": {"type": ["integer", "null"], "minimum": 1},
+        "prewarm": {"type": "array", "items": {"type": "string"}},
+        # readiness waits only for the required controllers
+        "required": {"type": "boolean"},
+        "chassis_slots": {"type": "integer", "minimum": 1},
+        # replaces the --rate-limit-* defaults for this controller
+        "rate_limit": {
+            "type": "object",
+            "properties": {
+                "requests": {"type": ["number", "null"], "minimum": 0},
+                "bytes": {"type": ["number", "null"], "minimum": 0},
+                "burst": {"type": "number", "minimum": 0}
+            }
+        },
+        # engineering unit scaling by tag name, over that of a tag group
+        "scaling": {"type": "object"}
+    },
+    "required": ["ip"]
+}
+
+CONFIG_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "controllers": {"type": "array", "items": _CONTROLLER},
+        "scan_classes": {"type": "object"},
+        "tag_groups": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "controller": {"type": "string"},
+                    "scan_class": {"type": "string"},
+                    "tags": {"type": "array", "items": {"type": "string"}},
+                    "scaling": SCALING_SCHEMA,
+                    **_POLL_BOUNDS
+                },
+                "required": ["name", "controller", "scan_class", "tags"]
+            }
+        },
+        "caches": {
+            "type": "object",
+            "properties": {
+                "chassis_ttl": {"type": "number", "minimum": 0}
+            }
+        }
+    }
+}
+
+_SCAN_CLASS = compile_schema({
+    "type": "object",
+    "properties": {
+        "period": {"type": "number", "minimum": 0.001},
+        **_POLL_BOUNDS
+    },
+    "required": ["period"]
+})
+
+_check = compile_schema(CONFIG_SCHEMA)
+_SCALING = compile_schema(SCALING_SCHEMA)
+
+def controller_defaults(controller: dict) -> dict:
+    """The connect msg fields of a configured controller, with the CONNECT defaults filled in."""
+    return {
+        "ip": controller["ip"],
+        "slot": controller.get("slot", 0),
+        "timeout": controller.get("timeout", 5),
+        "micro800": controller.get("micro800", False),
+        "port": controller.get("port", None)
+    }
+
+def poll_bounds(scan_class: dict, group: dict) -> dict:
+    """min_period, max_period and adaptive of a tag group, its own settings over its scan class."""
+    return {x: group.get(x, scan_class.get(x, None)) for x in _POLL_BOUNDS if x in group or x in scan_class}
+
+def _scaling(spec, path: str, errors: list):
+    if _SCALING(spec, path, errors):
+        try:
+            Scaling.from_dict(spec)
+        except ValueError as e:
+            errors.append({"field": path, "error": str(e)})
+
+def load_config(path: str | None = None) -> dict | None:
+    """Read and check the startup config, raises ValueError listing
+    every problem so a bad file stops the service at startup."""
+    if not path:
+        return None
+    with open(path) as f:
+        config = json.load(f)
+    errors = []
+    if _check(config, "", errors):
+        for name, scan_class in config.get("scan_classes", {}).items():
+            _SCAN_CLASS(scan_class, f"scan_classes.{name}", errors)
+        ips = [x["ip"] for x in config.get("controllers", [])]
+        for idx, controller in enumerate(config.get("controllers", [])):
+            for step in controller.get("prewarm", []):
+                if step not in PREWARM_STEPS:
+                    errors.append({"field": f"controllers[{idx}].prewarm", "error": f"unknown step {step}, choose from {', '.join(PREWARM_STEPS)}"})
+            for tag, spec in controller.get("scaling", {}).items():
+                _scaling(spec, f"controllers[{idx}].scaling.{tag}", errors)
+        for idx, group in enumerate(config.get("tag_groups", [])):
+            if group["controller"] not in ips:
+                errors.append({"field": f"tag_groups[{idx}].controller", "error": f"{group['controller']} is not in controllers"})
+            if "scaling" in group:
+                _scaling(group["scaling"], f"tag_groups[{idx}].scaling", errors)
+            if group["scan_class"] not in config.get("scan_classes", {}):
+                errors.append({"field": f"tag_groups[{idx}].scan_class", "error": f"{group['scan_class']} is not in scan_classes"})
+                continue
+            bounds = poll_bounds(config["scan_classes"][group["scan_class"]], group)
+            period = config["scan_classes"][group["scan_class"]].get("period", None)
+            limits = [bounds.get("min_period", period), period, bounds.get("max_period", period)]
+            if all(isinstance(x, (int, float)) for x in limits) and limits != sorted(limits):
+                errors.append({"field": f"tag_groups[{idx}]", "error": f"period {period} is not within min_period and max_period"})
+    if errors:
+        raise ValueError(f"invalid config {path}: " + ", ".join(f"{x['field']} {x['error']}" for x in errors))
+    return config
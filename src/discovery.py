@@ -0,0 +1,95 @@
+import time
+import asyncio
+
+from logger import log_exception
+
+class DeviceInventory:
+    """Devices answering discovery broadcasts, keyed by IP address
+    with a second index by serial number."""
+
+    def __init__(self) -> None:
+        self.devices: dict[str, dict] = {}
+        self.by_serial: dict[str, str] = {}
+
+    def get(self, ip: str) -> dict | None:
+        return self.devices.get(ip, None)
+
+    def find_serial(self, serial_number) -> dict | None:
+        ip = self.by_serial.get(str(serial_number), None)
+        return self.devices.get(ip, None) if ip else None
+
+    def snapshot(self) -> list[dict]:
+        return [self.devices[x] for x in sorted(self.devices)]
+
+    def update(self, devices: list[dict], now: float, expire_after: float) -> list[dict]:
+        """Fold one sweep in, returns the added, changed and removed events."""
+        events = []
+        seen = set()
+        for device in devices:
+            ip = device["IPAddress"]
+            seen.add(ip)
+            current = self.devices.get(ip, None)
+            entry = {**device, "FirstSeen": current["FirstSeen"] if current else now, "LastSeen": now}
+            if current is None:
+                events.append({"event": "added", "device": entry})
+            elif any(current.get(k, None) != v for k, v in device.items()):
+                self.by_serial.pop(str(current["SerialNumber"]), None)
+                events.append({"event": "changed", "device": entry})
+            self.devices[ip] = entry
+            self.by_serial[str(device["SerialNumber"])] = ip
+        for ip in list(self.devices):
+            if ip not in seen and now - self.devices[ip]["LastSeen"] >= expire_after:
+                entry = self.devices.pop(ip)
+                if self.by_serial.get(str(entry["SerialNumber"]), None) == ip:
+                    del self.by_serial[str(entry["SerialNumber"])]
+                events.append({"event": "removed", "device": entry})
+        return events
+
+class Discovery:
+    """Runs discovery broadcasts, in the background every interval
+    seconds when one is given, and keeps the inventory current.
+    Concurrent refreshes share the broadcast already in flight."""
+
+    def __init__(self, sweep, interval: float | None = None, expire_after: float | None = None, publish=None) -> None:
+        # sweep is a coroutine function returning (list of device dicts, status)
+        self.sweep = sweep
+        self.interval = interval
+        # a device missing from a few sweeps in a row is gone, without a
+        # background interval it is gone as soon as a sweep misses it
+        self.expire_after = expire_after if expire_after is not None else 3 * (interval or 0)
+        self.publish = publish
+        self.inventory = DeviceInventory()
+        self.swept: float | None = None
+        self._pending: asyncio.Future | None = None
+
+    async def refresh(self) -> tuple[list[dict], str]:
+        if self._pending is None:
+            self._pending = asyncio.ensure_future(self._refresh())
+        # one caller going away must not cancel the broadcast for the others
+        return await asyncio.shield(self._pending)
+
+    async def _refresh(self) -> tuple[list[dict], str]:
+        try:
+            devices, status = await self.sweep()
+            if status == "Success":
+                now = time.time()
+                events = self.inventory.update(devices, now, self.expire_after)
+                self.swept = now
+                if self.publish:
+                    for event in events:
+                        await self.publish(event)
+            return [self.inventory.get(x["IPAddress"]) or x for x in devices], status
+        finally:
+            self._pending = None
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                await log_exception(
+                    message="background discovery failed",
+                    payload=None,
+                    exception=e
+                )
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,116 @@
+import json
+import asyncio
+import threading
+
+import zmq
+import zmq.asyncio
+
+from service import Service
+
+class EmbeddedService:
+    """Hosts a Service inside this process on an inproc:// endpoint, so
+    a Python application reaches it without going through the TCP stack.
+    The service runs its own event loop on a background thread, the
+    application talks to it over sockets made from the same context.
+
+        with EmbeddedService(simulate=True) as embedded:
+            embedded.request("connect", {"ip": "192.168.1.196", "slot": 0, "timeout": 5, "micro800": False})
+            embedded.request("read", {"tag": "BaseDINT", "count": 1, "datatype": None})
+
+    Any other keyword is passed on to Service, extra endpoints can be
+    bound next to the inproc one with binds=[...]."""
+
+    def __init__(self, name: str = "pylogix-as-service", context: zmq.Context | None = None,
+                 binds: list[str] | None = None, **options) -> None:
+        self.url = f"inproc://{name}"
+        # inproc endpoints only exist within one zeromq context
+        self.context = context or zmq.Context.instance()
+        self.binds = binds or []
+        self.options = options
+        self.service: Service | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._ready = threading.Event()
+        self._error: BaseException | None = None
+        self._sock: zmq.Socket | None = None
+        self._sock_lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self, timeout: float = 10):
+        """Start the service thread, returns once the endpoint is bound."""
+        self._ready.clear()
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="pylogix-as-service-embedded", daemon=True)
+        self._thread.start()
+        if not self._ready.wait(timeout):
+            raise TimeoutError("embedded service did not start")
+        if self._error is not None:
+            raise self._error
+
+    def stop(self, timeout: float = 10):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        if self._loop is not None and self._task is not None:
+            self._loop.call_soon_threadsafe(self._task.cancel)
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        try:
+            asyncio.run(self._serve())
+        except asyncio.CancelledError:
+            pass
+
+    async def _serve(self):
+        try:
+            self._loop = asyncio.get_running_loop()
+            self._task = asyncio.current_task()
+            ctx = zmq.asyncio.Context.shadow(self.context.underlying)
+            self.service = Service([self.url] + self.binds, ctx=ctx, **self.options)
+        except BaseException as e:
+            self._error = e
+            raise
+        finally:
+            self._ready.set()
+        try:
+            await self.service.start()
+        finally:
+            self.service.close()
+
+    def socket(self, socket_type: int = zmq.DEALER) -> zmq.Socket:
+        """A new blocking socket connected to the service."""
+        sock = self.context.socket(socket_type)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.connect(self.url)
+        return sock
+
+    def async_socket(self, socket_type: int = zmq.DEALER) -> zmq.asyncio.Socket:
+        """A new asyncio socket connected to the service, for use on the application's own loop."""
+        sock = zmq.asyncio.Context.shadow(self.context.underlying).socket(socket_type)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.connect(self.url)
+        return sock
+
+    def request(self, command: str, msg=None, **envelope) -> dict:
+        """Send one request and wait for its response, thread safe.
+        envelope takes the other request fields, eg. trace=True."""
+        encoded = json.dumps({"command": command, "msg": msg, **envelope}).encode("utf-8")
+        with self._sock_lock:
+            if self._sock is None:
+                self._sock = self.socket()
+            self._sock.send_multipart([encoded])
+            _, raw_msg, *frames = self._sock.recv_multipart()
+        decoded_msg = json.loads(raw_msg)
+        # format arrow replies carry an Arrow frame, see columnar.decode
+        if frames and isinstance(decoded_msg, dict):
+            decoded_msg["frame"] = frames[0]
+        return decoded_msg
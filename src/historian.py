@@ -0,0 +1,290 @@
+import os
+import re
+import json
+import mmap
+import time
+import struct
+import threading
+from bisect import bisect_right
+
+# segment layout
+# ----------------------
+# [ header | records growing forward ->   free   <- index entries growing backward ]
+#
+# header:  magic, version, created, lowest ts, highest ts, write offset,
+#          record count, index count
+# timestamps may step backwards inside a segment, samples carry the
+# controller clock once it is known and that is resynced now and then
+# record:  timestamp, name length, value length, name, value (json)
+# index:   timestamp, record offset (one entry every `index_every` records)
+_MAGIC = b"PLXH"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHxxdddQQQ")
+_HEADER_SIZE = 64
+_RECORD = struct.Struct("<dHI")
+_INDEX = struct.Struct("<dQ")
+_SUFFIX = ".seg"
+
+class _Segment:
+    """A single fixed size memory mapped segment file."""
+
+    def __init__(self, path: str, size: int | None = None) -> None:
+        self.path = path
+        if size is not None:
+            with open(path, "wb") as f:
+                f.truncate(size)
+            self._file = open(path, "r+b")
+            self.mm = mmap.mmap(self._file.fileno(), size)
+            now = time.time()
+            self.created = now
+            self.first_ts = 0.0
+            self.last_ts = 0.0
+            self.write_offset = _HEADER_SIZE
+            self.record_count = 0
+            self.index_count = 0
+            self._flush_header()
+        else:
+            self._file = open(path, "rb")
+            self.mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._load_header()
+        self.size = len(self.mm)
+
+    def _load_header(self):
+        (magic,
+         version,
+         self.created,
+         self.first_ts,
+         self.last_ts,
+         self.write_offset,
+         self.record_count,
+         self.index_count) = _HEADER.unpack_from(self.mm, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"not a historian segment: {self.path}")
+
+    def _flush_header(self):
+        _HEADER.pack_into(
+            self.mm,
+            0,
+            _MAGIC,
+            _VERSION,
+            self.created,
+            self.first_ts,
+            self.last_ts,
+            self.write_offset,
+            self.record_count,
+            self.index_count
+        )
+
+    def free(self) -> int:
+        index_start = self.size - (self.index_count + 1) * _INDEX.size
+        return index_start - self.write_offset
+
+    def append(self, timestamp: float, name: bytes, value: bytes, index: bool) -> bool:
+        needed = _RECORD.size + len(name) + len(value)
+        if needed > self.free():
+            return False
+        offset = self.write_offset
+        _RECORD.pack_into(self.mm, offset, timestamp, len(name), len(value))
+        start = offset + _RECORD.size
+        self.mm[start:start + len(name)] = name
+        start += len(name)
+        self.mm[start:start + len(value)] = value
+        if index:
+            # index keys stay sorted even if the clock steps backwards
+            key = max(timestamp, self.last_ts)
+            self.index_count += 1
+            _INDEX.pack_into(self.mm, self.size - self.index_count * _INDEX.size, key, offset)
+        self.first_ts = timestamp if self.record_count == 0 else min(timestamp, self.first_ts)
+        self.last_ts = max(timestamp, self.last_ts)
+        self.write_offset = start + len(value)
+        self.record_count += 1
+        # header last, readers never see a partially written record
+        self._flush_header()
+        return True
+
+    def scan(self, start: float | None, end: float | None, names: set | None):
+        """Yield (timestamp, name, value bytes) for every matching record,
+        seeking with the index instead of walking the whole segment."""
+        self._load_header()
+        offset = _HEADER_SIZE
+        if start is not None and self.index_count:
+            keys = [
+                _INDEX.unpack_from(self.mm, self.size - (i + 1) * _INDEX.size)
+                for i in range(self.index_count)
+            ]
+            # keys are the running maximum, every record before the
+            # entry found is older than start
+            pos = bisect_right(keys, (start, -1)) - 1
+            if pos >= 0:
+                offset = keys[pos][1]
+        write_offset = self.write_offset
+        while offset < write_offset:
+            timestamp, name_len, value_len = _RECORD.unpack_from(self.mm, offset)
+            name_start = offset + _RECORD.size
+            value_start = name_start + name_len
+            offset = value_start + value_len
+            # a later record can still be older, no stopping early
+            if end is not None and timestamp > end:
+                continue
+            if start is not None and timestamp < start:
+                continue
+            name = self.mm[name_start:value_start]
+            if names is not None and name not in names:
+                continue
+            yield timestamp, name, self.mm[value_start:offset]
+
+    def close(self):
+        try:
+            self.mm.close()
+        finally:
+            self._file.close()
+
+class Historian:
+    """Append only on disk sample storage, one directory of memory
+    mapped segments per controller."""
+
+    def __init__(self,
+                 directory: str,
+                 segment_size: int = 16 * 1024 * 1024,
+                 roll_seconds: float = 3600,
+                 retention_segments: int | None = 48,
+                 retention_seconds: float | None = None,
+                 index_every: int = 32) -> None:
+        self.directory = directory
+        self.segment_size = segment_size
+        self.roll_seconds = roll_seconds
+        self.retention_segments = retention_segments
+        self.retention_seconds = retention_seconds
+        self.index_every = index_every
+        self._writers: dict[str, _Segment] = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _controller_dir(self, controller: str) -> str:
+        return os.path.join(self.directory, re.sub(r"[^A-Za-z0-9_.-]", "_", controller))
+
+    def _segment_paths(self, controller: str) -> list[str]:
+        path = self._controller_dir(controller)
+        if not os.path.isdir(path):
+            return []
+        return sorted(
+            os.path.join(path, x) for x in os.listdir(path) if x.endswith(_SUFFIX)
+        )
+
+    def _created(self, path: str) -> float:
+        """Wall time a segment was created at, from its name."""
+        return int(os.path.basename(path)[:-len(_SUFFIX)]) / 1000000
+
+    def _roll(self, controller: str) -> _Segment:
+        current = self._writers.pop(controller, None)
+        if current:
+            current.mm.flush()
+            current.close()
+        path = self._controller_dir(controller)
+        os.makedirs(path, exist_ok=True)
+        name = f"{time.time_ns() // 1000:020d}{_SUFFIX}"
+        segment = _Segment(os.path.join(path, name), self.segment_size)
+        self._writers[controller] = segment
+        self._enforce_retention(controller)
+        return segment
+
+    def _enforce_retention(self, controller: str):
+        paths = self._segment_paths(controller)
+        active = self._writers.get(controller)
+        expired = []
+        if self.retention_segments is not None and len(paths) > self.retention_segments:
+            expired.extend(paths[:len(paths) - self.retention_segments])
+        if self.retention_seconds is not None:
+            # wall time, samples may carry the controller clock, a
+            # segment was last written when the next one was created
+            cutoff = time.time() - self.retention_seconds
+            for path, following in zip(paths, paths[1:]):
+                if path in expired or (active and path == active.path):
+                    continue
+                if self._created(following) < cutoff:
+                    expired.append(path)
+        for path in expired:
+            if active and path == active.path:
+                continue
+            os.remove(path)
+
+    def append(self,
+               controller: str,
+               samples: list[tuple],
+               timestamp: float | None = None):
+        """Store (name, value, status) samples for a controller. timestamp
+        is stored with the samples, segments roll by wall time."""
+        now = time.time()
+        if timestamp is None:
+            timestamp = now
+        with self._lock:
+            segment = self._writers.get(controller)
+            if segment is None or now - segment.created > self.roll_seconds:
+                segment = self._roll(controller)
+            for name, value, status in samples:
+                encoded_name = str(name).encode("utf-8")
+                encoded_value = json.dumps([value, status], default=str).encode("utf-8")
+                index = segment.record_count % self.index_every == 0
+                if not segment.append(timestamp, encoded_name, encoded_value, index):
+                    segment = self._roll(controller)
+                    if not segment.append(timestamp, encoded_name, encoded_value, True):
+                        raise ValueError("sample larger than the historian segment size")
+
+    def query(self,
+              controller: str,
+              tags: list[str] | None = None,
+              start: float | None = None,
+              end: float | None = None,
+              limit: int | None = None,
+              columns: bool = False) -> list[dict] | dict[str, list]:
+        """Read samples back in append order, only segments overlapping
+        the requested window are mapped and searched. With columns the
+        samples come as one list per field instead of a dict each."""
+        names = set(x.encode("utf-8") for x in tags) if tags is not None else None
+        results = []
+        if columns:
+            container = {"name":[], "value":[], "status":[], "timestamp":[]}
+        with self._lock:
+            active = self._writers.get(controller)
+            active_path = active.path if active else None
+            paths = self._segment_paths(controller)
+        for path in paths:
+            try:
+                segment = _Segment(path)
+            except (ValueError, OSError):
+                continue
+            try:
+                if segment.record_count == 0:
+                    continue
+                if end is not None and segment.first_ts > end:
+                    continue
+                if start is not None and segment.last_ts < start and path != active_path:
+                    continue
+                for timestamp, name, value in segment.scan(start, end, names):
+                    decoded_value, status = json.loads(value)
+                    if columns:
+                        container["name"].append(name.decode("utf-8"))
+                        container["value"].append(decoded_value)
+                        container["status"].append(status)
+                        container["timestamp"].append(timestamp)
+                        if limit is not None and len(container["name"]) >= limit:
+                            return container
+                        continue
+                    results.append({
+                        "name":name.decode("utf-8"),
+                        "value":decoded_value,
+                        "status":status,
+                        "timestamp":timestamp
+                    })
+                    if limit is not None and len(results) >= limit:
+                        return results
+            finally:
+                segment.close()
+        return container if columns else results
+
+    def close(self):
+        with self._lock:
+            for segment in self._writers.values():
+                segment.mm.flush()
+                segment.close()
+            self._writers = {}
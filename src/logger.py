@@ -1,30 +1,171 @@
 import os
 import sys
+import json
+import time
+import queue
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import threading
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from logging import StreamHandler
 
 if not os.path.exists("./logs"):
     os.mkdir("./logs/")
 
-logging.basicConfig(
-        handlers=[
-            RotatingFileHandler('./logs/service.log',maxBytes=10240000,backupCount=5),
-            StreamHandler(sys.stdout)
-        ],
-        level=logging.INFO,
-        format='%(asctime)s %(levelname)s PID_%(process)d %(message)s'
-)
+# records are only queued by the caller, a listener thread formats
+# and writes them, so a slow disk or console never blocks the loop
+# ----------------------
+_TEXT_FORMAT = '%(asctime)s %(levelname)s PID_%(process)d %(message)s'
+
+class TextFormatter(logging.Formatter):
+    """The plain log lines, with the payload and the count of repeats
+    left out since the previous record like this one."""
+
+    def formatMessage(self, record):
+        text = super().formatMessage(record)
+        if getattr(record, "repeated", None):
+            text += f" ({record.repeated} more like it left out)"
+        if getattr(record, "payload", None):
+            text += f"\nPayload: {record.payload}"
+        return text
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object a line, for log shippers."""
+
+    def format(self, record):
+        entry = {
+            "time":record.created,
+            "level":record.levelname,
+            "pid":record.process,
+            "message":record.getMessage()
+        }
+        for key in ["payload", "repeated"]:
+            if getattr(record, key, None):
+                entry[key] = getattr(record, key)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+class Throttle(logging.Filter):
+    """Lets the first of a run of identical records through and only
+    counts the repeats for window seconds, the next one let through
+    carries that count. Past rate records a second, with a burst of
+    as many, the rest are dropped and counted."""
+
+    def __init__(self, window: float = 10.0, rate: float = 50.0) -> None:
+        super().__init__()
+        self.window = window
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.seen: dict[tuple, list] = {}
+        self.suppressed = 0
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def allow(self, key: tuple) -> int | None:
+        """None when the record is to be left out, otherwise the
+        number of repeats left out since the last one let through."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self.seen.get(key, None)
+            if entry is not None and now - entry[0] < self.window:
+                entry[1] += 1
+                self.suppressed += 1
+                return None
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.rate and self.tokens < 1:
+                self.dropped += 1
+                return None
+            self.tokens -= 1
+            if len(self.seen) >= 1024:
+                self.seen = {k: v for k, v in self.seen.items() if now - v[0] < self.window}
+            self.seen[key] = [now, 0]
+            return entry[1] if entry is not None else 0
+
+    def filter(self, record):
+        # log_exception has checked its records already
+        if getattr(record, "throttled", False):
+            return True
+        repeated = self.allow((record.levelno, record.msg, record.exc_info[0] if record.exc_info else None))
+        if repeated is None:
+            return False
+        record.repeated = repeated
+        return True
+
+class Handoff(QueueHandler):
+    """Queues records as they are, formatting exceptions and stacks is
+    left to the listener thread. A full queue drops the record."""
+
+    def __init__(self, queue, throttle: Throttle) -> None:
+        super().__init__(queue)
+        self.throttle = throttle
+
+    def prepare(self, record):
+        # the arguments may change once the caller moves on
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.throttle.dropped += 1
+
+_handlers = [
+    RotatingFileHandler('./logs/service.log',maxBytes=10240000,backupCount=5),
+    StreamHandler(sys.stdout)
+]
+for _handler in _handlers:
+    _handler.setFormatter(TextFormatter(_TEXT_FORMAT))
+_throttle = Throttle()
+_handoff = Handoff(queue.Queue(maxsize=10000), _throttle)
+_handoff.addFilter(_throttle)
+logging.getLogger().addHandler(_handoff)
+logging.getLogger().setLevel(logging.INFO)
+_listener = QueueListener(_handoff.queue, *_handlers, respect_handler_level=True)
+_listener.start()
+# written out before the process exits
+atexit.register(_listener.stop)
+
+def configure(log_format: str = "text", dedup_window: float = 10.0, rate: float = 50.0):
+    """Output format, text or json, and how repeated and frequent records are held back, a rate of 0 is unlimited."""
+    formatter = JsonFormatter() if log_format == "json" else TextFormatter(_TEXT_FORMAT)
+    for handler in _handlers:
+        handler.setFormatter(formatter)
+    _throttle.window = dedup_window
+    _throttle.rate = rate
+    _throttle.tokens = rate
+
+def log_stats() -> dict:
+    return {
+        "queued":_handoff.queue.qsize(),
+        "suppressed":_throttle.suppressed,
+        "dropped":_throttle.dropped
+    }
 
 async def log_exception(
         message: str,
         payload: str | None = None,
         exception: Exception | None = None):
-    logging.error("start " + '-' * 74)
-    logging.error(message)
-    if payload:
-        logging.error(f"Payload: {payload}")
-    logging.error("Stack Info:", stack_info=True)
-    if exception:
-        logging.error(f"Exception Info: {exception}", exc_info=True)
-    logging.error("end " + '-' * 76)
+    """Queue one error record. Repeats are checked first, so during an
+    error storm a left out record costs only that lookup. The stack of
+    the caller is captured only when there is no exception to show."""
+    key = (message, type(exception).__name__, str(exception)) if exception else (message,)
+    repeated = _throttle.allow(key)
+    if repeated is None:
+        return
+    logging.error(
+        message,
+        exc_info=exception,
+        stack_info=exception is None,
+        extra={
+            "payload":str(payload) if payload else None,
+            "repeated":repeated,
+            "throttled":True
+        }
+    )
@@ -6,42 +6,524 @@ import argparse
 
 import logger
 from service import Service
+from mock import load_mock_config
+from historian import Historian
+from shmtable import LatestTable
+from sharding import Frontend, HashRing
+from config import load_config
+from ratelimit import RateLimiter
+from watchdog import Watchdog
+from capture import Capture
+from metrics import start_metrics_server
+from transport import socket_options
+
+def owned(config, args, worker):
+    """The part of the config a worker process is responsible for, the
+    controllers the front end routes to it and their tag groups."""
+    if not config or args.workers <= 1:
+        return config
+    ring = HashRing(list(range(args.workers)))
+    controllers = [x for x in config.get("controllers", []) if ring.get(str(x["ip"])) == worker]
+    ips = {x["ip"] for x in controllers}
+    return {
+        **config,
+        "controllers":controllers,
+        "tag_groups":[x for x in config.get("tag_groups", []) if x["controller"] in ips]
+    }
+
+async def serve(url, args, worker=0):
+    historian = None
+    if args.history_dir:
+        historian = Historian(
+            args.history_dir,
+            segment_size=args.history_segment_size,
+            roll_seconds=args.history_roll_seconds,
+            retention_segments=args.history_retention_segments,
+            retention_seconds=args.history_retention_seconds
+        )
+    latest = None
+    if args.latest_path:
+        latest = LatestTable(
+            # every worker process writes a table of its own
+            args.latest_path if args.workers <= 1 else f"{args.latest_path}.{worker}",
+            slots=args.latest_slots,
+            value_size=args.latest_value_size
+        )
+    capture = None
+    if args.capture:
+        capture = Capture(
+            args.capture if args.workers <= 1 else f"{args.capture}.{worker}",
+            responses=args.capture_responses,
+            max_bytes=args.capture_max_bytes
+        )
+    config = owned(load_config(args.config), args, worker)
+    service = Service(
+        url,
+        simulate=bool(args.simulate),
+        historian=historian,
+        thread_pool_size=args.thread_pool_size,
+        mock_config=load_mock_config(args.mock_config),
+        stream_chunk_size=args.stream_chunk_size,
+        # discovery belongs to no controller, worker 0 runs the only sweep
+        # and PUB socket and the front end sends every discover there
+        discover_interval=args.discover_interval if worker == 0 else None,
+        discover_events=args.discover_events if worker == 0 else None,
+        chassis_cache_ttl=args.chassis_cache_ttl,
+        clock_sample_interval=args.clock_sample_interval,
+        recv_batch=args.recv_batch,
+        socket_options=tuning(args),
+        latest=latest,
+        config=config,
+        rate_limiter=RateLimiter(
+            requests=args.rate_limit_requests,
+            nbytes=args.rate_limit_bytes,
+            burst=args.rate_limit_burst,
+            max_queue=args.rate_limit_queue,
+            max_delay=args.rate_limit_delay,
+            overrides={x["ip"]: x["rate_limit"] for x in (config or {}).get("controllers", []) if "rate_limit" in x}
+        ),
+        watchdog=Watchdog(
+            threshold=args.watchdog_threshold,
+            interval=args.watchdog_interval,
+            stacks=args.watchdog_stacks
+        ),
+        capture=capture
+    )
+    if args.metrics_port:
+        # every worker process exposes its own metrics on the next port up
+        await start_metrics_server(args.server_address, args.metrics_port + worker, service.metrics.render, service.is_ready)
+    try:
+        await service.start()
+    finally:
+        service.close()
+
+def use_event_loop(name):
+    """uvloop is optional, the default asyncio loop needs nothing extra."""
+    if name == "uvloop":
+        try:
+            import uvloop
+        except ImportError:
+            raise SystemExit("--event-loop uvloop needs the uvloop package, pip install uvloop")
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+def run_worker(url, args, worker):
+    """Entry point of every worker process in sharded mode,
+    CTRL-C is left to the front end process."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logger.configure(args.log_format, args.log_dedup_window, args.log_rate)
+    use_event_loop(args.event_loop)
+    asyncio.run(serve(url, args, worker))
+
+def tuning(args) -> dict[int, int]:
+    return socket_options(
+        sndhwm=args.sndhwm,
+        rcvhwm=args.rcvhwm,
+        sndbuf=args.sndbuf,
+        rcvbuf=args.rcvbuf,
+        tcp_keepalive=args.tcp_keepalive,
+        tcp_keepalive_idle=args.tcp_keepalive_idle,
+        tcp_keepalive_intvl=args.tcp_keepalive_intvl,
+        tcp_keepalive_cnt=args.tcp_keepalive_cnt
+    )
+
+def endpoints(args) -> list[str]:
+    urls = list(args.bind or [])
+    if args.server_port:
+        urls.insert(0, f"tcp://{args.server_address}:{args.server_port}")
+    return urls
 
 async def main(args):
-    url = f"tcp://{args.server_address}:{args.server_port}"
-    service = Service(url, simulate=bool(args.simulate))
-    await service.start()
+    url = endpoints(args)
+    # a bad config stops the service here rather than in every worker
+    load_config(args.config)
+    if args.workers > 1:
+        frontend = Frontend(url, args.workers, run_worker, args, socket_options=tuning(args))
+        try:
+            await frontend.start()
+        finally:
+            frontend.close()
+    else:
+        await serve(url, args)
 
 def handler(signum, frame):
     response = input(" CTRL-C was pressed. Do you really want to exit? y/n ")
     if response == "y":
         logging.error("CTRL-C was pressed")
         sys.exit(-1)
-signal.signal(signal.SIGINT, handler)
-
-parser = argparse.ArgumentParser(
-    prog="pylogix-as-service",
-    description="Wraps pylogix with zeromq to allow multi-language inter process communication."
-)
-parser.add_argument(
-    '--server-address',
-    dest="server_address",
-    required=True,
-    help="The address for this service to bind to, eg. 127.0.0.1."
-)
-parser.add_argument(
-    '--server-port',
-    dest="server_port",
-    required=True,
-    help="The port for this service to list on, eg. 7777."
-)
-parser.add_argument(
-    '--simulate',
-    dest="simulate",
-    default=False,
-    required=False,
-    help="Simulate connection to the PLC, useful for testing."
-)
-args = parser.parse_args()
-
-asyncio.run(main(args=args))
+
+def terminate(signum, frame):
+    sys.exit(0)
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGINT, handler)
+    signal.signal(signal.SIGTERM, terminate)
+
+    parser = argparse.ArgumentParser(
+        prog="pylogix-as-service",
+        description="Wraps pylogix with zeromq to allow multi-language inter process communication."
+    )
+    parser.add_argument(
+        '--server-address',
+        dest="server_address",
+        required=True,
+        help="The address for this service to bind to, eg. 127.0.0.1."
+    )
+    parser.add_argument(
+        '--server-port',
+        dest="server_port",
+        default=None,
+        required=False,
+        help="The port for this service to list on, eg. 7777. Optional when --bind is given."
+    )
+    parser.add_argument(
+        '--bind',
+        dest="bind",
+        action="append",
+        default=None,
+        required=False,
+        help="Also bind to this endpoint, can be repeated, eg. ipc:///tmp/pylogix.ipc for clients on the same host."
+    )
+    parser.add_argument(
+        '--simulate',
+        dest="simulate",
+        default=False,
+        required=False,
+        help="Simulate connection to the PLC, useful for testing."
+    )
+    parser.add_argument(
+        '--history-dir',
+        dest="history_dir",
+        default=None,
+        required=False,
+        help="Record read results into memory mapped segments in this directory, eg. ./history."
+    )
+    parser.add_argument(
+        '--history-segment-size',
+        dest="history_segment_size",
+        type=int,
+        default=16 * 1024 * 1024,
+        required=False,
+        help="Size in bytes of each historian segment file."
+    )
+    parser.add_argument(
+        '--history-roll-seconds',
+        dest="history_roll_seconds",
+        type=float,
+        default=3600,
+        required=False,
+        help="Start a new historian segment after this many seconds."
+    )
+    parser.add_argument(
+        '--history-retention-segments',
+        dest="history_retention_segments",
+        type=int,
+        default=48,
+        required=False,
+        help="Keep at most this many historian segments per controller."
+    )
+    parser.add_argument(
+        '--history-retention-seconds',
+        dest="history_retention_seconds",
+        type=float,
+        default=None,
+        required=False,
+        help="Delete historian segments older than this many seconds."
+    )
+    parser.add_argument(
+        '--config',
+        dest="config",
+        default=None,
+        required=False,
+        help="JSON startup config of controllers, scan classes, tag groups and caches to prewarm, see README."
+    )
+    parser.add_argument(
+        '--rate-limit-requests',
+        dest="rate_limit_requests",
+        type=float,
+        default=None,
+        required=False,
+        help="CIP requests per second each controller may be sent, unlimited by default."
+    )
+    parser.add_argument(
+        '--rate-limit-bytes',
+        dest="rate_limit_bytes",
+        type=float,
+        default=None,
+        required=False,
+        help="Estimated CIP bytes per second each controller may be sent, unlimited by default."
+    )
+    parser.add_argument(
+        '--rate-limit-burst',
+        dest="rate_limit_burst",
+        type=float,
+        default=1.0,
+        required=False,
+        help="Seconds worth of the rate limits that may be used at once after an idle period."
+    )
+    parser.add_argument(
+        '--rate-limit-queue',
+        dest="rate_limit_queue",
+        type=int,
+        default=64,
+        required=False,
+        help="Requests that may wait for a controller budget before more are answered busy."
+    )
+    parser.add_argument(
+        '--rate-limit-delay',
+        dest="rate_limit_delay",
+        type=float,
+        default=1.0,
+        required=False,
+        help="Longest a request waits for its controller budget before it is answered busy."
+    )
+    parser.add_argument(
+        '--watchdog-threshold',
+        dest="watchdog_threshold",
+        type=float,
+        default=None,
+        required=False,
+        help="Report event loop stalls longer than this many seconds and what was running, eg. 0.25. Off by default."
+    )
+    parser.add_argument(
+        '--watchdog-interval',
+        dest="watchdog_interval",
+        type=float,
+        default=0.1,
+        required=False,
+        help="Seconds between the event loop heartbeats the watchdog measures lag with."
+    )
+    parser.add_argument(
+        '--watchdog-stacks',
+        dest="watchdog_stacks",
+        type=int,
+        default=0,
+        required=False,
+        help="Keep the stack of the event loop thread for this many of the latest stalls, sampled at most once a second for each culprit."
+    )
+    parser.add_argument(
+        '--capture',
+        dest="capture",
+        default=None,
+        required=False,
+        help="Append every request answered, with its client and timing, to this file for replay.py, eg. shift.jsonl."
+    )
+    parser.add_argument(
+        '--capture-responses',
+        dest="capture_responses",
+        action="store_true",
+        default=False,
+        required=False,
+        help="Also write the reply of every captured request."
+    )
+    parser.add_argument(
+        '--capture-max-bytes',
+        dest="capture_max_bytes",
+        type=int,
+        default=None,
+        required=False,
+        help="Stop capturing once the file has grown by this many bytes."
+    )
+    parser.add_argument(
+        '--log-format',
+        dest="log_format",
+        choices=["text", "json"],
+        default="text",
+        required=False,
+        help="Write log records as text lines or as one JSON object a line."
+    )
+    parser.add_argument(
+        '--log-dedup-window',
+        dest="log_dedup_window",
+        type=float,
+        default=10.0,
+        required=False,
+        help="Seconds during which repeats of a logged error are only counted."
+    )
+    parser.add_argument(
+        '--log-rate',
+        dest="log_rate",
+        type=float,
+        default=50.0,
+        required=False,
+        help="Log records a second that are written at most, the rest are dropped and counted, 0 for no limit."
+    )
+    parser.add_argument(
+        '--latest-path',
+        dest="latest_path",
+        default=None,
+        required=False,
+        help="Publish the latest value of every tag read into a shared memory table at this path, eg. /dev/shm/pylogix-latest."
+    )
+    parser.add_argument(
+        '--latest-slots',
+        dest="latest_slots",
+        type=int,
+        default=4096,
+        required=False,
+        help="Number of tags the shared memory table holds."
+    )
+    parser.add_argument(
+        '--latest-value-size',
+        dest="latest_value_size",
+        type=int,
+        default=128,
+        required=False,
+        help="Bytes reserved for each value in the shared memory table, larger values are left out."
+    )
+    parser.add_argument(
+        '--workers',
+        dest="workers",
+        type=int,
+        default=0,
+        required=False,
+        help="Run this many worker processes behind one front end, controllers are spread by consistent hashing, eg. 4."
+    )
+    parser.add_argument(
+        '--thread-pool-size',
+        dest="thread_pool_size",
+        type=int,
+        default=None,
+        required=False,
+        help="Number of threads running blocking pylogix calls, defaults to min(32, cpu count + 4)."
+    )
+    parser.add_argument(
+        '--metrics-port',
+        dest="metrics_port",
+        type=int,
+        default=None,
+        required=False,
+        help="Serve prometheus metrics over HTTP at /metrics on this port, eg. 9100."
+    )
+    parser.add_argument(
+        '--mock-config',
+        dest="mock_config",
+        default=None,
+        required=False,
+        help="JSON file describing the simulated controllers tags, latency model and seed."
+    )
+    parser.add_argument(
+        '--stream-chunk-size',
+        dest="stream_chunk_size",
+        type=int,
+        default=1000,
+        required=False,
+        help="Entries per chunk of a streamed reply, unless the request sets chunk_size."
+    )
+    parser.add_argument(
+        '--discover-interval',
+        dest="discover_interval",
+        type=float,
+        default=None,
+        required=False,
+        help="Run discovery in the background every this many seconds and answer discover from the inventory."
+    )
+    parser.add_argument(
+        '--discover-events',
+        dest="discover_events",
+        default=None,
+        required=False,
+        help="Publish device added, changed and removed events on this PUB endpoint, eg. tcp://127.0.0.1:7778."
+    )
+    parser.add_argument(
+        '--chassis-cache-ttl',
+        dest="chassis_cache_ttl",
+        type=float,
+        default=60,
+        required=False,
+        help="Seconds a scan-chassis result is served from the cache."
+    )
+    parser.add_argument(
+        '--clock-sample-interval',
+        dest="clock_sample_interval",
+        type=float,
+        default=60,
+        required=False,
+        help="Seconds between samples of the PLC clock offset, get-plc-time is answered from the estimate."
+    )
+    parser.add_argument(
+        '--recv-batch',
+        dest="recv_batch",
+        type=int,
+        default=64,
+        required=False,
+        help="Most requests handled per wake-up of the receive loop, their replies are sent together, 1 replies to each request on its own."
+    )
+    parser.add_argument(
+        '--event-loop',
+        dest="event_loop",
+        choices=["asyncio", "uvloop"],
+        default="asyncio",
+        required=False,
+        help="Event loop implementation, uvloop needs the uvloop package installed."
+    )
+    parser.add_argument(
+        '--sndhwm',
+        dest="sndhwm",
+        type=int,
+        default=None,
+        required=False,
+        help="ZeroMQ send high water mark, replies queued per client before new ones are dropped."
+    )
+    parser.add_argument(
+        '--rcvhwm',
+        dest="rcvhwm",
+        type=int,
+        default=None,
+        required=False,
+        help="ZeroMQ receive high water mark, requests queued per client before the client blocks."
+    )
+    parser.add_argument(
+        '--sndbuf',
+        dest="sndbuf",
+        type=int,
+        default=None,
+        required=False,
+        help="Kernel send buffer size in bytes."
+    )
+    parser.add_argument(
+        '--rcvbuf',
+        dest="rcvbuf",
+        type=int,
+        default=None,
+        required=False,
+        help="Kernel receive buffer size in bytes."
+    )
+    parser.add_argument(
+        '--tcp-keepalive',
+        dest="tcp_keepalive",
+        type=int,
+        default=None,
+        required=False,
+        help="1 turns TCP keepalive on, 0 off, -1 keeps the OS default."
+    )
+    parser.add_argument(
+        '--tcp-keepalive-idle',
+        dest="tcp_keepalive_idle",
+        type=int,
+        default=None,
+        required=False,
+        help="Seconds a connection is idle before keepalive probes are sent."
+    )
+    parser.add_argument(
+        '--tcp-keepalive-intvl',
+        dest="tcp_keepalive_intvl",
+        type=int,
+        default=None,
+        required=False,
+        help="Seconds between keepalive probes."
+    )
+    parser.add_argument(
+        '--tcp-keepalive-cnt',
+        dest="tcp_keepalive_cnt",
+        type=int,
+        default=None,
+        required=False,
+        help="Unanswered keepalive probes before the connection is dropped."
+    )
+    args = parser.parse_args()
+    if not args.server_port and not args.bind:
+        parser.error("either --server-port or --bind is required")
+
+    logger.configure(args.log_format, args.log_dedup_window, args.log_rate)
+    use_event_loop(args.event_loop)
+    asyncio.run(main(args=args))
@@ -0,0 +1,220 @@
+import time
+import asyncio
+import threading
+
+_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+class Histogram:
+    """Fixed bucket latency histogram, cumulative like prometheus."""
+
+    def __init__(self, buckets: tuple = _BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        idx = 0
+        for bound in self.buckets:
+            if value <= bound:
+                break
+            idx += 1
+        self.counts[idx] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        total = 0
+        container = []
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            container.append((str(bound), total))
+        return container
+
+    def snapshot(self) -> dict:
+        return {
+            "count":self.count,
+            "sum":self.sum,
+            "max":self.max,
+            "buckets":dict(self.cumulative())
+        }
+
+class Metrics:
+    """Request counters, latency histograms and thread pool gauges
+    for a single Service."""
+
+    def __init__(self, thread_pool_size: int) -> None:
+        self.started = time.time()
+        self.requests: dict[tuple[str, str, str], Histogram] = {}
+        self.in_flight = 0
+        # requests handled per wake-up of the receive loop
+        self.batches = Histogram(_BATCH_BUCKETS)
+        # rate limiting per controller, (requests delayed, seconds delayed) and refusals
+        self.throttled: dict[str, list] = {}
+        self.busy: dict[str, int] = {}
+        # event loop heartbeat lateness and stalls by culprit, (stalls, seconds)
+        self.loop_lag = Histogram()
+        self.stalls: dict[str, list] = {}
+        self.thread_pool_size = thread_pool_size
+        self.thread_busy = 0
+        self.thread_queued = 0
+        self._lock = threading.Lock()
+
+    def observe_request(self, command: str, controller: str, status: str, seconds: float):
+        key = (command, controller, status)
+        histogram = self.requests.get(key, None)
+        if histogram is None:
+            histogram = self.requests[key] = Histogram()
+        histogram.observe(seconds)
+
+    def observe_batch(self, size: int):
+        self.batches.observe(size)
+
+    def observe_throttle(self, controller: str, seconds: float):
+        entry = self.throttled.setdefault(controller, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def observe_busy(self, controller: str):
+        self.busy[controller] = self.busy.get(controller, 0) + 1
+
+    def observe_loop_lag(self, seconds: float):
+        self.loop_lag.observe(seconds)
+
+    def observe_stall(self, culprit: str, seconds: float):
+        entry = self.stalls.setdefault(culprit, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    # the thread pool counters are touched from worker threads
+    def thread_submitted(self):
+        with self._lock:
+            self.thread_queued += 1
+
+    def thread_started(self):
+        with self._lock:
+            self.thread_queued -= 1
+            self.thread_busy += 1
+
+    def thread_finished(self):
+        with self._lock:
+            self.thread_busy -= 1
+
+    def gauges(self) -> dict:
+        return {
+            "in_flight":self.in_flight,
+            "thread_pool_size":self.thread_pool_size,
+            "thread_pool_busy":self.thread_busy,
+            "thread_pool_queued":self.thread_queued,
+            "thread_pool_utilization":self.thread_busy / self.thread_pool_size
+        }
+
+    def snapshot(self) -> dict:
+        container = []
+        for (command, controller, status), histogram in self.requests.items():
+            entry = {
+                "command":command,
+                "controller":controller,
+                "status":status
+            }
+            entry.update(histogram.snapshot())
+            container.append(entry)
+        return {
+            "uptime":time.time() - self.started,
+            "requests":container,
+            "batches":self.batches.snapshot(),
+            "loop_lag":self.loop_lag.snapshot(),
+            **self.gauges()
+        }
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines = [
+            "# HELP pylogix_request_duration_seconds Time from receiving a request to sending its reply.",
+            "# TYPE pylogix_request_duration_seconds histogram"
+        ]
+        for (command, controller, status), histogram in self.requests.items():
+            labels = _labels(command=command, controller=controller, status=status)
+            for bound, count in histogram.cumulative():
+                lines.append(f'pylogix_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f"pylogix_request_duration_seconds_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"pylogix_request_duration_seconds_count{{{labels}}} {histogram.count}")
+        lines.append("# HELP pylogix_recv_batch_size Requests handled per wake-up of the receive loop.")
+        lines.append("# TYPE pylogix_recv_batch_size histogram")
+        for bound, count in self.batches.cumulative():
+            lines.append(f'pylogix_recv_batch_size_bucket{{le="{bound}"}} {count}')
+        lines.append(f"pylogix_recv_batch_size_sum {self.batches.sum}")
+        lines.append(f"pylogix_recv_batch_size_count {self.batches.count}")
+        lines.append("# HELP pylogix_throttled_seconds_total Time requests waited for their controller rate limit.")
+        lines.append("# TYPE pylogix_throttled_seconds_total counter")
+        for controller, (count, seconds) in self.throttled.items():
+            lines.append(f"pylogix_throttled_seconds_total{{{_labels(controller=controller)}}} {seconds}")
+        lines.append("# TYPE pylogix_throttled_requests_total counter")
+        for controller, (count, seconds) in self.throttled.items():
+            lines.append(f"pylogix_throttled_requests_total{{{_labels(controller=controller)}}} {count}")
+        lines.append("# HELP pylogix_busy_total Requests refused because their controller was over its rate limit.")
+        lines.append("# TYPE pylogix_busy_total counter")
+        for controller, count in self.busy.items():
+            lines.append(f"pylogix_busy_total{{{_labels(controller=controller)}}} {count}")
+        lines.append("# HELP pylogix_loop_lag_seconds How late the event loop ran its heartbeat.")
+        lines.append("# TYPE pylogix_loop_lag_seconds histogram")
+        for bound, count in self.loop_lag.cumulative():
+            lines.append(f'pylogix_loop_lag_seconds_bucket{{le="{bound}"}} {count}')
+        lines.append(f"pylogix_loop_lag_seconds_sum {self.loop_lag.sum}")
+        lines.append(f"pylogix_loop_lag_seconds_count {self.loop_lag.count}")
+        lines.append("# HELP pylogix_loop_stalls_total Event loop stalls over the watchdog threshold, by what was running.")
+        lines.append("# TYPE pylogix_loop_stalls_total counter")
+        for culprit, (count, seconds) in self.stalls.items():
+            lines.append(f"pylogix_loop_stalls_total{{{_labels(culprit=culprit)}}} {count}")
+        lines.append("# TYPE pylogix_loop_stall_seconds_total counter")
+        for culprit, (count, seconds) in self.stalls.items():
+            lines.append(f"pylogix_loop_stall_seconds_total{{{_labels(culprit=culprit)}}} {seconds}")
+        lines.append("# TYPE pylogix_uptime_seconds gauge")
+        lines.append(f"pylogix_uptime_seconds {time.time() - self.started}")
+        for name, value in self.gauges().items():
+            lines.append(f"# TYPE pylogix_{name} gauge")
+            lines.append(f"pylogix_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+def _labels(**labels) -> str:
+    container = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        container.append(f'{key}="{value}"')
+    return ",".join(container)
+
+async def start_metrics_server(address: str, port: int, render, ready=None):
+    """Minimal HTTP endpoint serving GET /metrics for prometheus, and
+    GET /ready answering 503 until ready() is true for probes."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            # drain the headers, nothing in them matters to us
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", render().encode("utf-8")
+            elif len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/ready":
+                if ready is None or ready():
+                    status, body = "200 OK", b"ready\n"
+                else:
+                    status, body = "503 Service Unavailable", b"not ready\n"
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, address, port)
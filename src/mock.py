@@ -1,8 +1,13 @@
+import re
+import json
+import math
 import time
+import struct
+import threading
 from enum import Enum
-from datetime import datetime
+from random import Random
+from datetime import datetime, timedelta
 from string import ascii_letters
-from random import randint, getrandbits, choice
 
 class _DataType(Enum):
     UNKNOWN = 0x00
@@ -21,6 +26,26 @@ class _DataType(Enum):
     DWORD   = 0xd3
     STRING  = 0xda
 
+# name -> (size in bytes, struct format), strings are the 88 byte logix STRING
+_TYPE_INFO = {
+    "BOOL":   (1, None),
+    "SINT":   (1, "<b"),
+    "INT":    (2, "<h"),
+    "DINT":   (4, "<i"),
+    "LINT":   (8, "<q"),
+    "USINT":  (1, "<B"),
+    "UINT":   (2, "<H"),
+    "UDINT":  (4, "<I"),
+    "LWORD":  (8, "<Q"),
+    "REAL":   (4, "<f"),
+    "LREAL":  (8, "<d"),
+    "DWORD":  (4, "<i"),
+    "STRING": (88, None)
+}
+
+_UNKNOWN_TAG = "Path destination unknown"
+_SUCCESS = "Success"
+
 class _MockResponse:
     def __init__(self, TagName, Value, Status) -> None:
         self.TagName = TagName
@@ -35,15 +60,23 @@ class _MockResponse:
         return '{} {} {}'.format(self.TagName, self.Value, self.Status)
 
 class _MockTag:
-    def __init__(self, TagName):
+    def __init__(self,
+                 TagName,
+                 InstanceID = 10,
+                 SymbolType = 214,
+                 DataTypeValue = 1750,
+                 DataType = "AB:ETHERNET_MODULE:C:O",
+                 Array = 0,
+                 Struct = 1,
+                 Size = 0):
         self.TagName = TagName
-        self.InstanceID = 10
-        self.SymbolType = 214
-        self.DataTypeValue = 1750
-        self.DataType = "AB:ETHERNET_MODULE:C:O"
-        self.Array = 0
-        self.Struct = 1
-        self.Size = 0
+        self.InstanceID = InstanceID
+        self.SymbolType = SymbolType
+        self.DataTypeValue = DataTypeValue
+        self.DataType = DataType
+        self.Array = Array
+        self.Struct = Struct
+        self.Size = Size
         self.AccessRight = None
         self.Internal = None
         self.Meta = None
@@ -87,22 +120,30 @@ class _MockTag:
                 self.Bytes)
 
 class _MockDevice:
-    def __init__(self, address):
+    def __init__(self, address, product_name="1756-L84E/B", serial_number=0xffffff, product_code=167, device_id=14):
         self.Length=0
         self.EncapsulationVersion=0
         self.IPAddress=address
         self.VendorID=1
         self.Vendor='Rockwell Automation/Allen-Bradley'
-        self.DeviceID=14
+        self.DeviceID=device_id
         self.DeviceType=None
-        self.ProductCode=167
+        self.ProductCode=product_code
         self.Revision=20.00
         self.Status=12384
-        self.SerialNumber=0xffffff
-        self.ProductNameLength=11
-        self.ProductName="1756-L84E/B"
+        self.SerialNumber=serial_number
+        self.ProductNameLength=len(product_name)
+        self.ProductName=product_name
         self.State=66
 
+    @staticmethod
+    def empty():
+        """What pylogix hands back when a module did not answer."""
+        device = _MockDevice(None)
+        for key in vars(device):
+            setattr(device, key, None)
+        return device
+
     def __repr__(self):
         props = ''
         props += 'Length={}, '.format(self.Length)
@@ -137,22 +178,333 @@ class _MockDevice:
                  self.ProductNameLength,
                  self.ProductName,
                  self.State)
+        return ret
+
+
+_DEFAULT_CONFIG = {
+    "seed": 0,
+    "model": {
+        "latency": 0.0,
+        "packet_latency": 0.0,
+        "bandwidth": None,
+        "cpu": 0.0,
+        "jitter": 0.0,
+        "discover_latency": 0.0,
+        "clock_offset": 0.0,
+        "clock_drift_ppm": 0.0
+    },
+    "udts": {
+        "Motor": {
+            "Speed": "REAL",
+            "Current": "REAL",
+            "Running": "BOOL",
+            "Faults": {"type": "DINT", "array": 4},
+            "Name": "STRING"
+        }
+    },
+    "tags": {
+        "BaseBOOL": "BOOL",
+        "BaseSINT": "SINT",
+        "BaseINT": "INT",
+        "BaseDINT": "DINT",
+        "BaseLINT": "LINT",
+        "BaseREAL": "REAL",
+        "BaseLREAL": "LREAL",
+        "BaseSTRING": "STRING",
+        "BaseINTArray": {"type": "INT", "array": 100},
+        "BaseDINTArray": {"type": "DINT", "array": 100},
+        "BaseREALArray": {"type": "REAL", "array": 100},
+        "Motor1": "Motor",
+        "Motor2": "Motor",
+        "MotorArray": {"type": "Motor", "array": 10},
+        "Program:MainProgram.Counter": "DINT",
+        "Program:MainProgram.Setpoint": "REAL",
+        "Program:SecondProgram.Counter": "DINT"
+    },
+    "chassis": {
+        "0": "1756-L84E/B",
+        "1": "1756-EN2T/D",
+        "2": "1756-IB16/A",
+        "3": "1756-OB16E/A",
+        "4": "1756-IF8/A"
+    },
+    "network": [
+        "192.168.1.100",
+        "192.168.1.101",
+        "192.168.1.102"
+    ]
+}
+
+def load_mock_config(path: str | None = None) -> dict:
+    """Read a mock controller description, missing sections fall
+    back to the built in defaults."""
+    config = dict(_DEFAULT_CONFIG)
+    if path:
+        with open(path) as f:
+            loaded = json.load(f)
+        config.update(loaded)
+        config["model"] = {**_DEFAULT_CONFIG["model"], **loaded.get("model", {})}
+    return config
+
+def _spec(entry) -> tuple[str, int, object]:
+    """Tag or member declaration, either "TYPE" or
+    {"type": "TYPE", "array": N, "value": initial}."""
+    if isinstance(entry, str):
+        return entry, 0, None
+    return entry["type"], entry.get("array", 0), entry.get("value", None)
+
+def _coerce(type_name: str, value):
+    if type_name == "BOOL":
+        return bool(value)
+    if type_name == "STRING":
+        return str(value)[:82]
+    size, fmt = _TYPE_INFO[type_name]
+    if type_name == "REAL":
+        return struct.unpack("<f", struct.pack("<f", float(value)))[0]
+    if type_name == "LREAL":
+        return float(value)
+    # integers wrap around like they do in the controller
+    bits = size * 8
+    value = int(value) & ((1 << bits) - 1)
+    if fmt.islower() and value >= 1 << (bits - 1):
+        value -= 1 << bits
+    return value
+
+class _Location:
+    def __init__(self, parent, key, type_name, array, bit=None):
+        self.parent = parent
+        self.key = key
+        self.type_name = type_name
+        self.array = array
+        self.bit = bit
+
+class _TagDatabase:
+    """Tag definitions and current values of one controller."""
+
+    _SEGMENT = re.compile(r"^(.+?)(?:\[(\d+)\])?$")
+
+    def __init__(self, config: dict, rng: Random) -> None:
+        self.rng = rng
+        self.udts = {
+            name: {member: _spec(x) for member, x in members.items()}
+            for name, members in config.get("udts", {}).items()
+        }
+        self.template_ids = {name: 0x100 + idx for idx, name in enumerate(self.udts)}
+        self.tags: dict[str, tuple[str, int]] = {}
+        self.values: dict[str, object] = {}
+        for name, entry in config.get("tags", {}).items():
+            type_name, array, value = _spec(entry)
+            self.tags[name] = (type_name, array)
+            self.values[name] = self._make(type_name, array) if value is None else value
+
+    def _initial(self, type_name: str):
+        if type_name in self.udts:
+            return {
+                member: self._make(x[0], x[1]) if x[2] is None else x[2]
+                for member, x in self.udts[type_name].items()
+            }
+        match type_name:
+            case "BOOL":
+                return bool(self.rng.getrandbits(1))
+            case "REAL" | "LREAL":
+                return _coerce(type_name, self.rng.uniform(-1000, 1000))
+            case "STRING":
+                return ''.join(self.rng.choice(ascii_letters) for i in range(10))
+            case _:
+                size, fmt = _TYPE_INFO[type_name]
+                bits = size * 8
+                if fmt.islower():
+                    return self.rng.randint(-(1 << (bits - 1)), (1 << (bits - 1)) - 1)
+                return self.rng.randint(0, (1 << bits) - 1)
+
+    def _make(self, type_name: str, array: int):
+        if array:
+            return [self._initial(type_name) for i in range(array)]
+        return self._initial(type_name)
+
+    def size_of(self, type_name: str, array: int = 0) -> int:
+        if type_name in self.udts:
+            size = sum(self.size_of(x[0], x[1]) for x in self.udts[type_name].values())
+        else:
+            size = _TYPE_INFO[type_name][0]
+        return size * max(array, 1)
+
+    def locate(self, name: str) -> _Location | None:
+        """Walk Tag[1].Member[2].3 style names down to the value."""
+        if name.startswith("Program:"):
+            program, _, rest = name.partition(".")
+            parts = rest.split(".")
+            parts[0] = f"{program}.{parts[0]}"
+        else:
+            parts = name.split(".")
+        location = None
+        for idx, part in enumerate(parts):
+            if idx and part.isdigit():
+                # bit of an integer, has to be the last segment
+                if location.array or location.type_name not in _TYPE_INFO \
+                        or location.type_name in ("BOOL", "STRING", "REAL", "LREAL") \
+                        or int(part) >= self.size_of(location.type_name) * 8 \
+                        or idx != len(parts) - 1:
+                    return None
+                return _Location(location.parent, location.key, "BOOL", 0, int(part))
+            match = self._SEGMENT.match(part)
+            if not match:
+                return None
+            member, index = match.group(1), match.group(2)
+            if location is None:
+                if member not in self.tags:
+                    return None
+                type_name, array = self.tags[member]
+                location = _Location(self.values, member, type_name, array)
+            else:
+                members = self.udts.get(location.type_name, None)
+                if location.array or members is None or member not in members:
+                    return None
+                type_name, array, _ = members[member]
+                location = _Location(location.parent[location.key], member, type_name, array)
+            if index is not None:
+                if not location.array or int(index) >= location.array:
+                    return None
+                location = _Location(location.parent[location.key], int(index), location.type_name, 0)
+        return location
+
+    def read(self, name: str, count: int = 1):
+        """Returns (value, bytes on the wire), value is None for
+        unknown tags."""
+        location = self.locate(name)
+        if location is None:
+            return None, 0
+        if location.array:
+            # reading the array name starts at the first element
+            location = _Location(location.parent[location.key], 0, location.type_name, 0)
+        value = location.parent[location.key]
+        if location.bit is not None:
+            return bool((value >> location.bit) & 1), 1
+        if count > 1 and isinstance(location.parent, list):
+            values = location.parent[location.key:location.key + count]
+            return json.loads(json.dumps(values)), self.size_of(location.type_name) * len(values)
+        if isinstance(value, (dict, list)):
+            value = json.loads(json.dumps(value))
+        return value, self.size_of(location.type_name)
+
+    def write(self, name: str, value) -> int | None:
+        """Returns the bytes written, None for unknown tags."""
+        location = self.locate(name)
+        if location is None:
+            return None
+        if location.array:
+            location = _Location(location.parent[location.key], 0, location.type_name, 0)
+        if location.type_name in self.udts:
+            raise TypeError("writing whole structures is not supported")
+        if location.bit is not None:
+            current = location.parent[location.key]
+            if value:
+                current |= 1 << location.bit
+            else:
+                current &= ~(1 << location.bit)
+            location.parent[location.key] = current
+            return 1
+        if isinstance(value, list) and isinstance(location.parent, list):
+            for offset, x in enumerate(value[:len(location.parent) - location.key]):
+                location.parent[location.key + offset] = _coerce(location.type_name, x)
+            return self.size_of(location.type_name) * len(value)
+        location.parent[location.key] = _coerce(location.type_name, value)
+        return self.size_of(location.type_name)
+
+    def tag_list(self, names: list[str]) -> list[_MockTag]:
+        container = []
+        for idx, name in enumerate(names):
+            type_name, array = self.tags[name]
+            if type_name in self.udts:
+                type_value = self.template_ids[type_name]
+                struct_flag = 1
+            else:
+                type_value = _DataType[type_name].value
+                struct_flag = 0
+            container.append(_MockTag(
+                name,
+                InstanceID=idx + 1,
+                SymbolType=type_value & 0xff,
+                DataTypeValue=type_value & 0xfff,
+                DataType=type_name,
+                Array=1 if array else 0,
+                Struct=struct_flag,
+                Size=array
+            ))
+        return container
+
+class _Controller:
+    """State shared by every MockPLC talking to the same address,
+    tag values survive reconnects just like on a real controller."""
+
+    def __init__(self, address: str, config: dict) -> None:
+        self.address = address
+        # string seeds are deterministic across runs, unlike hash()
+        self.rng = Random(f"{config.get('seed', 0)}-{address}")
+        self.database = _TagDatabase(config, self.rng)
+        self.model = config["model"]
+        self.chassis = config.get("chassis", {})
+        self.network = config.get("network", [])
+        self.clock_epoch = time.time()
+        # guards tag values and the random generator
+        self.lock = threading.Lock()
+        # the communications cpu of the controller, serves one packet at a time
+        self.cpu = threading.Lock()
+
+    def exchange(self, request_bytes: int, response_bytes: int, connection_size: int):
+        """Sleep for the modelled duration of one service request, split
+        into packets no larger than the connection size."""
+        model = self.model
+        if not any([model["latency"], model["packet_latency"], model["bandwidth"], model["cpu"]]):
+            return
+        total = request_bytes + response_bytes
+        # encapsulation and cip headers eat into every packet
+        packets = max(1, math.ceil(total / max(1, connection_size - 50)))
+        factor = 1.0
+        if model["jitter"]:
+            with self.lock:
+                factor += self.rng.uniform(-model["jitter"], model["jitter"])
+        wire = model["latency"] + packets * model["packet_latency"]
+        if model["bandwidth"]:
+            wire += total / model["bandwidth"]
+        time.sleep(wire * factor / 2)
+        if model["cpu"]:
+            with self.cpu:
+                time.sleep(packets * model["cpu"] * factor)
+        time.sleep(wire * factor / 2)
+
+    def now(self) -> float:
+        """The controller wall clock, offset and drifting from ours."""
+        wall = time.time()
+        return wall + self.model["clock_offset"] + (wall - self.clock_epoch) * self.model["clock_drift_ppm"] / 1e6
+
+_controllers: dict[str, _Controller] = {}
+_controllers_lock = threading.Lock()
+
+def _controller(address: str, config: dict | None) -> _Controller:
+    with _controllers_lock:
+        controller = _controllers.get(address, None)
+        if controller is None:
+            controller = _controllers[address] = _Controller(address, config or load_mock_config())
+        return controller
 
 class MockPLC:
     def __init__(self,
                  ip_address: str,
                  slot: int = 0,
                  timeout: int = 5,
-                 Micro800: bool = False) -> None:
+                 Micro800: bool = False,
+                 config: dict | None = None) -> None:
         self.IPAddress = ip_address
         self.ProcessorSlot = slot
         self.SocketTimeout = timeout
         self.Micro800 = Micro800
         self._ConnectionSize: int | None = None
+        self._controller = _controller(ip_address, config)
 
     @property
     def ConnectionSize(self):
-        return self._ConnectionSize
+        return self._ConnectionSize or 508
 
     @ConnectionSize.setter
     def ConnectionSize(self, connection_size: int):
@@ -161,128 +513,152 @@ class MockPLC:
     def Close(self) -> None:
         return
 
+    def _read_tag(self, tag, count):
+        with self._controller.lock:
+            value, size = self._controller.database.read(tag, count or 1)
+        if size == 0:
+            return _MockResponse(TagName=tag, Value=None, Status=_UNKNOWN_TAG), 0
+        return _MockResponse(TagName=tag, Value=value, Status=_SUCCESS), size
+
+    def _write_tag(self, tag, value):
+        try:
+            with self._controller.lock:
+                size = self._controller.database.write(tag, value)
+        except (TypeError, ValueError):
+            return _MockResponse(TagName=tag, Value=value, Status="Invalid parameter value"), 0
+        if size is None:
+            return _MockResponse(TagName=tag, Value=value, Status=_UNKNOWN_TAG), 0
+        return _MockResponse(TagName=tag, Value=value, Status=_SUCCESS), size
+
     def Read(self, tag, count = 1, datatype = None):
-        if datatype:
-            datatype = _DataType(datatype)
         if isinstance(tag, list):
             container: list[_MockResponse] = []
+            response_bytes = 0
             for x in tag:
-                match datatype:
-                    case _DataType.BOOL:
-                        val = bool(getrandbits(1))
-                    case _DataType.SINT:
-                        val = randint(-128, 127)
-                    case _DataType.INT:
-                        val = randint(-32768, 32767)
-                    case _DataType.DINT:
-                        val = randint(-2147483648, 2147483647)
-                    case _DataType.STRING:
-                        val = ''.join(choice(ascii_letters) for i in range(10))
-                    case _:
-                        val = None
-                container.append(
-                    _MockResponse(TagName=x, Value=val, Status="Success")
-                )
+                res, size = self._read_tag(x, 1)
+                container.append(res)
+                response_bytes += size + 4
+            self._controller.exchange(sum(len(x) + 12 for x in tag), response_bytes, self.ConnectionSize)
             return container
         else:
-            match datatype:
-                case _DataType.BOOL:
-                    val = bool(getrandbits(1))
-                case _DataType.SINT:
-                    val = randint(-128, 127)
-                case _DataType.INT:
-                    val = randint(-32768, 32767)
-                case _DataType.DINT:
-                    val = randint(-2147483648, 2147483647)
-                case _DataType.STRING:
-                    val = ''.join(choice(ascii_letters) for i in range(10))
-                case _:
-                    val = None
-            return _MockResponse(TagName=tag, Value=val, Status="Success")
+            res, size = self._read_tag(tag, count)
+            self._controller.exchange(len(tag) + 12, size + 4, self.ConnectionSize)
+            return res
 
     def Write(self, tag, value = None, datatype = None):
-        if datatype:
-            datatype = _DataType(datatype)
         if isinstance(tag, list):
             container: list[_MockResponse] = []
+            request_bytes = 0
             for x in tag:
-                container.append(
-                    _MockResponse(TagName=x[0], Value=x[1], Status="Success")
-                )
+                res, size = self._write_tag(x[0], x[1])
+                container.append(res)
+                request_bytes += len(x[0]) + size + 14
+            self._controller.exchange(request_bytes, 4 * len(tag), self.ConnectionSize)
             return container
         else:
-            return _MockResponse(TagName=tag, Value=value, Status="Success")
+            res, size = self._write_tag(tag, value)
+            self._controller.exchange(len(tag) + size + 14, 4, self.ConnectionSize)
+            return res
 
     def GetPLCTime(self, raw = False):
+        self._controller.exchange(12, 16, self.ConnectionSize)
+        # microseconds since the epoch, the same as pylogix
+        plc_time = int(self._controller.now() * 1000000)
         if raw:
-            return _MockResponse(TagName=None, Value=time.time(), Status="Success")
+            return _MockResponse(TagName=None, Value=plc_time, Status=_SUCCESS)
         else:
-            return _MockResponse(TagName=None, Value=datetime.now(), Status="Success")
+            value = datetime(1970, 1, 1) + timedelta(microseconds=plc_time)
+            return _MockResponse(TagName=None, Value=value, Status=_SUCCESS)
 
     def SetPLCTime(self):
-        return _MockResponse(TagName=None, Value=time.time(), Status="Success")
+        self._controller.exchange(24, 4, self.ConnectionSize)
+        now = time.time()
+        self._controller.clock_epoch = now
+        self._controller.model = {**self._controller.model, "clock_offset": 0.0}
+        return _MockResponse(TagName=None, Value=now, Status=_SUCCESS)
+
+    def _tag_list_response(self, names):
+        database = self._controller.database
+        values = database.tag_list(names)
+        self._controller.exchange(16 * len(values), sum(len(x) + 20 for x in names), self.ConnectionSize)
+        return _MockResponse(TagName=None, Value=values, Status=_SUCCESS)
 
     def GetTagList(self, allTags = True):
-        values=[
-                _MockTag("tag-one"),
-                _MockTag("tag-two"),
-                _MockTag("tag-three")
+        names = [
+            x for x in self._controller.database.tags
+            if allTags or not x.startswith("Program:")
         ]
-        return _MockResponse(
-            TagName=None, 
-            Value=values,
-            Status="Success"
-        )
+        return self._tag_list_response(names)
 
     def GetProgramTagList(self, programName):
-        values=[
-                _MockTag("Program:tag-one"),
-                _MockTag("Program:tag-two"),
-                _MockTag("Program:tag-three")
-        ]
-
-        return _MockResponse(
-            TagName=None, 
-            Value=values,
-            Status="Success"
-        )
+        names = [x for x in self._controller.database.tags if x.startswith(f"{programName}.")]
+        if not names:
+            return _MockResponse(
+                TagName=programName,
+                Value=None,
+                Status="Program not found, please check name!"
+            )
+        return self._tag_list_response(names)
 
     def GetProgramsList(self):
+        programs = []
+        for x in self._controller.database.tags:
+            if x.startswith("Program:") and x.partition(".")[0] not in programs:
+                programs.append(x.partition(".")[0])
+        self._controller.exchange(16, sum(len(x) + 20 for x in programs), self.ConnectionSize)
         return _MockResponse(
             TagName=None, 
-            Value=[
-                "Program:program-one",
-                "Program:program-two",
-                "Program:program-three"
-            ],
-            Status="Success"
+            Value=programs,
+            Status=_SUCCESS
         )
 
     def Discover(self):
-        values=[
-                _MockDevice(address="192.168.1.100"),
-                _MockDevice(address="192.168.1.101"),
-                _MockDevice(address="192.168.1.102")
+        # a broadcast waits for every device on the network to answer
+        time.sleep(self._controller.model["discover_latency"])
+        values = [
+            _MockDevice(address=x, serial_number=0xffff00 + idx)
+            for idx, x in enumerate(self._controller.network)
         ]
 
         return _MockResponse(
             TagName=None, 
             Value=values,
-            Status="Success"
+            Status=_SUCCESS
+        )
+
+    def _module(self, slot):
+        product_name = self._controller.chassis.get(str(slot), None)
+        if product_name is None:
+            return None
+        return _MockDevice(
+            address=self.IPAddress,
+            product_name=product_name,
+            serial_number=(0xc0ff0000 + int(slot)) & 0xffffffff,
+            product_code=167 if product_name.startswith("1756-L") else 166,
+            device_id=14 if product_name.startswith("1756-L") else 12
         )
 
     def GetModuleProperties(self, slot):
-        device = _MockDevice(address="192.168.1.100")
+        self._controller.exchange(16, 64, self.ConnectionSize)
+        device = self._module(slot)
+        if device is None:
+            return _MockResponse(
+                TagName=None,
+                Value=_MockDevice.empty(),
+                Status="Connection failure"
+            )
         return _MockResponse(
             TagName=None, 
             Value=device,
-            Status="Success"
+            Status=_SUCCESS
         )
 
     def GetDeviceProperties(self):
-        device = _MockDevice(address="192.168.1.100")
+        self._controller.exchange(16, 64, self.ConnectionSize)
+        # the ethernet module answering on this address
+        device = self._module(1) or self._module(0) or _MockDevice(address=self.IPAddress)
         return _MockResponse(
             TagName=None, 
             Value=device,
-            Status="Success"
+            Status=_SUCCESS
         )
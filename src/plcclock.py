@@ -0,0 +1,78 @@
+import time
+import threading
+from collections import deque
+
+# anything beyond this is a bad sample, not a crystal
+_MAX_DRIFT = 500e-6
+
+class PLCClock:
+    """Offset and drift of one controller clock against ours, estimated
+    from round trip corrected GetPLCTime samples. Local time is taken
+    from the monotonic clock so steps of the system clock do not leak
+    into the estimate."""
+
+    def __init__(self, window: int = 16, max_age: float = 300) -> None:
+        self.max_age = max_age
+        self.epoch_wall = time.time()
+        self.epoch_mono = time.monotonic()
+        # (local midpoint, offset, round trip)
+        self.samples: deque[tuple[float, float, float]] = deque(maxlen=window)
+        self.offset = 0.0
+        self.drift = 0.0
+        self.reference = 0.0
+        self.error = 0.0
+        self._lock = threading.Lock()
+
+    def local(self, mono: float | None = None) -> float:
+        """Our wall clock on the monotonic time base."""
+        return self.epoch_wall + ((time.monotonic() if mono is None else mono) - self.epoch_mono)
+
+    def add_sample(self, sent: float, received: float, plc_time: float):
+        """sent and received are time.monotonic() around the request,
+        plc_time the controller clock in seconds since the epoch."""
+        midpoint = (sent + received) / 2
+        with self._lock:
+            self.samples.append((midpoint, plc_time - self.local(midpoint), received - sent))
+            self._fit()
+
+    def _fit(self):
+        # the fastest round trips have the least asymmetric delay in them
+        best = sorted(self.samples, key=lambda x: x[2])[:max(2, len(self.samples) // 2)]
+        fastest = best[0]
+        self.error = fastest[2] / 2
+        span = max(x[0] for x in best) - min(x[0] for x in best)
+        if len(best) < 2 or span < 1.0:
+            self.reference, self.offset, self.drift = fastest[0], fastest[1], 0.0
+            return
+        # least squares line of offset over time
+        mean_t = sum(x[0] for x in best) / len(best)
+        mean_o = sum(x[1] for x in best) / len(best)
+        slope = sum((x[0] - mean_t) * (x[1] - mean_o) for x in best) / sum((x[0] - mean_t) ** 2 for x in best)
+        self.drift = max(-_MAX_DRIFT, min(_MAX_DRIFT, slope))
+        self.reference = mean_t
+        self.offset = mean_o
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear()
+
+    def fresh(self) -> bool:
+        with self._lock:
+            return bool(self.samples) and time.monotonic() - self.samples[-1][0] < self.max_age
+
+    def now(self) -> float | None:
+        """Estimated controller time in seconds, None without samples."""
+        with self._lock:
+            if not self.samples:
+                return None
+            mono = time.monotonic()
+            return self.local(mono) + self.offset + self.drift * (mono - self.reference)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "samples":len(self.samples),
+                "offset":self.offset,
+                "drift_ppm":self.drift * 1e6,
+                "error":self.error
+            }
@@ -0,0 +1,157 @@
+import time
+import asyncio
+
+from logger import log_exception
+
+class GroupHealth:
+    """Smoothed poll latency and error rate of one tag group, compared
+    with the fastest it has been seen answering. Kept per group, a few
+    tags and a few hundred on one controller take very different times.
+    Between the slow and the recovered thresholds the state holds, so
+    rates do not flap."""
+
+    def __init__(self, alpha: float = 0.2, slow_factor: float = 2.0, recover_factor: float = 1.5,
+                 slow_errors: float = 0.2, recover_errors: float = 0.05) -> None:
+        self.alpha = alpha
+        self.slow_factor = slow_factor
+        self.recover_factor = recover_factor
+        self.slow_errors = slow_errors
+        self.recover_errors = recover_errors
+        self.latency: float | None = None
+        self.baseline: float | None = None
+        self.error_rate = 0.0
+        self.state = "normal"
+
+    def observe(self, latency: float | None, failed: bool) -> str:
+        """latency is None when the read did not get an answer at all."""
+        self.error_rate += self.alpha * ((1.0 if failed else 0.0) - self.error_rate)
+        if latency is not None:
+            self.latency = latency if self.latency is None else self.latency + self.alpha * (latency - self.latency)
+            self.baseline = self.latency if self.baseline is None else min(self.baseline, self.latency)
+        slow = self.error_rate > self.slow_errors \
+            or (self.latency is not None and self.latency > self.slow_factor * self.baseline)
+        recovered = self.error_rate < self.recover_errors \
+            and (self.latency is None or self.latency < self.recover_factor * self.baseline)
+        if slow:
+            self.state = "slow"
+        elif recovered:
+            self.state = "normal"
+        return self.state
+
+    def snapshot(self) -> dict:
+        return {
+            "state":self.state,
+            "latency":self.latency,
+            "baseline":self.baseline,
+            "error_rate":self.error_rate
+        }
+
+class TagGroup:
+    """Tags of one controller read together. The scan class period is
+    the rate wanted, the group is stretched towards max_period while
+    its controller is slow and tightened back down to min_period, by
+    default the scan class period, once it recovers."""
+
+    def __init__(self, name: str, controller: str, scan_class: str, period: float, tags: list[str],
+                 min_period: float | None = None, max_period: float | None = None, adaptive: bool = True) -> None:
+        self.name = name
+        self.controller = controller
+        self.scan_class = scan_class
+        self.base_period = period
+        self.min_period = min_period if min_period is not None else period
+        self.max_period = max_period if max_period is not None else 10 * period
+        self.adaptive = adaptive
+        self.period = period
+        self.tags = tags
+        self.polls = 0
+        # polls the controller failed, and failed reads by tag
+        self.errors = 0
+        self.tag_errors: dict[str, int] = {}
+        self.duration = 0.0
+        self.polled: float | None = None
+
+    def adapt(self, state: str):
+        if not self.adaptive:
+            return
+        if state == "slow":
+            self.period = min(self.max_period, self.period * 1.5)
+        elif self.period > self.min_period:
+            self.period = max(self.min_period, self.period * 0.8)
+
+    def snapshot(self) -> dict:
+        return {
+            "controller":self.controller,
+            "scan_class":self.scan_class,
+            "period":self.period,
+            "rate":1 / self.period,
+            "base_period":self.base_period,
+            "min_period":self.min_period,
+            "max_period":self.max_period,
+            "adaptive":self.adaptive,
+            "tags":len(self.tags),
+            "polls":self.polls,
+            "errors":self.errors,
+            "tag_errors":self.tag_errors,
+            "duration":self.duration,
+            "polled":self.polled
+        }
+
+class Poller:
+    """Reads every tag group on its current period. A group whose read
+    takes longer than its period starts the next read straight away
+    instead of piling reads up. A controller is slow while any of its
+    groups is, and that drives the periods of all its groups, so when
+    one slows down the total load put on it goes down with it."""
+
+    def __init__(self, groups: list[TagGroup], read) -> None:
+        # read is a coroutine function(group) returning the list of
+        # (name, value, status) and the seconds the controller took
+        self.groups = groups
+        self.read = read
+        self.health = {x.name: GroupHealth() for x in groups}
+
+    async def run(self):
+        await asyncio.gather(*[asyncio.create_task(self._run_group(x), name=f"poll:{x.name}") for x in self.groups])
+
+    def state(self, controller: str) -> str:
+        slow = any(self.health[x.name].state == "slow" for x in self.groups if x.controller == controller)
+        return "slow" if slow else "normal"
+
+    async def _run_group(self, group: TagGroup):
+        health = self.health[group.name]
+        while True:
+            started = time.monotonic()
+            latency = None
+            failed = True
+            try:
+                samples, latency = await self.read(group)
+                bad = [name for name, _, status in samples if status != "Success"]
+                for name in bad:
+                    group.tag_errors[name] = group.tag_errors.get(name, 0) + 1
+                # a bad tag is not the controller failing, it answered
+                failed = not samples or len(bad) == len(samples)
+            except Exception as e:
+                await log_exception(
+                    message=f"failed to poll tag group {group.name}",
+                    payload=None,
+                    exception=e
+                )
+            if failed:
+                group.errors += 1
+            group.polls += 1
+            group.duration = time.monotonic() - started
+            group.polled = time.time()
+            health.observe(latency, failed)
+            group.adapt(self.state(group.controller))
+            await asyncio.sleep(max(0.0, group.period - group.duration))
+
+    def snapshot(self) -> dict:
+        controllers = {}
+        for x in self.groups:
+            entry = controllers.setdefault(x.controller, {"state":self.state(x.controller), "slow_groups":[]})
+            if self.health[x.name].state == "slow":
+                entry["slow_groups"].append(x.name)
+        return {
+            "groups":{x.name: {**x.snapshot(), "health":self.health[x.name].snapshot()} for x in self.groups},
+            "controllers":controllers
+        }
@@ -0,0 +1,127 @@
+import time
+import asyncio
+
+class Busy(Exception):
+    """The controller budget is used up further ahead than a request may wait."""
+
+class TokenBucket:
+    """Reservation style token bucket. A request that does not fit still
+    takes its tokens, leaving the bucket in debt, and is told how long
+    to wait until they would have refilled, so waiters go in order. One
+    larger than the burst waits for a full bucket instead, it could
+    never fit otherwise."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float, now: float) -> float:
+        self._refill(now)
+        return max(0.0, (min(amount, self.burst) - self.tokens) / self.rate)
+
+    def take(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens -= amount
+
+class Budget:
+    """CIP requests and bytes per second one controller may be sent."""
+
+    def __init__(self, requests: float | None, nbytes: float | None, burst: float) -> None:
+        # burst is in seconds worth of the rate
+        self.requests = TokenBucket(requests, max(1.0, requests * burst)) if requests else None
+        self.bytes = TokenBucket(nbytes, max(1.0, nbytes * burst)) if nbytes else None
+        self.waiting = 0
+        self.throttled = 0
+        self.throttled_seconds = 0.0
+        self.busy = 0
+
+    def snapshot(self) -> dict:
+        return {
+            "requests_per_second":self.requests.rate if self.requests else None,
+            "bytes_per_second":self.bytes.rate if self.bytes else None,
+            "waiting":self.waiting,
+            "throttled":self.throttled,
+            "throttled_seconds":self.throttled_seconds,
+            "busy":self.busy
+        }
+
+class RateLimiter:
+    """Token buckets per controller in front of the pylogix calls.
+    A request over budget waits its turn as long as that is within
+    max_delay seconds and fewer than max_queue are waiting already,
+    otherwise it is refused with Busy. Per controller limits given in
+    overrides, {ip: {"requests": .., "bytes": ..}}, replace the defaults."""
+
+    def __init__(self,
+                 requests: float | None = None,
+                 nbytes: float | None = None,
+                 burst: float = 1.0,
+                 max_queue: int = 64,
+                 max_delay: float = 1.0,
+                 overrides: dict[str, dict] | None = None) -> None:
+        self.requests = requests
+        self.nbytes = nbytes
+        self.burst = burst
+        self.max_queue = max_queue
+        self.max_delay = max_delay
+        self.overrides = overrides or {}
+        self.budgets: dict[str, Budget | None] = {}
+
+    def _budget(self, ip: str) -> Budget | None:
+        if ip not in self.budgets:
+            limits = self.overrides.get(ip, {})
+            requests = limits.get("requests", self.requests)
+            nbytes = limits.get("bytes", self.nbytes)
+            self.budgets[ip] = Budget(requests, nbytes, limits.get("burst", self.burst)) if requests or nbytes else None
+        return self.budgets[ip]
+
+    async def acquire(self, ip: str, requests: float = 1, nbytes: float = 0, bounded: bool = True) -> float:
+        """Wait until the controller budget allows the call, returns the
+        seconds waited. Unbounded callers, background work, always wait."""
+        budget = self._budget(ip)
+        if budget is None:
+            return 0.0
+        now = time.monotonic()
+        delay = 0.0
+        if budget.requests:
+            delay = budget.requests.delay(requests, now)
+        if budget.bytes and nbytes:
+            delay = max(delay, budget.bytes.delay(nbytes, now))
+        if bounded and delay > 0 and (delay > self.max_delay or budget.waiting >= self.max_queue):
+            budget.busy += 1
+            raise Busy(f"{ip} is over its budget for the next {delay:.3f}s")
+        if budget.requests:
+            budget.requests.take(requests, now)
+        if budget.bytes and nbytes:
+            budget.bytes.take(nbytes, now)
+        if delay > 0:
+            budget.waiting += 1
+            budget.throttled += 1
+            budget.throttled_seconds += delay
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                budget.waiting -= 1
+        return delay
+
+    def snapshot(self) -> dict:
+        return {ip: x.snapshot() for ip, x in self.budgets.items() if x is not None}
+
+def payload_size(tags: list[str], count: int | None = None, values: list | None = None) -> int:
+    """Rough CIP bytes of reading, or writing values to, some tags, the
+    symbolic path of each plus four bytes an element."""
+    size = 0
+    for idx, tag in enumerate(tags):
+        if values is None:
+            elements = count or 1
+        else:
+            value = values[idx]
+            elements = len(value) if isinstance(value, list) else (len(value) + 3) // 4 if isinstance(value, str) else 1
+        size += len(tag) + 8 + 4 * elements
+    return size
@@ -0,0 +1,238 @@
+import zmq
+import zmq.asyncio
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import itertools
+from collections import deque
+
+from capture import read_capture
+from benchmark import summarize, report, compare, is_success
+
+class Replay:
+    """Sends the requests of a capture to a service again. Every captured
+    client gets a DEALER socket of its own. At a speed the requests go
+    out on the captured schedule, sped up by that factor, whether or not
+    the previous ones were answered. At speed 0 each client sends its
+    next request as soon as the previous one is answered."""
+
+    def __init__(self, url: str, entries: list[dict], speed: float, timeout: float) -> None:
+        self.url = url
+        self.speed = speed
+        self.timeout = timeout
+        self.ctx = zmq.asyncio.Context()
+        self.clients: dict[str, list[dict]] = {}
+        for entry in entries:
+            self.clients.setdefault(entry.get("client", ""), []).append(entry)
+        self.first = min((x["t"] for x in entries), default=0.0)
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.late: list[float] = []
+        self.lost = 0
+        self._ids = itertools.count(1)
+
+    def _prepare(self, entry: dict) -> tuple[str, int, bytes, bool]:
+        """Operation name, request id, encoded request and whether the reply will carry the id."""
+        request_id = next(self._ids)
+        if "request" not in entry:
+            return "malformed", request_id, entry["raw"].encode("utf-8"), False
+        request = entry["request"]
+        if not isinstance(request, dict):
+            return "unknown", request_id, json.dumps(request).encode("utf-8"), False
+        name = request.get("command", None) if isinstance(request.get("command", None), str) else "unknown"
+        return name, request_id, json.dumps({**request, "id": request_id}).encode("utf-8"), True
+
+    async def _receive(self, sock, pending: dict, anonymous: deque):
+        while True:
+            # an Arrow frame may follow the reply
+            _, raw_msg, *_ = await sock.recv_multipart()
+            received = time.perf_counter()
+            reply = json.loads(raw_msg)
+            request_id = reply.get("id", None) if isinstance(reply, dict) else None
+            if request_id not in pending:
+                # malformed requests are answered without an id, in order
+                if not anonymous:
+                    continue
+                request_id = anonymous.popleft()
+            # streamed replies are timed to their last chunk
+            if isinstance(reply, dict) and reply.get("end", True) is False:
+                continue
+            name, sent, future = pending.pop(request_id)
+            self.latencies.setdefault(name, []).append(received - sent)
+            if not is_success(reply.get("msg", None) if isinstance(reply, dict) else None):
+                self.errors[name] = self.errors.get(name, 0) + 1
+            if not future.done():
+                future.set_result(None)
+
+    async def _client(self, entries: list[dict], started: float):
+        sock = self.ctx.socket(zmq.DEALER)
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.connect(self.url)
+        pending: dict[int, tuple] = {}
+        anonymous = deque()
+        receiver = asyncio.ensure_future(self._receive(sock, pending, anonymous))
+        loop = asyncio.get_running_loop()
+        try:
+            for entry in entries:
+                name, request_id, encoded, has_id = self._prepare(entry)
+                if self.speed:
+                    scheduled = started + (entry["t"] - self.first) / self.speed
+                    delay = scheduled - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    self.late.append(max(0.0, time.perf_counter() - scheduled))
+                future = loop.create_future()
+                pending[request_id] = (name, time.perf_counter(), future)
+                if not has_id:
+                    anonymous.append(request_id)
+                await sock.send_multipart([encoded])
+                if not self.speed:
+                    try:
+                        await asyncio.wait_for(asyncio.shield(future), self.timeout)
+                    except asyncio.TimeoutError:
+                        pass
+            # what is still outstanding gets timeout seconds more
+            waiting = [x[2] for x in pending.values()]
+            if waiting:
+                await asyncio.wait(waiting, timeout=self.timeout)
+            self.lost += len(pending)
+        finally:
+            receiver.cancel()
+            sock.close()
+
+    async def run(self) -> dict:
+        started = time.perf_counter()
+        await asyncio.gather(*[self._client(x, started) for x in self.clients.values()])
+        elapsed = time.perf_counter() - started
+        self.ctx.term()
+        everything = [x for latencies in self.latencies.values() for x in latencies]
+        late = sorted(self.late)
+        return {
+            "overall":summarize(everything, sum(self.errors.values()), elapsed),
+            "operations":{
+                name: summarize(self.latencies[name], self.errors.get(name, 0), elapsed)
+                for name in self.latencies
+            },
+            "lost":self.lost,
+            "late":{
+                "mean":sum(late) / len(late) * 1000 if late else 0.0,
+                "max":late[-1] * 1000 if late else 0.0
+            },
+            "elapsed":elapsed
+        }
+
+async def main(args):
+    url = args.server_url or f"tcp://{args.server_address}:{args.server_port}"
+    entries = list(read_capture(args.capture))
+    if args.limit:
+        entries = entries[:args.limit]
+    if not entries:
+        raise SystemExit(f"nothing to replay in {args.capture}")
+    replay = Replay(url, entries, args.speed, args.timeout)
+    result = await replay.run()
+    result.update({
+        "label":args.label,
+        "timestamp":time.time(),
+        "python":platform.python_version(),
+        "parameters":{
+            "capture":args.capture,
+            "requests":len(entries),
+            "clients":len(replay.clients),
+            "captured_seconds":entries[-1]["t"] - replay.first,
+            "speed":args.speed
+        }
+    })
+    report(result)
+    print(f"\n{len(entries)} requests from {len(replay.clients)} clients, {result['lost']} unanswered")
+    if args.speed:
+        print(f"sent behind schedule: mean {result['late']['mean']:.3f} ms, max {result['late']['max']:.3f} ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=4)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(result, baseline, args.max_regression):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="pylogix-as-service-replay",
+        description="Replays traffic captured with --capture against the pylogix as service wrapper."
+    )
+    parser.add_argument(
+        'capture',
+        help="Capture file written by the service, eg. shift.jsonl."
+    )
+    parser.add_argument(
+        '--server-address',
+        dest="server_address",
+        required=False,
+        help="The address the service is bound to, eg. 127.0.0.1."
+    )
+    parser.add_argument(
+        '--server-port',
+        dest="server_port",
+        required=False,
+        help="The port the service listens on, eg. 7777."
+    )
+    parser.add_argument(
+        '--server-url',
+        dest="server_url",
+        default=None,
+        required=False,
+        help="Endpoint of the service instead of address and port, eg. ipc:///tmp/pylogix.ipc."
+    )
+    parser.add_argument(
+        '--speed',
+        dest="speed",
+        type=float,
+        default=1.0,
+        help="Replay the captured schedule this many times faster, eg. 10, or 0 for as fast as replies come back."
+    )
+    parser.add_argument(
+        '--limit',
+        dest="limit",
+        type=int,
+        default=None,
+        help="Replay only the first this many requests."
+    )
+    parser.add_argument(
+        '--timeout',
+        dest="timeout",
+        type=float,
+        default=10,
+        help="Seconds to wait for a reply before counting it as unanswered."
+    )
+    parser.add_argument(
+        '--label',
+        dest="label",
+        default=None,
+        help="Name stored with the results, eg. the version under test."
+    )
+    parser.add_argument(
+        '--output',
+        dest="output",
+        default=None,
+        help="Write the results as JSON to this file."
+    )
+    parser.add_argument(
+        '--compare',
+        dest="compare",
+        default=None,
+        help="Compare against the JSON results of a previous replay of the same capture."
+    )
+    parser.add_argument(
+        '--max-regression',
+        dest="max_regression",
+        type=float,
+        default=None,
+        help="Exit with an error if throughput or a percentile regressed by more than this percentage."
+    )
+    args = parser.parse_args()
+    if not args.server_url and not (args.server_address and args.server_port):
+        parser.error("either --server-url or --server-address and --server-port are required")
+    asyncio.run(main(args=args))
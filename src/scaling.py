@@ -0,0 +1,175 @@
+# numpy is optional, without it the same scaling runs value by value
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# scaling of a tag
+# ----------------------
+# {"linear": {"raw_min": 0, "raw_max": 27648, "eu_min": 0, "eu_max": 100},
+#  "clamp": {"min": 0, "max": 100}}
+# {"poly": [-12.5, 0.03, 1.2e-7], "clamp": {"min": 0}}
+# linear maps the raw span onto the engineering unit span, poly takes
+# the coefficients lowest power first, clamp bounds the result. linear
+# and poly are exclusive, either can be left out to only clamp.
+
+# below this many values a batch is cheaper scaled one by one
+_VECTOR_MIN = 16
+
+class Scaling:
+    """Raw counts to engineering units, a polynomial and optional bounds."""
+
+    def __init__(self, coefficients: list[float], low: float | None = None, high: float | None = None, spec: dict | None = None) -> None:
+        self.coefficients = coefficients
+        self.low = None if low is None else float(low)
+        self.high = None if high is None else float(high)
+        self.spec = spec
+
+    @classmethod
+    def from_dict(cls, spec: dict) -> "Scaling":
+        """Raises ValueError when the spec cannot be applied."""
+        if "linear" in spec and "poly" in spec:
+            raise ValueError("linear and poly are exclusive")
+        coefficients = [0.0, 1.0]
+        if "linear" in spec:
+            linear = spec["linear"]
+            if linear["raw_max"] == linear["raw_min"]:
+                raise ValueError("raw_min and raw_max are equal")
+            gain = (linear["eu_max"] - linear["eu_min"]) / (linear["raw_max"] - linear["raw_min"])
+            coefficients = [linear["eu_min"] - gain * linear["raw_min"], gain]
+        elif "poly" in spec:
+            coefficients = [float(x) for x in spec["poly"]]
+        clamp = spec.get("clamp", None) or {}
+        low, high = clamp.get("min", None), clamp.get("max", None)
+        if low is not None and high is not None and low > high:
+            raise ValueError(f"clamp min {low} is above max {high}")
+        return cls(coefficients, low, high, spec)
+
+    def scalar(self, x) -> float:
+        result = 0.0
+        for c in reversed(self.coefficients):
+            result = result * x + c
+        if self.low is not None and result < self.low:
+            result = self.low
+        if self.high is not None and result > self.high:
+            result = self.high
+        return result
+
+    def vector(self, values: list) -> list | None:
+        """The values scaled, None when they are not all numbers."""
+        if numpy is None or len(values) < _VECTOR_MIN:
+            if not all(type(x) in (int, float) for x in values):
+                return None
+            return [self.scalar(x) for x in values]
+        # bools, strings and Nones make a non numeric array
+        array = numpy.asarray(values)
+        if array.dtype.kind not in "iuf":
+            return None
+        result = numpy.polynomial.polynomial.polyval(array.astype(numpy.float64), self.coefficients)
+        if self.low is not None or self.high is not None:
+            result = numpy.clip(result, self.low, self.high)
+        return result.tolist()
+
+class Scalings:
+    """Scaling of tags by controller ip. A tag is looked up by its full
+    name and then without its array index, so the scaling of an array
+    tag covers its elements too."""
+
+    def __init__(self, config: dict | None = None) -> None:
+        self.tags: dict[str, dict[str, Scaling]] = {}
+        # which results of a list of tags are scaled and their stacked
+        # coefficients, by ip and tag names, the same lists come every cycle
+        self.plans: dict[str, dict[tuple, tuple]] = {}
+        self.scaled = 0
+        config = config or {}
+        # a tag's own scaling over that of its group
+        for group in config.get("tag_groups", []):
+            if "scaling" in group:
+                self.set(group["controller"], group["tags"], group["scaling"])
+        for controller in config.get("controllers", []):
+            for tag, spec in controller.get("scaling", {}).items():
+                self.set(controller["ip"], [tag], spec)
+
+    def set(self, ip: str, tags: list[str], spec: dict | None):
+        """spec None removes the scaling of the tags."""
+        scaling = Scaling.from_dict(spec) if spec is not None else None
+        table = self.tags.setdefault(ip, {})
+        for tag in tags:
+            if scaling is None:
+                table.pop(tag, None)
+            else:
+                table[tag] = scaling
+        self.plans.pop(ip, None)
+
+    def _plan(self, table: dict[str, Scaling], names: tuple) -> tuple:
+        matched = []
+        for idx, name in enumerate(names):
+            scaling = table.get(name, None)
+            if scaling is None and "[" in name:
+                scaling = table.get(name.split("[", 1)[0], None)
+            if scaling is not None:
+                matched.append((idx, scaling))
+        stacked = None
+        if numpy is not None and len(matched) >= _VECTOR_MIN:
+            degree = max(len(x.coefficients) for _, x in matched)
+            stacked = (
+                numpy.array([x.coefficients + [0.0] * (degree - len(x.coefficients)) for _, x in matched], numpy.float64),
+                numpy.array([-numpy.inf if x.low is None else x.low for _, x in matched], numpy.float64),
+                numpy.array([numpy.inf if x.high is None else x.high for _, x in matched], numpy.float64)
+            )
+        return matched, stacked
+
+    def apply(self, ip: str, results: list):
+        """Scale the values of successful read results in place. The
+        numeric scalars of a list are scaled in one pass, each with the
+        coefficients of its own tag, arrays each in one pass."""
+        table = self.tags.get(ip, None)
+        if not table:
+            return
+        names = tuple(x.TagName for x in results)
+        plans = self.plans.setdefault(ip, {})
+        plan = plans.get(names, None)
+        if plan is None:
+            if len(plans) >= 64:
+                plans.clear()
+            plan = plans[names] = self._plan(table, names)
+        matched, stacked = plan
+        # positions in matched of the numeric scalars read this cycle
+        scalars = []
+        for position, (idx, scaling) in enumerate(matched):
+            x = results[idx]
+            if x.Status != "Success":
+                continue
+            if isinstance(x.Value, list):
+                scaled = scaling.vector(x.Value)
+                if scaled is not None:
+                    x.Value = scaled
+                    self.scaled += len(scaled)
+            elif type(x.Value) in (int, float):
+                scalars.append(position)
+        if not scalars:
+            return
+        if stacked is None:
+            for position in scalars:
+                idx, scaling = matched[position]
+                results[idx].Value = scaling.scalar(results[idx].Value)
+        else:
+            coefficients, low, high = stacked
+            if len(scalars) < len(matched):
+                # failed reads and non numbers are left out of this cycle
+                coefficients, low, high = coefficients[scalars], low[scalars], high[scalars]
+            raw = numpy.array([results[matched[x][0]].Value for x in scalars], numpy.float64)
+            value = coefficients[:, -1].copy()
+            for k in range(coefficients.shape[1] - 2, -1, -1):
+                value *= raw
+                value += coefficients[:, k]
+            for position, x in zip(scalars, numpy.clip(value, low, high).tolist()):
+                results[matched[position][0]].Value = x
+        self.scaled += len(scalars)
+
+    def snapshot(self) -> dict:
+        return {
+            "tags":{ip: len(x) for ip, x in self.tags.items()},
+            "vectorized":numpy is not None,
+            "scaled":self.scaled
+        }
@@ -0,0 +1,332 @@
+_TYPES = {
+    "string":  (str,),
+    "integer": (int,),
+    "number":  (int, float),
+    "boolean": (bool,),
+    "null":    (type(None),),
+    "object":  (dict,),
+    "array":   (list,)
+}
+
+# a small json schema subset: type, properties, required, items,
+# prefixItems, minItems, minimum and anyOf
+_SCALAR = {"type": ["string", "integer", "number", "boolean"]}
+
+# request options next to command and msg, shared by every command
+ENVELOPE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "trace": {"type": "boolean"},
+        "stream": {"type": "boolean"},
+        "chunk_size": {"type": "integer", "minimum": 1},
+        # echoed in the response so a client can match replies to requests
+        "id": {"type": ["string", "integer"]},
+        # json, or arrow for read and history, see columnar.py
+        "format": {"type": "string"}
+    }
+}
+
+# engineering unit scaling of a tag, see scaling.py
+SCALING_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "linear": {
+            "type": "object",
+            "properties": {
+                "raw_min": {"type": "number"},
+                "raw_max": {"type": "number"},
+                "eu_min": {"type": "number"},
+                "eu_max": {"type": "number"}
+            },
+            "required": ["raw_min", "raw_max", "eu_min", "eu_max"]
+        },
+        "poly": {"type": "array", "items": {"type": "number"}, "minItems": 1},
+        "clamp": {
+            "type": "object",
+            "properties": {
+                "min": {"type": ["number", "null"]},
+                "max": {"type": ["number", "null"]}
+            }
+        }
+    }
+}
+
+COMMAND_SCHEMAS = {
+    "connect": {
+        "type": "object",
+        "properties": {
+            "ip": {"type": "string"},
+            "slot": {"type": "integer"},
+            "timeout": {"type": "number"},
+            "micro800": {"type": "boolean"},
+            "port": {"type": ["integer", "null"]}
+        },
+        "required": ["ip", "slot", "timeout", "micro800"]
+    },
+    "close": None,
+    "get-connection-size": None,
+    "set-connection-size": {
+        "type": "object",
+        "properties": {
+            "connection_size": {"type": "integer"}
+        },
+        "required": ["connection_size"]
+    },
+    "read": {
+        "anyOf": [
+            {
+                "type": "object",
+                "properties": {
+                    "tag": {"type": "string"},
+                    "count": {"type": ["integer", "null"]},
+                    "datatype": {"type": ["integer", "null"]}
+                },
+                "required": ["tag", "count", "datatype"]
+            },
+            {
+                "type": "object",
+                "properties": {
+                    "tag": {"type": "array", "items": {"type": "string"}},
+                    "count": {"type": "null"},
+                    "datatype": {"type": "null"}
+                },
+                "required": ["tag", "count", "datatype"]
+            }
+        ]
+    },
+    "write": {
+        "anyOf": [
+            {
+                "type": "object",
+                "properties": {
+                    "tag": {"type": "string"},
+                    "value": {"type": ["string", "integer", "number", "boolean", "array"]},
+                    "datatype": {"type": ["integer", "null"]}
+                },
+                "required": ["tag", "value", "datatype"]
+            },
+            {
+                "type": "array",
+                "items": {
+                    "type": "array",
+                    "prefixItems": [{"type": "string"}, _SCALAR],
+                    "minItems": 2
+                }
+            }
+        ]
+    },
+    "get-plc-time": {
+        "type": "object",
+        "properties": {
+            "raw": {"type": "boolean"},
+            "live": {"type": "boolean"}
+        },
+        "required": ["raw"]
+    },
+    "set-plc-time": None,
+    "get-tag-list": {
+        "type": "object",
+        "properties": {
+            "all_tags": {"type": "boolean"}
+        },
+        "required": ["all_tags"]
+    },
+    "get-program-tag-list": {
+        "type": "object",
+        "properties": {
+            "program_name": {"type": "string"}
+        },
+        "required": ["program_name"]
+    },
+    "get-programs-list": None,
+    "discover": {
+        "type": ["object", "null"],
+        "properties": {
+            "live": {"type": "boolean"}
+        }
+    },
+    "get-module-properties": {
+        "type": "object",
+        "properties": {
+            "slot": {"type": "integer"}
+        },
+        "required": ["slot"]
+    },
+    "get-device-properties": None,
+    "history": {
+        "type": "object",
+        "properties": {
+            "tag": {"anyOf": [{"type": ["string", "null"]}, {"type": "array", "items": {"type": "string"}}]},
+            "start": {"type": ["number", "null"]},
+            "end": {"type": ["number", "null"]},
+            "limit": {"type": ["integer", "null"]},
+            "ip": {"type": ["string", "null"]}
+        },
+        "required": ["tag", "start", "end"]
+    },
+    "stats": None,
+    "ready": None,
+    "scan-chassis": {
+        "type": ["object", "null"],
+        "properties": {
+            "slots": {"type": ["integer", "null"], "minimum": 1},
+            "concurrency": {"type": ["integer", "null"], "minimum": 1},
+            "refresh": {"type": "boolean"}
+        }
+    },
+    "find-tags": {
+        "type": "object",
+        "properties": {
+            "prefix": {"type": ["string", "null"]},
+            "glob": {"type": ["string", "null"]},
+            "datatype": {"type": ["string", "null"]},
+            "array": {"type": ["boolean", "null"]},
+            "struct": {"type": ["boolean", "null"]},
+            "program": {"type": ["string", "null"]},
+            "offset": {"type": ["integer", "null"], "minimum": 0},
+            "limit": {"type": ["integer", "null"], "minimum": 1},
+            "refresh": {"type": "boolean"}
+        }
+    },
+    "set-scaling": {
+        "type": "object",
+        "properties": {
+            "tag": {"anyOf": [{"type": "string"}, {"type": "array", "items": {"type": "string"}}]},
+            # null removes the scaling of the tags
+            "scaling": {**SCALING_SCHEMA, "type": ["object", "null"]}
+        },
+        "required": ["tag", "scaling"]
+    }
+}
+
+def _type_name(value) -> str:
+    for name, types in _TYPES.items():
+        if type(value) in types and not (name in ("integer", "number") and isinstance(value, bool)):
+            return name
+    return type(value).__name__
+
+def _compile_type(names):
+    names = [names] if isinstance(names, str) else list(names)
+    types = tuple(t for x in names for t in _TYPES[x])
+    # bool is an int subclass, only accept it when asked for
+    allow_bool = "boolean" in names
+    expected = " or ".join(names)
+
+    def check(value, path, errors):
+        if not isinstance(value, types) or (isinstance(value, bool) and not allow_bool):
+            errors.append({"field": path, "error": f"expected {expected}, got {_type_name(value)}"})
+            return False
+        return True
+    check.types = types
+    return check
+
+def compile_schema(schema: dict):
+    """Turn a schema into a function(value, path, errors) that appends
+    {"field", "error"} details and returns True when the value is valid.
+    Done once, so nothing is rebuilt per request."""
+    if "anyOf" in schema:
+        branches = [compile_schema(x) for x in schema["anyOf"]]
+
+        def any_of(value, path, errors):
+            candidates = []
+            for branch in branches:
+                container = []
+                if branch(value, path, container):
+                    return True
+                candidates.append(container)
+            # report the branch that came closest to matching, fewest
+            # errors first and then the one that got deepest
+            errors.extend(min(candidates, key=lambda x: (len(x), -max(len(e["field"]) for e in x))))
+            return False
+        return any_of
+
+    type_check = _compile_type(schema["type"]) if "type" in schema else None
+    checks = []
+
+    if "properties" in schema:
+        required = tuple(schema.get("required", []))
+        properties = tuple((k, compile_schema(v)) for k, v in schema["properties"].items())
+
+        def object_check(value, path, errors):
+            ok = True
+            for key in required:
+                if key not in value:
+                    errors.append({"field": f"{path}.{key}" if path else key, "error": "required"})
+                    ok = False
+            for key, check in properties:
+                if key in value and not check(value[key], f"{path}.{key}" if path else key, errors):
+                    ok = False
+            return ok
+        checks.append((dict, object_check))
+
+    if "minimum" in schema:
+        minimum = schema["minimum"]
+
+        def minimum_check(value, path, errors):
+            if value < minimum:
+                errors.append({"field": path, "error": f"expected at least {minimum}"})
+                return False
+            return True
+        checks.append(((int, float), minimum_check))
+
+    if "prefixItems" in schema or "minItems" in schema:
+        prefix = tuple(compile_schema(x) for x in schema.get("prefixItems", []))
+        min_items = schema.get("minItems", 0)
+
+        def tuple_check(value, path, errors):
+            if len(value) < min_items:
+                errors.append({"field": path, "error": f"expected at least {min_items} items"})
+                return False
+            ok = True
+            for idx, check in enumerate(prefix[:len(value)]):
+                if not check(value[idx], f"{path}[{idx}]", errors):
+                    ok = False
+            return ok
+        checks.append((list, tuple_check))
+
+    if "items" in schema:
+        items = schema["items"]
+        item_check = compile_schema(items)
+        types = getattr(item_check, "types", None)
+
+        def items_check(value, path, errors):
+            # long tag lists are the common case, check them in one pass first
+            if types is not None and all(type(x) in types for x in value):
+                return True
+            ok = True
+            for idx, x in enumerate(value):
+                if not item_check(x, f"{path}[{idx}]", errors):
+                    ok = False
+            return ok
+        checks.append((list, items_check))
+
+    def check(value, path, errors):
+        if type_check is not None and not type_check(value, path, errors):
+            return False
+        ok = True
+        for kind, func in checks:
+            if isinstance(value, kind) and not func(value, path, errors):
+                ok = False
+        return ok
+    if type_check is not None and not checks:
+        check.types = type_check.types
+    return check
+
+def compile_command_schemas(schemas: dict = COMMAND_SCHEMAS) -> dict:
+    """command -> function(payload) returning a list of errors,
+    empty when the request is well formed."""
+    validators = {}
+    envelope_check = compile_schema(ENVELOPE_SCHEMA)
+    for command, schema in schemas.items():
+        msg_check = compile_schema(schema if schema is not None else {})
+
+        def validate(payload, msg_check=msg_check):
+            errors = []
+            envelope_check(payload, "", errors)
+            if "msg" not in payload:
+                errors.append({"field": "msg", "error": "required"})
+            else:
+                msg_check(payload["msg"], "msg", errors)
+            return errors
+        validators[command] = validate
+    return validators
@@ -1,22 +1,109 @@
+import os
 import zmq
 import zmq.asyncio
 import json
+import time
 import asyncio
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 from pylogix import PLC
+from pylogix.lgx_response import Response
 
-from logger import log_exception
+from logger import log_exception, log_stats
 from mock import MockPLC
+from metrics import Metrics
+from tagindex import TagIndex
+from discovery import Discovery
+from plcclock import PLCClock
+from poller import Poller, TagGroup
+from ratelimit import RateLimiter, Busy, payload_size
+from watchdog import Watchdog
+from scaling import Scalings
+import columnar
+from config import controller_defaults, poll_bounds
+from schema import compile_command_schemas
+from transport import bind
+from tracing import Trace, current_trace
 
 class Service:
-    def __init__(self, url, simulate=False) -> None:
+    def __init__(self, url, simulate=False, historian=None, thread_pool_size=None, mock_config=None, stream_chunk_size=1000,
+                 discover_interval=None, discover_events=None, chassis_cache_ttl=60, clock_sample_interval=60, recv_batch=64,
+                 socket_options=None, ctx=None, latest=None, config=None, rate_limiter=None,
+                 watchdog=None, capture=None) -> None:
         self.plc = None
+        self.connect_params = None
         self.simulate_plc = simulate
-        self.ctx = zmq.asyncio.Context()
+        self.mock_config = mock_config
+        self.historian = historian
+        # shared memory table of the latest value of every tag read
+        self.latest = latest
+        # every request answered appended to a file for replay
+        self.capture = capture
+        # browse indexes by controller ip, built from a full tag list upload
+        self.tag_indexes: dict[str, TagIndex] = {}
+        self.tag_index_lock = asyncio.Lock()
+        # rack inventories by controller ip, (scanned at, slot count, value)
+        self.chassis_cache: dict[str, tuple[float, int, dict]] = {}
+        self.chassis_cache_ttl = chassis_cache_ttl
+        # controller clock estimates by ip, get-plc-time is answered from these
+        self.clocks: dict[str, PLCClock] = {}
+        self.clock_sample_interval = clock_sample_interval
+        # the background sampler's own sessions by controller ip, (connect params, plc),
+        # a plc object is not safe to share with the requests running on self.plc
+        self.clock_sessions: dict[str, tuple[dict, object]] = {}
+        # startup config, controllers are connected and their caches
+        # primed in the background, see ready
+        self.config = config or {}
+        self.chassis_cache_ttl = self.config.get("caches", {}).get("chassis_ttl", self.chassis_cache_ttl)
+        # prewarmed sessions by controller ip, a CONNECT to the same target reuses them
+        self.sessions: dict[str, tuple[dict, object]] = {}
+        self.readiness: dict[str, dict] = {
+            x["ip"]: {"state":"pending", "required":x.get("required", True), "error":None, "duration":None}
+            for x in self.config.get("controllers", [])
+        }
+        # tag groups are polled on sessions of their own, one per controller
+        self.poll_params = {x["ip"]: x for x in self.config.get("controllers", [])}
+        self.poll_sessions: dict[str, object] = {}
+        self.poll_locks: dict[str, asyncio.Lock] = {}
+        scan_classes = self.config.get("scan_classes", {})
+        groups = [
+            TagGroup(x["name"], x["controller"], x["scan_class"], scan_classes[x["scan_class"]]["period"], x["tags"],
+                     **poll_bounds(scan_classes[x["scan_class"]], x))
+            for x in self.config.get("tag_groups", [])
+        ]
+        self.tag_poller = Poller(groups, self._poll) if groups else None
+        # engineering unit scaling applied to read results, from the
+        # config and set-scaling
+        self.scalings = Scalings(self.config)
+        # budgets of CIP requests and bytes per controller, unlimited by default
+        self.limiter = rate_limiter or RateLimiter()
+        self.thread_pool_size = thread_pool_size or min(32, (os.cpu_count() or 1) + 4)
+        self.executor = ThreadPoolExecutor(max_workers=self.thread_pool_size)
+        self.metrics = Metrics(self.thread_pool_size)
+        # loop lag and stall detection, only marks stages unless given a threshold
+        self.watchdog = watchdog or Watchdog()
+        self.watchdog.metrics = self.metrics
+        # url is one endpoint or a list of them, an embedding application
+        # passes its own context so it can reach inproc:// endpoints
+        self.ctx = ctx or zmq.asyncio.Context()
         self.sock = self.ctx.socket(zmq.ROUTER)
-        self.sock.setsockopt(zmq.LINGER, 0)
-        self.sock.bind(url)
+        bind(self.sock, url, socket_options)
+        # the same socket without the asyncio wrapper, for draining what is already queued
+        self.raw_sock = zmq.Socket.shadow(self.sock.underlying)
+        self.recv_batch = recv_batch
+        # replies of the current batch not sent yet
+        self.replies = []
         self.poller = zmq.asyncio.Poller()
         self.poller.register(self.sock, zmq.POLLIN)
+        self.events_sock = None
+        if discover_events:
+            self.events_sock = self.ctx.socket(zmq.PUB)
+            bind(self.events_sock, discover_events)
+        self.discovery = Discovery(
+            self._sweep,
+            interval=discover_interval,
+            publish=self._publish_event if self.events_sock else None
+        )
         self.command_lookup = {
             "connect":               self._connect,
             "close":                 self._close,
@@ -31,99 +118,470 @@ class Service:
             "get-programs-list":     self._get_programs_list,
             "discover":              self._discover,
             "get-module-properties": self._get_module_properties,
-            "get-device-properties": self._get_device_properties
+            "get-device-properties": self._get_device_properties,
+            "history":               self._history,
+            "stats":                 self._stats,
+            "find-tags":             self._find_tags,
+            "scan-chassis":          self._scan_chassis,
+            "ready":                 self._ready,
+            "set-scaling":           self._set_scaling
+        }
+        # commands that can answer in chunks when the request sets stream
+        self.stream_lookup = {
+            "get-tag-list":          (self._sync_get_tag_list, self._tag_dict),
+            "get-program-tag-list":  (self._sync_get_program_tag_list, self._tag_dict),
+            "discover":              (self._discover_devices, lambda x: x)
         }
+        self.stream_chunk_size = stream_chunk_size
+        # compiled once, checked before dispatch
+        self.validators = compile_command_schemas()
         self.responses = {
             "UNKNOWN": "Unknown Command",
             "BAD_FORMAT": "Bad Message Format",
             "ERROR": "Internal Server Error",
             "NO_CONNECTION": "No Route To Provider",
+            "DISABLED": "Feature Not Enabled",
+            "BUSY": "Controller Busy",
             "SUCCESS": "Success"
         }
+        self.status_keys = {v: k for k, v in self.responses.items()}
         self.no_connection_msg = {
             "name":None,
             "value":None,
             "status":self.responses["NO_CONNECTION"]
         }
+        self.busy_msg = {
+            "name":None,
+            "value":None,
+            "status":self.responses["BUSY"]
+        }
+
+    def close(self):
+        """Release the sockets and the thread pool once start() has returned."""
+        if self.plc:
+            self.plc.Close()
+        for plc in [x[1] for x in self.sessions.values()] + [x[1] for x in self.clock_sessions.values()] \
+                + list(self.poll_sessions.values()):
+            plc.Close()
+        self.sock.close()
+        if self.events_sock:
+            self.events_sock.close()
+        self.executor.shutdown(wait=False)
+        if self.historian:
+            self.historian.close()
+        if self.latest:
+            self.latest.close()
+        if self.capture:
+            self.capture.close()
 
     async def start(self):
+        asyncio.get_running_loop().set_default_executor(self.executor)
+        # named, the watchdog blames a stall on the task running
+        if self.watchdog.threshold:
+            self.watchdog_task = asyncio.create_task(self.watchdog.run(), name="watchdog")
+        if self.discovery.interval:
+            self.discovery_task = asyncio.create_task(self.discovery.run(), name="discovery")
+        if self.clock_sample_interval:
+            self.clock_task = asyncio.create_task(self._sample_clocks(), name="clock-sampling")
+        if self.readiness:
+            self.prewarm_task = asyncio.create_task(self._prewarm(), name="prewarm")
+        if self.tag_poller:
+            self.poll_task = asyncio.create_task(self.tag_poller.run(), name="poller")
         while True:
             events = await self.poller.poll()
+            woke = time.perf_counter()
             if self.sock in dict(events):
-                try: 
+                # handle everything already queued on this wake-up and
+                # send the replies together once the batch is done, or
+                # earlier when a request goes to the thread pool
+                batch = self._drain()
+                self.metrics.observe_batch(len(batch))
+                for frames in batch:
+                    await self._handle(frames, woke, self.replies)
+                self._send_batch(self.replies)
+                self.watchdog.mark(None, "idle")
 
-                    # try to receive the request
-                    # ----------------------
-                    consumer_id, raw_msg = await self.sock.recv_multipart()
-                    decoded_msg = json.loads(raw_msg.decode("utf-8"))
+    def _drain(self):
+        """Non blocking receives until the socket is empty or the batch is full."""
+        batch = []
+        while len(batch) < self.recv_batch:
+            try:
+                batch.append(self.raw_sock.recv_multipart(zmq.NOBLOCK))
+            except zmq.Again:
+                break
+        return batch
 
-                    # try to process the request
-                    # ----------------------
-                    response = await self._process(decoded_msg)
+    def _send_batch(self, replies):
+        self.watchdog.mark(None, "send")
+        for frames, command, response, received in replies:
+            self.raw_sock.send_multipart(frames, zmq.NOBLOCK)
+            if received is not None:
+                self._observe(command, response, received)
+        replies.clear()
 
-                    # try to reply to the request
-                    # -----------------------
-                    encoded = json.dumps(response).encode("utf-8")
-                    await self.sock.send_multipart([consumer_id, b'', encoded])
+    async def _handle(self, frames, woke, replies):
+        """Process one request, its reply is appended to replies."""
+        # routing frames, more than one when behind a front end
+        *consumer_id, raw_msg = frames
+        command = "unknown"
+        received = time.perf_counter()
+        trace_token = None
+        request_id = None
+        valid = False
+        encoded = None
+        try: 
+
+            # try to decode the request
+            # ----------------------
+            self.metrics.in_flight += 1
+            self.watchdog.mark(None, "receive_decode")
+            decoded_msg = json.loads(raw_msg.decode("utf-8"))
+            valid = True
+            if isinstance(decoded_msg, dict):
+                request_id = decoded_msg.get("id", None)
+                if decoded_msg.get("command", None) in self.command_lookup:
+                    command = decoded_msg["command"]
+                if decoded_msg.get("trace", False) is True:
+                    trace_token = current_trace.set(Trace(woke))
+                    # the earlier requests of the batch were handled meanwhile
+                    current_trace.get().lap("queue_wait", received)
+                    current_trace.get().lap("receive_decode")
 
+            # stream the reply in chunks when asked to
+            # ----------------------
+            if isinstance(decoded_msg, dict) and decoded_msg.get("stream", False) is True \
+                    and command in self.stream_lookup:
+                # earlier replies of the batch go first, a consumer may have several in it
+                self._send_batch(replies)
+                seq = 0
+                try:
+                    async for response in self._stream(decoded_msg):
+                        if request_id is not None:
+                            response["id"] = request_id
+                        self.watchdog.mark(command, "encode")
+                        encoded = json.dumps(response).encode("utf-8")
+                        await self.sock.send_multipart([*consumer_id, b'', encoded])
+                        seq = response["seq"] + 1
+                        # sending returns at once while the socket has room,
+                        # let the rest of the loop run between chunks
+                        await asyncio.sleep(0)
                 except Exception as e:
                     await log_exception(
-                        message="failed in main loop",
+                        message="failed while streaming",
                         payload=None,
                         exception=e
                     )
-                    encoded = json.dumps({
-                        "name":None,
-                        "value":None,
-                        "status":self.responses["ERROR"]
-                    }).encode("utf-8")
-                    await self.sock.send_multipart([
-                        consumer_id,
-                        b'',
-                        encoded
-                    ])
+                    # the consumer may hold chunks already, end the stream with the error
+                    response = {
+                        "command":command,
+                        "seq":seq,
+                        "end":True,
+                        "msg":{
+                            "name":None,
+                            "value":None,
+                            "status":self.responses["ERROR"]
+                        }
+                    }
+                    if request_id is not None:
+                        response["id"] = request_id
+                    encoded = json.dumps(response).encode("utf-8")
+                    await self.sock.send_multipart([*consumer_id, b'', encoded])
+                self._observe(command, response, received)
+                # a streamed reply is captured as its last chunk
+                return
+
+            # try to process the request
+            # ----------------------
+            self.watchdog.mark(command, "process")
+            response = await self._process(decoded_msg)
+            # error replies are not the request envelope, they get the id added
+            if request_id is not None:
+                response["id"] = request_id
+            if trace_token is not None:
+                current_trace.get().lap("result_conversion")
+                response.pop("trace", None)
+
+            # queue the reply
+            # -----------------------
+            self.watchdog.mark(command, "encode")
+            frame = response.pop(columnar.FRAME, None) if isinstance(response, dict) else None
+            encoded = json.dumps(response).encode("utf-8")
+            encoded = self._append_trace(response, encoded)
+            replies.append(([*consumer_id, b'', encoded] + ([frame] if frame is not None else []), command, response, received))
+
+        except Exception as e:
+            await log_exception(
+                message="failed in main loop",
+                payload=None,
+                exception=e
+            )
+            response = {
+                "name":None,
+                "value":None,
+                "status":self.responses["ERROR"]
+            }
+            if request_id is not None:
+                response["id"] = request_id
+            encoded = json.dumps(response).encode("utf-8")
+            replies.append(([*consumer_id, b'', encoded], command, response, received))
+        finally:
+            if trace_token is not None:
+                current_trace.reset(trace_token)
+            if self.capture:
+                duration = time.perf_counter() - received
+                self.capture.record(consumer_id, raw_msg, valid, time.time() - duration, duration, encoded)
+
+    def _append_trace(self, response, encoded):
+        """Splice the timing breakdown into the already encoded
+        response, so the encode stage can be part of it."""
+        trace = current_trace.get()
+        if trace is None or not isinstance(response, dict):
+            return encoded
+        trace.lap("encode")
+        return encoded[:-1] + b', "trace": ' + json.dumps(trace.to_dict()).encode("utf-8") + b'}'
+
+    def _observe(self, command, response, received):
+        """Record the request in the metrics once it has been replied to."""
+        msg = response.get("msg", response) if isinstance(response, dict) else None
+        if isinstance(msg, list):
+            statuses = [x.get("status", None) for x in msg if isinstance(x, dict)]
+            status = next((x for x in statuses if x != self.responses["SUCCESS"]), self.responses["SUCCESS"])
+        elif isinstance(msg, dict):
+            status = msg.get("status", None)
+        else:
+            status = None
+        self.metrics.observe_request(
+            command,
+            self.plc.IPAddress if self.plc else "",
+            self.status_keys.get(status, str(status)),
+            time.perf_counter() - received
+        )
+        self.metrics.in_flight -= 1
+
+    async def _run_sync(self, func, *args):
+        """Run a blocking call on the thread pool, keeping
+        track of how busy the pool is."""
+        trace = current_trace.get()
+        if trace:
+            trace.lap("validation")
+        # replies already made do not wait for this one to come back
+        if self.replies:
+            self._send_batch(self.replies)
+        self.metrics.thread_submitted()
+        res = await asyncio.to_thread(self._run_in_thread, func, *args)
+        if trace:
+            trace.lap("thread_handoff")
+        return res
+
+    def _run_in_thread(self, func, *args):
+        trace = current_trace.get()
+        if trace:
+            trace.lap("thread_handoff")
+        self.metrics.thread_started()
+        try:
+            return func(*args)
+        finally:
+            self.metrics.thread_finished()
+            if trace:
+                trace.lap("plc_io")
 
     async def _process(self, payload):
+        trace = current_trace.get()
+        if trace:
+            trace.lap("queue_wait")
+        if not isinstance(payload, dict) or "command" not in payload:
+            return await self._bad_format([{"field": "command", "error": "required"}])
+        process_func = self.command_lookup.get(payload["command"], None)
+        if not process_func:
+            return await self._unknown()
+        errors = self.validators[payload["command"]](payload)
+        if trace:
+            trace.lap("validation")
+        if errors:
+            return await self._bad_format(errors)
+        output_format = payload.get("format", "json")
+        if output_format != "json":
+            if output_format != "arrow" or payload["command"] not in ["read", "history"]:
+                return await self._bad_format([{"field": "format", "error": "json, or arrow for read and history"}])
+            if not columnar.available():
+                payload["msg"] = {
+                    "name":None,
+                    "value":None,
+                    "status":self.responses["DISABLED"]
+                }
+                return payload
+        cost = self._cost(payload["command"], payload["msg"]) if self.plc else None
+        if cost:
+            try:
+                await self._throttle(self.plc.IPAddress, *cost)
+            except Busy:
+                payload["msg"] = self.busy_msg
+                return payload
+            if trace:
+                trace.lap("rate_limit")
+        return await process_func(payload)
+
+    def _cost(self, command, msg):
+        """Estimated (CIP requests, bytes) a command sends the connected
+        plc, None for the ones answered without talking to it."""
+        if command == "read":
+            tags = msg["tag"] if isinstance(msg["tag"], list) else [msg["tag"]]
+            nbytes = payload_size(tags, count=msg["count"])
+        elif command == "write":
+            pairs = msg if isinstance(msg, list) else [(msg["tag"], msg["value"])]
+            nbytes = payload_size([x[0] for x in pairs], values=[x[1] for x in pairs])
+        elif command in ["set-plc-time", "get-tag-list", "get-program-tag-list", "get-programs-list",
+                         "get-module-properties", "get-device-properties"]:
+            return 1, 0
+        elif command == "get-plc-time":
+            # a stale estimate is sampled from the plc like a live read
+            if msg.get("live", False) or not self._clock(self.plc.IPAddress).fresh():
+                return 1, 0
+            return None
+        elif command == "find-tags":
+            # the tag list is uploaded the first time and on refresh
+            if msg.get("refresh", False) or self.plc.IPAddress not in self.tag_indexes:
+                return 1, 0
+            return None
+        else:
+            return None
+        # pylogix packs as much as fits the connection size into each request
+        return -(-nbytes // self.plc.ConnectionSize), nbytes
+
+    async def _throttle(self, ip, requests=1, nbytes=0, bounded=True):
         try:
-            assert "command" in payload
-            process_func = self.command_lookup.get(payload["command"], None)
-            if process_func:
-                return await process_func(payload)
-            else:
-                return await self._unknown(payload)
-        except AssertionError:
-            return await self._bad_format()
+            waited = await self.limiter.acquire(ip, requests, nbytes, bounded)
+        except Busy:
+            self.metrics.observe_busy(ip)
+            raise
+        if waited:
+            self.metrics.observe_throttle(ip, waited)
 
-    async def _bad_format(self):
+    async def _bad_format(self, errors=None):
+        """The value lists every field that failed validation."""
         msg = {
             "name":None,
-            "value":None,
+            "value":errors,
             "status":self.responses["BAD_FORMAT"]
         }
         return msg
 
-    async def _assert_root_msg(self, payload):
-        assert all([
-            payload,
-            isinstance(payload, dict),
-            "command" in payload,
-            "msg" in payload
-        ])
+    async def _unknown(self):
+        msg = {
+            "name":None,
+            "value":None,
+            "status":self.responses["UNKNOWN"]
+        }
+        return msg
+
+    def _tag_dict(self, x):
+        return {
+            "TagName":x.TagName,
+            "InstanceID":x.InstanceID,
+            "SymbolType":x.SymbolType,
+            "DataTypeValue":x.DataTypeValue,
+            "DataType":x.DataType,
+            "Array":x.Array,
+            "Struct":x.Struct,
+            "Size":x.Size,
+            "AccessRight":x.AccessRight,
+            "Internal":x.Internal,
+            "Meta":x.Meta,
+            "Scope0":x.Scope0,
+            "Scope1":x.Scope1,
+            "Bytes":x.Bytes
+        }
+
+    def _device_dict(self, x):
+        return {
+            "Length":x.Length,
+            "EncapsulationVersion":x.EncapsulationVersion,
+            "IPAddress":x.IPAddress,
+            "VendorID":x.VendorID,
+            "Vendor":x.Vendor,
+            "DeviceID":x.DeviceID,
+            "DeviceType":x.DeviceType,
+            "ProductCode":x.ProductCode,
+            "Revision":x.Revision,
+            "Status":x.Status,
+            "SerialNumber":x.SerialNumber,
+            "ProductNameLength":x.ProductNameLength,
+            "ProductName":x.ProductName,
+            "State":x.State
+        }
+
+    # streaming
+    # ----------------------
+    async def _stream(self, payload):
+        """Yield the reply to a streamed request as numbered chunks,
+        each converted only when it is about to be sent. The last
+        chunk has end set and carries the total count."""
+        command = payload["command"]
+        errors = self.validators[command](payload)
+        if errors:
+            yield {"command":command, "seq":0, "end":True, "msg":await self._bad_format(errors)}
+            return
+        fetch, convert = self.stream_lookup[command]
+        # plain functions talk to the plc on the thread pool, coroutines need no connection
+        on_plc = not asyncio.iscoroutinefunction(fetch)
+        if on_plc and not self.plc:
+            yield {"command":command, "seq":0, "end":True, "msg":self.no_connection_msg}
+            return
+        if on_plc:
+            try:
+                await self._throttle(self.plc.IPAddress)
+            except Busy:
+                yield {"command":command, "seq":0, "end":True, "msg":self.busy_msg}
+                return
+        chunk_size = payload.get("chunk_size", None) or self.stream_chunk_size
+        try:
+            if on_plc:
+                res = await self._run_sync(fetch, payload["msg"])
+            else:
+                res = await fetch(payload["msg"])
+        except Exception as e:
+            await log_exception(
+                message=f"failed to stream {command}.",
+                payload=payload,
+                exception=e
+            )
+            raise e
+        if isinstance(res.Value, list):
+            values = res.Value
+        else:
+            values = [res.Value] if res.Value is not None else []
+        seq = 0
+        for idx in range(0, len(values), chunk_size):
+            self.watchdog.mark(command, "result_conversion")
+            yield {
+                "command":command,
+                "seq":seq,
+                "end":False,
+                "msg":{
+                    "name":res.TagName,
+                    "value":[convert(x) for x in values[idx:idx + chunk_size]],
+                    "status":res.Status
+                }
+            }
+            seq += 1
+        yield {
+            "command":command,
+            "seq":seq,
+            "end":True,
+            "count":len(values),
+            "msg":{
+                "name":res.TagName,
+                "value":[],
+                "status":res.Status
+            }
+        }
 
     # connect
     # ----------------------
     async def _connect(self, payload):
         """Initialize our parameters."""
         try:
-            await self._assert_root_msg(payload)
-            assert all([
-                "ip" in payload["msg"],
-                "slot" in payload["msg"],
-                "timeout" in payload["msg"],
-                "micro800" in payload["msg"]
-            ])
-
-            await asyncio.to_thread(self._sync_connect, self.simulate_plc, payload["msg"])
+            await self._run_sync(self._sync_connect, self.simulate_plc, payload["msg"])
 
             msg = {
                 "name":None,
@@ -132,8 +590,6 @@ class Service:
             }
             payload["msg"] = msg
             return payload
-        except AssertionError:
-            return await self._bad_format()
         except Exception as e:
             await log_exception(
                 message="failed to connect to the plc",
@@ -143,12 +599,23 @@ class Service:
             raise e
 
     def _sync_connect(self, simulate, payload):
+        warm = self.sessions.get(payload["ip"], None)
+        if warm and all(warm[0].get(k, None) == payload.get(k, None) for k in ["slot", "micro800", "port"]):
+            plc = warm[1]
+            plc.SocketTimeout = payload["timeout"]
+        else:
+            plc = self._make_plc(simulate, payload)
+        self.plc = plc
+        self.connect_params = payload
+
+    def _make_plc(self, simulate, payload):
         if simulate:
             plc = MockPLC(
                     ip_address=payload["ip"],
                     slot=payload["slot"],
                     timeout=payload["timeout"],
-                    Micro800=payload["micro800"]
+                    Micro800=payload["micro800"],
+                    config=self.mock_config
             )
         else:
             plc = PLC(
@@ -157,16 +624,18 @@ class Service:
                     timeout=payload["timeout"],
                     Micro800=payload["micro800"]
             )
-        self.plc = plc
+            # lets the service talk to a stand-in listening on a non standard port
+            if payload.get("port", None) is not None:
+                plc.conn.Port = int(payload["port"])
+        return plc
 
     # get connection size
     # ----------------------
     async def _get_connection_size(self, payload):
         """ Returns the ConnectionSize value."""
         try:
-            await self._assert_root_msg(payload)
             if self.plc:
-                connection_size = await asyncio.to_thread(self._sync_get_connection_size)
+                connection_size = await self._run_sync(self._sync_get_connection_size)
                 msg = {
                     "name":None,
                     "value":connection_size,
@@ -176,8 +645,6 @@ class Service:
                 msg = self.no_connection_msg
             payload["msg"] = msg
             return payload
-        except AssertionError:
-            return await self._bad_format()
         except Exception as e:
             await log_exception(
                 message="failed to get connection size.",
@@ -198,13 +665,8 @@ class Service:
         If an Explicit (Unconnected) session is used, 
         picks a sensible default."""
         try:
-            await self._assert_root_msg(payload)
-            assert all([
-                "connection_size" in payload["msg"]
-            ])
-
             if self.plc:
-                await asyncio.to_thread(self._sync_set_connection_size, payload["msg"])
+                await self._run_sync(self._sync_set_connection_size, payload["msg"])
             else:
                 pass
 
@@ -215,8 +677,6 @@ class Service:
             }
             payload["msg"] = msg
             return payload
-        except AssertionError:
-            return await self._bad_format()
         except Exception as e:
             await log_exception(
                 message="failed to get connection size.",
@@ -234,28 +694,15 @@ class Service:
         """We have two options for reading depending on
         the arguments, read a single tag, or read an array"""
         try:
-            await self._assert_root_msg(payload)
-            assert all([
-                "tag" in payload["msg"],
-                "count" in payload["msg"],
-                "datatype" in payload["msg"]
-            ])
-            if isinstance(payload["msg"]["tag"], list):
-                assert all([
-                    payload["msg"]["count"] == None,
-                    payload["msg"]["datatype"] == None
-                ])
-                for x in payload["msg"]["tag"]:
-                    assert isinstance(x, str)
-            else:
-                assert all([
-                    "tag" in payload["msg"],
-                    "count" in payload["msg"],
-                    "datatype" in payload["msg"]
-                ])
-
-            if self.plc:
-                res = await asyncio.to_thread(self._sync_read, payload["msg"])
+            if self.plc and payload.get("format", None) == "arrow":
+                payload[columnar.FRAME], rows = await self._run_sync(self._sync_read_frame, payload["msg"])
+                msg = {
+                    "name":None,
+                    "value":{"rows":rows, "columns":columnar.COLUMNS},
+                    "status":self.responses["SUCCESS"]
+                }
+            elif self.plc:
+                res = await self._run_sync(self._sync_read, payload["msg"])
                 if isinstance(res, list):
                     container = []
                     for x in res:
@@ -276,8 +723,6 @@ class Service:
 
             payload["msg"] = msg
             return payload
-        except AssertionError:
-            return await self._bad_format()
         except Exception as e:
             await log_exception(
                 message="failed to read from the target plc",
@@ -295,7 +740,69 @@ class Service:
             tag      = payload.get("tag", None)
             count    = payload.get("count", None)
             datatype = payload.get("datatype", None)
-        return self.plc.Read(tag=tag, count=count, datatype=datatype)
+        res = self.plc.Read(tag=tag, count=count, datatype=datatype)
+        results = res if isinstance(res, list) else [res]
+        # scaled before anything is recorded or encoded
+        self.scalings.apply(self.plc.IPAddress, results)
+        if self.historian or self.latest:
+            self._record(self.plc.IPAddress, [(x.TagName, x.Value, x.Status) for x in results])
+        return res
+
+    def _sync_read_frame(self, payload):
+        """The read results as an Arrow frame and its row count, encoded here off the event loop."""
+        res = self._sync_read(payload)
+        res = res if isinstance(res, list) else [res]
+        timestamp = self._stamp(self.plc.IPAddress) or time.time()
+        frame = columnar.encode(
+            [x.TagName for x in res],
+            [timestamp] * len(res),
+            [x.Value for x in res],
+            [x.Status for x in res]
+        )
+        return frame, len(res)
+
+    def _stamp(self, ip):
+        """Controller time once its clock is known, otherwise None."""
+        clock = self.clocks.get(ip, None)
+        return clock.now() if clock else None
+
+    def _record(self, ip, samples):
+        """Hand read results to the historian and the shared memory table."""
+        # stamped with controller time once its clock is known
+        timestamp = self._stamp(ip)
+        if self.historian:
+            self.historian.append(ip, samples, timestamp=timestamp)
+        if self.latest:
+            self.latest.update(ip, samples, timestamp=timestamp)
+
+    # set scaling
+    # ----------------------
+    async def _set_scaling(self, payload):
+        """Scale the values the connected plc returns for the tags
+        to engineering units from now on, scaling None removes it."""
+        try:
+            if self.plc:
+                tag = payload["msg"]["tag"]
+                try:
+                    self.scalings.set(self.plc.IPAddress, [tag] if isinstance(tag, str) else tag, payload["msg"]["scaling"])
+                except ValueError as e:
+                    return await self._bad_format([{"field": "msg.scaling", "error": str(e)}])
+                msg = {
+                    "name":tag,
+                    "value":payload["msg"]["scaling"],
+                    "status":self.responses["SUCCESS"]
+                }
+            else:
+                msg = self.no_connection_msg
+            payload["msg"] = msg
+            return payload
+        except Exception as e:
+            await log_exception(
+                message="failed to set the scaling of tags.",
+                payload=payload,
+                exception=e
+            )
+            raise e
 
     # write
     # ----------------------
@@ -303,22 +810,8 @@ class Service:
         """We have two options for writing depending on 
         the arguments, write a single tag, or write an array."""
         try:
-            await self._assert_root_msg(payload)
-            if isinstance(payload["msg"], list):
-                for x in payload["msg"]:
-                    assert all([
-                        isinstance(x[0], str),
-                        isinstance(x[1], (str, int, bool, float))
-                    ])
-            else:
-                assert all([
-                    "tag" in payload["msg"],
-                    "value" in payload["msg"],
-                    "datatype" in payload["msg"]
-                ])
-
             if self.plc:
-                res = await asyncio.to_thread(self._sync_write, payload["msg"])
+                res = await self._run_sync(self._sync_write, payload["msg"])
                 if isinstance(res, list):
                     container = []
                     for x in res:
@@ -338,8 +831,6 @@ class Service:
                 msg = self.no_connection_msg
             payload["msg"] = msg
             return payload
-        except AssertionError:
-            return await self._bad_format()
         except Exception as e:
             await log_exception(
                 message="failed to write to the target plc.",
@@ -363,27 +854,32 @@ class Service:
     # ----------------------
     async def _get_plc_time(self, payload):
         """Get the PLC's clock time, return as human
-        readable (default) or raw if raw=True."""
+        readable (default) or raw if raw=True. Answered from
+        the tracked clock offset unless live=True or the
+        estimate is stale."""
         try:
-            await self._assert_root_msg(payload)
-            assert all([
-                "raw" in payload["msg"]
-            ])
-
             if self.plc:
-                res = await asyncio.to_thread(self._sync_get_plc_time, payload["msg"])
+                clock = self._clock(self.plc.IPAddress)
+                if payload["msg"].get("live", False) or not clock.fresh():
+                    # a live read feeds the estimate as well
+                    res = await self._run_sync(self._sync_sample_clock)
+                    plc_time = res.Value
+                    status = res.Status
+                else:
+                    plc_time = int(clock.now() * 1000000)
+                    status = self.responses["SUCCESS"]
+                if status == self.responses["SUCCESS"] and not payload["msg"]["raw"]:
+                    plc_time = datetime(1970, 1, 1) + timedelta(microseconds=plc_time)
                 msg = {
-                    "name":res.TagName,
-                    "value":str(res.Value),
-                    "status":res.Status
+                    "name":None,
+                    "value":str(plc_time),
+                    "status":status
                 }
             else:
                 msg = self.no_connection_msg
 
             payload["msg"] = msg
             return payload
-        except AssertionError:
-            return await self._bad_format()
         except Exception as e:
             await log_exception(
                 message="failed to get target plc time.",
@@ -392,18 +888,57 @@ class Service:
             )
             raise e 
 
-    def _sync_get_plc_time(self, payload):
-        return self.plc.GetPLCTime(raw=payload["raw"])
+    def _clock(self, ip):
+        clock = self.clocks.get(ip, None)
+        if clock is None:
+            max_age = 3 * self.clock_sample_interval if self.clock_sample_interval else 300
+            clock = self.clocks[ip] = PLCClock(max_age=max_age)
+        return clock
+
+    def _sync_sample_clock(self, plc=None):
+        plc = plc or self.plc
+        clock = self._clock(plc.IPAddress)
+        sent = time.monotonic()
+        res = plc.GetPLCTime(raw=True)
+        received = time.monotonic()
+        if res.Status == self.responses["SUCCESS"]:
+            clock.add_sample(sent, received, int(res.Value) / 1000000)
+        return res
+
+    def _sync_sample_clock_session(self, params):
+        """Sample the clock on the sampler's session of the controller,
+        opened again when the connect params changed."""
+        session = self.clock_sessions.get(params["ip"], None)
+        if session is None or session[0] != params:
+            if session is not None:
+                session[1].Close()
+            session = self.clock_sessions[params["ip"]] = (params, self._make_plc(self.simulate_plc, params))
+        return self._sync_sample_clock(session[1])
+
+    async def _sample_clocks(self):
+        """Keep the clock estimate of the connected plc current."""
+        while True:
+            await asyncio.sleep(self.clock_sample_interval)
+            if not self.plc:
+                continue
+            try:
+                await self._throttle(self.plc.IPAddress, bounded=False)
+                await self._run_sync(self._sync_sample_clock_session, self.connect_params)
+            except Exception as e:
+                await log_exception(
+                    message="failed to sample the plc clock",
+                    payload=None,
+                    exception=e
+                )
 
     # set plc time
     # ----------------------
     async def _set_plc_time(self, payload):
         """Sets the PLC's clock time."""
         try:
-            await self._assert_root_msg(payload)
 
             if self.plc:
-                res = await asyncio.to_thread(self._sync_set_plc_time)
+                res = await self._run_sync(self._sync_set_plc_time)
                 msg = {
                     "name":res.TagName,
                     "value":res.Value,
@@ -414,8 +949,6 @@ class Service:
 
             payload["msg"] = msg
             return payload
-        except AssertionError:
-            return await self._bad_format()
         except Exception as e:
             await log_exception(
                 message="failed to set the target plc time.",
@@ -425,7 +958,10 @@ class Service:
             raise e
 
     def _sync_set_plc_time(self):
-        return self.plc.SetPLCTime()
+        res = self.plc.SetPLCTime()
+        # the old offset no longer holds
+        self._clock(self.plc.IPAddress).reset()
+        return res
 
     # get tag list
     # ----------------------
@@ -435,50 +971,13 @@ class Service:
         If is set to False, it will return only controller
         otherwise controller tags and program tags."""
         try:
-            await self._assert_root_msg(payload)
-            assert all([
-                "all_tags" in payload["msg"]
-            ])
-
             if self.plc:
-                res = await asyncio.to_thread(self._sync_get_tag_list, payload["msg"])
+                res = await self._run_sync(self._sync_get_tag_list, payload["msg"])
+                self.watchdog.mark(payload["command"], "result_conversion")
                 if isinstance(res.Value, list):
-                    for idx, x in enumerate(res.Value):
-                        res.Value[idx] = {
-                            "TagName":x.TagName,
-                            "InstanceID":x.InstanceID,
-                            "SymbolType":x.SymbolType,
-                            "DataTypeValue":x.DataTypeValue,
-                            "DataType":x.DataType,
-                            "Array":x.Array,
-                            "Struct":x.Struct,
-                            "Size":x.Size,
-                            "AccessRight":x.AccessRight,
-                            "Internal":x.Internal,
-                            "Meta":x.Meta,
-                            "Scope0":x.Scope0,
-                            "Scope1":x.Scope1,
-                            "Bytes":x.Bytes
-                        }
+                    res.Value = [self._tag_dict(x) for x in res.Value]
                 elif res.Value is not None:
-                    res.Value = {
-                        "TagName":res.Value.TagName,
-                        "InstanceID":res.Value.InstanceID,
-                        "SymbolType":res.Value.SymbolType,
-                        "DataTypeValue":res.Value.DataTypeValue,
-                        "DataType":res.Value.DataType,
-                        "Array":res.Value.Array,
-                        "Struct":res.Value.Struct,
-                        "Size":res.Value.Size,
-                        "AccessRight":res.Value.AccessRight,
-                        "Internal":res.Value.Internal,
-                        "Meta":res.Value.Meta,
-                        "Scope0":res.Value.Scope0,
-                        "Scope1":res.Value.Scope1,
-                        "Bytes":res.Value.Bytes
-                    }
-                else:
-                    pass
+                    res.Value = self._tag_dict(res.Value)
                 msg = {
                     "name":res.TagName,
                     "value":res.Value,
@@ -489,8 +988,6 @@ class Service:
 
             payload["msg"] = msg
             return payload
-        except AssertionError:
-            return await self._bad_format()
         except Exception as e:
             await log_exception(
                 message="failed to get tag list.",
@@ -508,50 +1005,13 @@ class Service:
         """Retrieves a program tag list from the PLC
         programName = "Program:ExampleProgram"."""
         try:
-            await self._assert_root_msg(payload)
-            assert all([
-                "program_name" in payload["msg"]
-            ])
-
             if self.plc:
-                res = await asyncio.to_thread(self._sync_get_program_tag_list, payload["msg"])
+                res = await self._run_sync(self._sync_get_program_tag_list, payload["msg"])
+                self.watchdog.mark(payload["command"], "result_conversion")
                 if isinstance(res.Value, list):
-                    for idx, x in enumerate(res.Value):
-                        res.Value[idx] = {
-                            "TagName":x.TagName,
-                            "InstanceID":x.InstanceID,
-                            "SymbolType":x.SymbolType,
-                            "DataTypeValue":x.DataTypeValue,
-                            "DataType":x.DataType,
-                            "Array":x.Array,
-                            "Struct":x.Struct,
-                            "Size":x.Size,
-                            "AccessRight":x.AccessRight,
-                            "Internal":x.Internal,
-                            "Meta":x.Meta,
-                            "Scope0":x.Scope0,
-                            "Scope1":x.Scope1,
-                            "Bytes":x.Bytes
-                        }
+                    res.Value = [self._tag_dict(x) for x in res.Value]
                 elif res.Value is not None:
-                    res.Value = {
-                        "TagName":res.Value.TagName,
-                        "InstanceID":res.Value.InstanceID,
-                        "SymbolType":res.Value.SymbolType,
-                        "DataTypeValue":res.Value.DataTypeValue,
-                        "DataType":res.Value.DataType,
-                        "Array":res.Value.Array,
-                        "Struct":res.Value.Struct,
-                        "Size":res.Value.Size,
-                        "AccessRight":res.Value.AccessRight,
-                        "Internal":res.Value.Internal,
-                        "Meta":res.Value.Meta,
-                        "Scope0":res.Value.Scope0,
-                        "Scope1":res.Value.Scope1,
-                        "Bytes":res.Value.Bytes
-                    }
-                else:
-                    pass
+                    res.Value = self._tag_dict(res.Value)
                 msg = {
                     "name":res.TagName,
                     "value":res.Value,
@@ -562,8 +1022,6 @@ class Service:
 
             payload["msg"] = msg
             return payload
-        except AssertionError:
-            return await self._bad_format()
         except Exception as e:
             await log_exception(
                 message="Provider failed to get program tag list.",
@@ -580,9 +1038,8 @@ class Service:
     async def _get_programs_list(self, payload):
         """Retrieves a program names list from the PLC."""
         try:
-            await self._assert_root_msg(payload)
             if self.plc:
-                res = await asyncio.to_thread(self._sync_get_programs_list)
+                res = await self._run_sync(self._sync_get_programs_list)
                 msg = {
                     "name":res.TagName,
                     "value":res.Value,
@@ -592,8 +1049,6 @@ class Service:
                 msg = self.no_connection_msg
             payload["msg"] = msg
             return payload
-        except AssertionError:
-            return await self._bad_format()
         except Exception as e:
             await log_exception(
                 message="failed to get program tag list.",
@@ -608,61 +1063,17 @@ class Service:
     # discover
     # ----------------------
     async def _discover(self, payload):
-        """Query all the EIP devices on the network."""
+        """Query all the EIP devices on the network. With background
+        discovery running the inventory answers, unless live is set."""
         try:
-            await self._assert_root_msg(payload)
-            if self.plc:
-                res = await asyncio.to_thread(self._sync_discover)
-                if isinstance(res.Value, list):
-                    for idx, x in enumerate(res.Value):
-                        res.Value[idx] = {
-                            "Length":x.Length,
-                            "EncapsulationVersion":x.EncapsulationVersion,
-                            "IPAddress":x.IPAddress,
-                            "VendorID":x.VendorID,
-                            "Vendor":x.Vendor,
-                            "DeviceID":x.DeviceID,
-                            "DeviceType":x.DeviceType,
-                            "ProductCode":x.ProductCode,
-                            "Revision":x.Revision,
-                            "Status":x.Status,
-                            "SerialNumber":x.SerialNumber,
-                            "ProductNameLength":x.ProductNameLength,
-                            "ProductName":x.ProductName,
-                            "State":x.State
-                    }
-                    msg = res.Value
-                elif res.Value is not None:
-                    res.Value = {
-                        "Length":x.Length,
-                        "EncapsulationVersion":x.EncapsulationVersion,
-                        "IPAddress":x.IPAddress,
-                        "VendorID":x.VendorID,
-                        "Vendor":x.Vendor,
-                        "DeviceID":x.DeviceID,
-                        "DeviceType":x.DeviceType,
-                        "ProductCode":x.ProductCode,
-                        "Revision":x.Revision,
-                        "Status":x.Status,
-                        "SerialNumber":x.SerialNumber,
-                        "ProductNameLength":x.ProductNameLength,
-                        "ProductName":x.ProductName,
-                        "State":x.State
-                    }
-                    msg = res.Value
-                else:
-                    pass
-                msg = {
-                    "name":res.TagName,
-                    "value":res.Value,
-                    "status":res.Status
-                }
-            else:
-                msg = self.no_connection_msg
+            res = await self._discover_devices(payload["msg"])
+            msg = {
+                "name":res.TagName,
+                "value":res.Value,
+                "status":res.Status
+            }
             payload["msg"] = msg
             return payload
-        except AssertionError:
-            return await self._bad_format()
         except Exception as e:
             await log_exception(
                 message="failed to discover PLCs.",
@@ -671,8 +1082,28 @@ class Service:
             )
             raise e 
 
+    async def _discover_devices(self, msg):
+        live = isinstance(msg, dict) and msg.get("live", False)
+        if self.discovery.interval and self.discovery.swept is not None and not live:
+            return Response(None, self.discovery.inventory.snapshot(), self.responses["SUCCESS"])
+        devices, status = await self.discovery.refresh()
+        return Response(None, devices, status)
+
+    async def _sweep(self):
+        res = await self._run_sync(self._sync_discover)
+        devices = [self._device_dict(x) for x in res.Value] if isinstance(res.Value, list) else []
+        return devices, res.Status
+
+    async def _publish_event(self, event):
+        await self.events_sock.send_multipart([b"discovery", json.dumps(event).encode("utf-8")])
+
     def _sync_discover(self):
-        return self.plc.Discover()
+        # the broadcast goes out on its own udp socket, no connection needed
+        if self.simulate_plc:
+            plc = MockPLC(ip_address="", config=self.mock_config)
+        else:
+            plc = PLC()
+        return plc.Discover()
 
     # get module properties
     # ----------------------
@@ -680,31 +1111,11 @@ class Service:
         """Get the properties of module in specified
         slot."""
         try:
-            await self._assert_root_msg(payload)
-            assert all([
-                "slot" in payload["msg"]
-            ])
-
             if self.plc:
-                res = await asyncio.to_thread(self._sync_get_module_properties, payload["msg"])
+                res = await self._run_sync(self._sync_get_module_properties, payload["msg"])
                 msg = {
                     "name":res.TagName,
-                    "value": {
-                        "Length":res.Value.Length,
-                        "EncapsulationVersion":res.Value.EncapsulationVersion,
-                        "IPAddress":res.Value.IPAddress,
-                        "VendorID":res.Value.VendorID,
-                        "Vendor":res.Value.Vendor,
-                        "DeviceID":res.Value.DeviceID,
-                        "DeviceType":res.Value.DeviceType,
-                        "ProductCode":res.Value.ProductCode,
-                        "Revision":res.Value.Revision,
-                        "Status":res.Value.Status,
-                        "SerialNumber":res.Value.SerialNumber,
-                        "ProductNameLength":res.Value.ProductNameLength,
-                        "ProductName":res.Value.ProductName,
-                        "State":res.Value.State
-                    },
+                    "value":self._device_dict(res.Value),
                     "status":res.Status
                 }
             else:
@@ -712,8 +1123,6 @@ class Service:
 
             payload["msg"] = msg
             return payload
-        except AssertionError:
-            return await self._bad_format()
         except Exception as e:
             await log_exception(
                 message="failed to module properties.",
@@ -731,35 +1140,17 @@ class Service:
         """Get the device properties of a device at the
         specified IP address."""
         try:
-            await self._assert_root_msg(payload)
             if self.plc:
-                res = await asyncio.to_thread(self._sync_get_device_properties)
+                res = await self._run_sync(self._sync_get_device_properties)
                 msg = {
                     "name":res.TagName,
-                    "value": {
-                        "Length":res.Value.Length,
-                        "EncapsulationVersion":res.Value.EncapsulationVersion,
-                        "IPAddress":res.Value.IPAddress,
-                        "VendorID":res.Value.VendorID,
-                        "Vendor":res.Value.Vendor,
-                        "DeviceID":res.Value.DeviceID,
-                        "DeviceType":res.Value.DeviceType,
-                        "ProductCode":res.Value.ProductCode,
-                        "Revision":res.Value.Revision,
-                        "Status":res.Value.Status,
-                        "SerialNumber":res.Value.SerialNumber,
-                        "ProductNameLength":res.Value.ProductNameLength,
-                        "ProductName":res.Value.ProductName,
-                        "State":res.Value.State
-                    },
+                    "value":self._device_dict(res.Value),
                     "status":res.Status
                 }
             else:
                 msg = self.no_connection_msg
             payload["msg"] = msg
             return payload
-        except AssertionError:
-            return await self._bad_format()
         except Exception as e:
             await log_exception(
                 message="failed to device properties.",
@@ -771,14 +1162,352 @@ class Service:
     def _sync_get_device_properties(self):
         return self.plc.GetDeviceProperties()
 
+    # scan chassis
+    # ----------------------
+    async def _scan_chassis(self, payload):
+        """Module properties of every slot up to slots, read by a few
+        connections of their own in parallel. The rack is cached per
+        controller for the cache ttl unless refresh is set."""
+        try:
+            if self.plc:
+                query = payload["msg"] or {}
+                slots = query.get("slots", None) or 17
+                concurrency = min(query.get("concurrency", None) or 4, slots)
+                ip = self.plc.IPAddress
+                cached = self.chassis_cache.get(ip, None)
+                if cached and not query.get("refresh", False) \
+                        and time.time() - cached[0] < self.chassis_cache_ttl and cached[1] >= slots:
+                    value = {**cached[2], "slots":cached[2]["slots"][:slots], "cached":True}
+                else:
+                    try:
+                        # the device and every slot are a request each
+                        await self._throttle(ip, slots + 1)
+                    except Busy:
+                        payload["msg"] = self.busy_msg
+                        return payload
+                    value = await self._scan_slots(slots, concurrency)
+                    self.chassis_cache[ip] = (value["scanned"], slots, value)
+                    value = {**value, "cached":False}
+                msg = {
+                    "name":None,
+                    "value":value,
+                    "status":self.responses["SUCCESS"]
+                }
+            else:
+                msg = self.no_connection_msg
+            payload["msg"] = msg
+            return payload
+        except Exception as e:
+            await log_exception(
+                message="failed to scan the chassis.",
+                payload=payload,
+                exception=e
+            )
+            raise e
+
+    async def _scan_slots(self, slots, concurrency, params=None):
+        pending = asyncio.Queue()
+        for slot in range(slots):
+            pending.put_nowait(slot)
+        results = [None] * slots
+        device = None
+
+        async def worker(first):
+            nonlocal device
+            # a plc object is not safe to share between threads, every worker gets its own
+            plc = self._make_plc(self.simulate_plc, params or self.connect_params)
+            try:
+                if first:
+                    res = await self._run_sync(plc.GetDeviceProperties)
+                    device = {
+                        "name":res.TagName,
+                        "value":self._device_dict(res.Value),
+                        "status":res.Status
+                    }
+                while not pending.empty():
+                    slot = pending.get_nowait()
+                    res = await self._run_sync(plc.GetModuleProperties, slot)
+                    results[slot] = {
+                        "slot":slot,
+                        "value":self._device_dict(res.Value),
+                        "status":res.Status
+                    }
+            finally:
+                await self._run_sync(plc.Close)
+
+        await asyncio.gather(*[worker(x == 0) for x in range(concurrency)])
+        return {
+            "device":device,
+            "slots":results,
+            "scanned":time.time()
+        }
+
+    # history
+    # ----------------------
+    async def _history(self, payload):
+        """Query samples recorded by the historian for the
+        connected plc, or the plc given by ip."""
+        try:
+            tag = payload["msg"]["tag"]
+            if not self.historian:
+                msg = {
+                    "name":None,
+                    "value":None,
+                    "status":self.responses["DISABLED"]
+                }
+            elif (self.plc or payload["msg"].get("ip", None)) and payload.get("format", None) == "arrow":
+                payload[columnar.FRAME], rows = await self._run_sync(self._sync_history_frame, payload["msg"])
+                msg = {
+                    "name":tag,
+                    "value":{"rows":rows, "columns":columnar.COLUMNS},
+                    "status":self.responses["SUCCESS"]
+                }
+            elif self.plc or payload["msg"].get("ip", None):
+                res = await self._run_sync(self._sync_history, payload["msg"])
+                msg = {
+                    "name":tag,
+                    "value":res,
+                    "status":self.responses["SUCCESS"]
+                }
+            else:
+                msg = self.no_connection_msg
+            payload["msg"] = msg
+            return payload
+        except Exception as e:
+            await log_exception(
+                message="failed to query the historian.",
+                payload=payload,
+                exception=e
+            )
+            raise e
+
+    def _sync_history(self, payload, columns=False):
+        tag = payload["tag"]
+        return self.historian.query(
+            controller=payload.get("ip", None) or self.plc.IPAddress,
+            tags=[tag] if isinstance(tag, str) else tag,
+            start=payload["start"],
+            end=payload["end"],
+            limit=payload.get("limit", None),
+            columns=columns
+        )
+
+    def _sync_history_frame(self, payload):
+        columns = self._sync_history(payload, columns=True)
+        frame = columnar.encode(columns["name"], columns["timestamp"], columns["value"], columns["status"])
+        return frame, len(columns["name"])
+
+    # find tags
+    # ----------------------
+    async def _find_tags(self, payload):
+        """Search the cached tag list of the connected plc by prefix,
+        glob, data type, array, struct and program scope, one page at
+        a time. The tag list is uploaded once and on refresh."""
+        try:
+            if self.plc:
+                query = payload["msg"]
+                async with self.tag_index_lock:
+                    ip = self.plc.IPAddress
+                    index = self.tag_indexes.get(ip, None)
+                    if index is None or query.get("refresh", False):
+                        res = await self._run_sync(self._sync_build_tag_index)
+                        if isinstance(res, TagIndex):
+                            index = self.tag_indexes[ip] = res
+                        else:
+                            index = None
+                if index is None:
+                    msg = {
+                        "name":None,
+                        "value":None,
+                        "status":res.Status
+                    }
+                else:
+                    offset = query.get("offset", None) or 0
+                    limit = query.get("limit", None) or 100
+                    total, tags = index.find(
+                        prefix=query.get("prefix", None),
+                        glob=query.get("glob", None),
+                        datatype=query.get("datatype", None),
+                        array=query.get("array", None),
+                        struct=query.get("struct", None),
+                        program=query.get("program", None),
+                        offset=offset,
+                        limit=limit
+                    )
+                    msg = {
+                        "name":None,
+                        "value":{
+                            "total":total,
+                            "offset":offset,
+                            "tags":tags
+                        },
+                        "status":self.responses["SUCCESS"]
+                    }
+            else:
+                msg = self.no_connection_msg
+            payload["msg"] = msg
+            return payload
+        except Exception as e:
+            await log_exception(
+                message="failed to find tags.",
+                payload=payload,
+                exception=e
+            )
+            raise e
+
+    def _sync_build_tag_index(self, plc=None):
+        """The index on success, otherwise the failed response."""
+        res = (plc or self.plc).GetTagList(allTags=True)
+        if res.Status != self.responses["SUCCESS"] or not isinstance(res.Value, list):
+            return res
+        return TagIndex([self._tag_dict(x) for x in res.Value])
+
+    # startup config
+    # ----------------------
+    async def _prewarm(self):
+        """Connect every configured controller and prime its caches."""
+        await asyncio.gather(*[self._prewarm_controller(x) for x in self.config["controllers"]])
+
+    async def _prewarm_controller(self, controller):
+        params = controller_defaults(controller)
+        ip = params["ip"]
+        state = self.readiness[ip]
+        delay = 1
+        # an unreachable controller is tried again with a growing delay
+        while True:
+            state["state"] = "warming"
+            started = time.monotonic()
+            try:
+                await self._throttle(ip, bounded=False)
+                plc = await self._run_sync(self._sync_warm, params, controller.get("connection_size", None))
+                for step in controller.get("prewarm", ["tag_index", "clock"]):
+                    # background work waits for budget instead of being refused
+                    await self._throttle(ip, bounded=False)
+                    if step == "tag_index":
+                        # also leaves pylogix knowing the type of every tag
+                        res = await self._run_sync(self._sync_build_tag_index, plc)
+                        if not isinstance(res, TagIndex):
+                            raise RuntimeError(f"tag list upload failed: {res.Status}")
+                        async with self.tag_index_lock:
+                            self.tag_indexes[ip] = res
+                    elif step == "clock":
+                        for _ in range(3):
+                            await self._run_sync(self._sync_sample_clock, plc)
+                    elif step == "chassis":
+                        slots = controller.get("chassis_slots", 17)
+                        value = await self._scan_slots(slots, min(4, slots), params)
+                        self.chassis_cache[ip] = (value["scanned"], slots, value)
+                self.sessions[ip] = (params, plc)
+                state.update({"state":"ready", "error":None, "duration":time.monotonic() - started})
+                return
+            except Exception as e:
+                state.update({"state":"failed", "error":str(e), "duration":time.monotonic() - started})
+                await log_exception(
+                    message=f"failed to prewarm controller {ip}",
+                    payload=None,
+                    exception=e
+                )
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60)
+
+    def _sync_warm(self, params, connection_size):
+        plc = self._make_plc(self.simulate_plc, params)
+        if connection_size:
+            plc.ConnectionSize = connection_size
+        res = plc.GetDeviceProperties()
+        if res.Status != self.responses["SUCCESS"]:
+            plc.Close()
+            raise RuntimeError(f"controller did not answer: {res.Status}")
+        return plc
+
+    def is_ready(self):
+        """Every required controller of the startup config is prewarmed."""
+        return all(x["state"] == "ready" for x in self.readiness.values() if x["required"])
+
+    async def _ready(self, payload):
+        """Readiness of the service and the prewarm state per controller."""
+        try:
+            msg = {
+                "name":None,
+                "value":{
+                    "ready":self.is_ready(),
+                    "controllers":self.readiness
+                },
+                "status":self.responses["SUCCESS"]
+            }
+            payload["msg"] = msg
+            return payload
+        except Exception as e:
+            await log_exception(
+                message="failed to report readiness.",
+                payload=payload,
+                exception=e
+            )
+            raise e
+
+    async def _poll(self, group):
+        # one session per controller, its groups take turns on it
+        lock = self.poll_locks.setdefault(group.controller, asyncio.Lock())
+        async with lock:
+            nbytes = payload_size(group.tags)
+            connection_size = self.poll_params[group.controller].get("connection_size", None) or 508
+            await self._throttle(group.controller, -(-nbytes // connection_size), nbytes, bounded=False)
+            return await self._run_sync(self._sync_poll, group)
+
+    def _sync_poll(self, group):
+        plc = self.poll_sessions.get(group.controller, None)
+        if plc is None:
+            controller = self.poll_params[group.controller]
+            plc = self.poll_sessions[group.controller] = self._make_plc(self.simulate_plc, controller_defaults(controller))
+            if controller.get("connection_size", None):
+                plc.ConnectionSize = controller["connection_size"]
+        started = time.monotonic()
+        res = plc.Read(group.tags)
+        latency = time.monotonic() - started
+        results = res if isinstance(res, list) else [res]
+        self.scalings.apply(group.controller, results)
+        samples = [(x.TagName, x.Value, x.Status) for x in results]
+        self._record(group.controller, samples)
+        return samples, latency
+
+    # stats
+    # ----------------------
+    async def _stats(self, payload):
+        """Request counters, latency histograms and
+        thread pool usage of this service."""
+        try:
+            msg = {
+                "name":None,
+                "value":{
+                    **self.metrics.snapshot(),
+                    "clocks":{ip: x.snapshot() for ip, x in self.clocks.items()},
+                    "latest":self.latest.snapshot() if self.latest else None,
+                    "poller":self.tag_poller.snapshot() if self.tag_poller else None,
+                    "rate_limits":self.limiter.snapshot(),
+                    "watchdog":self.watchdog.snapshot(),
+                    "logging":log_stats(),
+                    "capture":self.capture.snapshot() if self.capture else None,
+                    "scaling":self.scalings.snapshot()
+                },
+                "status":self.responses["SUCCESS"]
+            }
+            payload["msg"] = msg
+            return payload
+        except Exception as e:
+            await log_exception(
+                message="failed to collect stats.",
+                payload=payload,
+                exception=e
+            )
+            raise e
+
     # close
     # ----------------------
     async def _close(self, payload):
         """ Closes the connection to the PLC."""
         try:
-            await self._assert_root_msg(payload)
             if self.plc:
-                await asyncio.to_thread(self._sync_close)
+                await self._run_sync(self._sync_close)
             else:
                 pass
             msg = {
@@ -788,8 +1517,6 @@ class Service:
             }
             payload["msg"] = msg
             return payload
-        except AssertionError:
-            return await self._bad_format()
         except Exception as e:
             await log_exception(
                 message="failed to close the connection to the target plc.",
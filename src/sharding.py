@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import multiprocessing
+from bisect import bisect
+from collections import OrderedDict
+
+import zmq
+import zmq.asyncio
+
+from logger import log_exception
+from transport import bind
+
+class HashRing:
+    """Consistent hash ring, keys always land on the same node as long
+    as the set of nodes does not change."""
+
+    def __init__(self, nodes: list, replicas: int = 64) -> None:
+        self._ring: list[tuple[int, object]] = []
+        for node in nodes:
+            for x in range(replicas):
+                self._ring.append((self._hash(f"{node}-{x}"), node))
+        self._ring.sort()
+        self._keys = [x[0] for x in self._ring]
+
+    @staticmethod
+    def _hash(key: str | bytes) -> int:
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+        return int.from_bytes(hashlib.md5(key).digest()[:8], "little")
+
+    def get(self, key: str | bytes):
+        idx = bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._ring[idx][1]
+
+class Frontend:
+    """Single ROUTER front end that spreads controllers over worker
+    processes, each worker runs its own Service behind an ipc socket."""
+
+    def __init__(self,
+                 url: str,
+                 workers: int,
+                 target,
+                 args,
+                 max_clients: int = 65536,
+                 socket_options: dict[int, int] | None = None) -> None:
+        self.target = target
+        self.args = args
+        self.max_clients = max_clients
+        self.mp = multiprocessing.get_context("spawn")
+        self.ctx = zmq.asyncio.Context()
+        self.sock = self.ctx.socket(zmq.ROUTER)
+        bind(self.sock, url, socket_options)
+        self.poller = zmq.asyncio.Poller()
+        self.poller.register(self.sock, zmq.POLLIN)
+        self.ring = HashRing(list(range(workers)))
+        self.clients: OrderedDict[bytes, int] = OrderedDict()
+        self.worker_urls = []
+        self.processes = []
+        self.backends = []
+        for idx in range(workers):
+            path = os.path.join(tempfile.gettempdir(), f"pylogix-as-service-{os.getpid()}-{idx}.ipc")
+            worker_url = f"ipc://{path}"
+            backend = self.ctx.socket(zmq.DEALER)
+            backend.setsockopt(zmq.LINGER, 0)
+            backend.connect(worker_url)
+            self.poller.register(backend, zmq.POLLIN)
+            self.worker_urls.append(worker_url)
+            self.backends.append(backend)
+            self.processes.append(self._spawn(idx))
+
+    def _spawn(self, idx: int):
+        process = self.mp.Process(
+            target=self.target,
+            args=(self.worker_urls[idx], self.args, idx),
+            name=f"pylogix-as-service-worker-{idx}",
+            daemon=True
+        )
+        process.start()
+        return process
+
+    def _check_workers(self):
+        for idx, process in enumerate(self.processes):
+            if not process.is_alive():
+                logging.error(f"worker {idx} exited with code {process.exitcode}, restarting")
+                self.processes[idx] = self._spawn(idx)
+
+    def _remember(self, client_id: bytes, worker: int):
+        self.clients[client_id] = worker
+        self.clients.move_to_end(client_id)
+        if len(self.clients) > self.max_clients:
+            self.clients.popitem(last=False)
+
+    def _route(self, client_id: bytes, raw_msg: bytes) -> int:
+        """A connect pins the client to the worker owning that
+        controller, later requests follow the client. Discover always
+        goes to worker 0, the one running discovery."""
+        if b'"connect"' in raw_msg or b'"discover"' in raw_msg:
+            try:
+                decoded_msg = json.loads(raw_msg.decode("utf-8"))
+                command = decoded_msg.get("command", None)
+                if command == "connect":
+                    worker = self.ring.get(str(decoded_msg["msg"]["ip"]))
+                    self._remember(client_id, worker)
+                    return worker
+                if command == "discover":
+                    return 0
+            except Exception:
+                # let the worker report the bad format
+                pass
+        worker = self.clients.get(client_id, None)
+        if worker is None:
+            worker = self.ring.get(client_id)
+        return worker
+
+    def close(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join(timeout=5)
+        self.ctx.destroy(linger=0)
+
+    async def start(self):
+        last_check = time.monotonic()
+        while True:
+            events = dict(await self.poller.poll(timeout=1000))
+            try:
+                if self.sock in events:
+                    frames = await self.sock.recv_multipart()
+                    client_id, raw_msg = frames[0], frames[-1]
+                    worker = self._route(client_id, raw_msg)
+                    await self.backends[worker].send_multipart([client_id, raw_msg])
+                for backend in self.backends:
+                    if backend in events:
+                        await self.sock.send_multipart(await backend.recv_multipart())
+            except Exception as e:
+                await log_exception(
+                    message="failed in front end loop",
+                    payload=None,
+                    exception=e
+                )
+            if time.monotonic() - last_check > 1:
+                last_check = time.monotonic()
+                self._check_workers()
@@ -0,0 +1,261 @@
+import os
+import json
+import mmap
+import time
+import struct
+import threading
+
+# table layout
+# ----------------------
+# [ header | slot 0 | slot 1 | ... ]   in one file, eg. under /dev/shm
+#
+# header:  magic, version, slot size, slot count, used slots,
+#          controller size, name size, status size, value size, created
+# slot:    sequence, timestamp, value kind, controller length, name length,
+#          status length, value length, controller, name, status, value
+#
+# Slots are handed out in order and never move, the used count is raised
+# only after a new slot is filled in, so a reader finds every tag by
+# scanning the slots below it once. Each slot is guarded by its sequence
+# number like a seqlock, odd while the writer is in the middle of it.
+_MAGIC = b"PLXL"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHxxIIIIIIId")
+_HEADER_SIZE = 64
+_USED_OFFSET = 16
+_SLOT = struct.Struct("<QdBBHHI")
+_SEQ = struct.Struct("<Q")
+_ALIGN = 64
+
+# how the value area is to be read
+_NONE = 0
+_INT = 1
+_FLOAT = 2
+_BOOL = 3
+_STR = 4
+_JSON = 5
+_I64 = struct.Struct("<q")
+_F64 = struct.Struct("<d")
+
+def _slot_size(controller_size: int, name_size: int, status_size: int, value_size: int) -> int:
+    size = _SLOT.size + controller_size + name_size + status_size + value_size
+    return (size + _ALIGN - 1) // _ALIGN * _ALIGN
+
+def _encode(value, value_size: int) -> tuple[int, bytes] | None:
+    if value is None:
+        return _NONE, b""
+    if isinstance(value, bool):
+        return _BOOL, b"\x01" if value else b"\x00"
+    if isinstance(value, int) and -2**63 <= value < 2**63:
+        return _INT, _I64.pack(value)
+    if isinstance(value, float):
+        return _FLOAT, _F64.pack(value)
+    if isinstance(value, str):
+        kind, encoded = _STR, value.encode("utf-8")
+    else:
+        kind, encoded = _JSON, json.dumps(value).encode("utf-8")
+    # a value that does not fit is left out rather than cut short
+    return (kind, encoded) if len(encoded) <= value_size else None
+
+def _decode(kind: int, raw: bytes):
+    if kind == _INT:
+        return _I64.unpack(raw)[0]
+    if kind == _FLOAT:
+        return _F64.unpack(raw)[0]
+    if kind == _BOOL:
+        return raw == b"\x01"
+    if kind == _STR:
+        return raw.decode("utf-8")
+    if kind == _JSON:
+        return json.loads(raw)
+    return None
+
+class LatestTable:
+    """Latest value, status and timestamp of every tag read, written
+    into a shared memory file for readers on the same host, see
+    LatestReader. The service is the only writer."""
+
+    def __init__(self,
+                 path: str,
+                 slots: int = 4096,
+                 controller_size: int = 64,
+                 name_size: int = 128,
+                 status_size: int = 32,
+                 value_size: int = 128) -> None:
+        if controller_size > 255:
+            raise ValueError("controller_size is at most 255 bytes")
+        self.path = path
+        self.slots = slots
+        self.sizes = (controller_size, name_size, status_size, value_size)
+        self.slot_size = _slot_size(*self.sizes)
+        self.directory: dict[tuple[str, str], int] = {}
+        self.dropped = 0
+        self._lock = threading.Lock()
+        # a fresh file is swapped in, readers still mapping an older one
+        # keep reading it instead of faulting on a truncated mapping
+        size = _HEADER_SIZE + slots * self.slot_size
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.truncate(size)
+        self._file = open(tmp, "r+b")
+        self.mm = mmap.mmap(self._file.fileno(), size)
+        _HEADER.pack_into(self.mm, 0, _MAGIC, _VERSION, self.slot_size, slots, 0, *self.sizes, time.time())
+        os.replace(tmp, path)
+
+    def close(self):
+        self.mm.close()
+        self._file.close()
+
+    def update(self, controller: str, samples: list[tuple], timestamp: float | None = None):
+        """samples are (name, value, status) tuples, timestamp defaults to now."""
+        timestamp = timestamp if timestamp is not None else time.time()
+        controller_size, name_size, status_size, value_size = self.sizes
+        encoded_controller = controller.encode("utf-8")[:controller_size]
+        with self._lock:
+            for name, value, status in samples:
+                encoded = _encode(value, value_size)
+                if encoded is None or name is None:
+                    self.dropped += 1
+                    continue
+                kind, raw = encoded
+                slot = self.directory.get((controller, name), None)
+                new = slot is None
+                if new:
+                    if len(self.directory) >= self.slots:
+                        self.dropped += 1
+                        continue
+                    slot = len(self.directory)
+                encoded_name = name.encode("utf-8")
+                if len(encoded_name) > name_size:
+                    self.dropped += 1
+                    continue
+                self._write(slot, timestamp, kind, encoded_controller, encoded_name,
+                            str(status).encode("utf-8")[:status_size], raw)
+                if new:
+                    self.directory[(controller, name)] = slot
+                    struct.pack_into("<I", self.mm, _USED_OFFSET, len(self.directory))
+
+    def _write(self, slot: int, timestamp: float, kind: int, controller: bytes, name: bytes, status: bytes, value: bytes):
+        controller_size, name_size, status_size, value_size = self.sizes
+        offset = _HEADER_SIZE + slot * self.slot_size
+        seq = _SEQ.unpack_from(self.mm, offset)[0]
+        _SEQ.pack_into(self.mm, offset, seq + 1)
+        _SLOT.pack_into(self.mm, offset, seq + 1, timestamp, kind, len(controller), len(name), len(status), len(value))
+        position = offset + _SLOT.size
+        for data, size in [(controller, controller_size), (name, name_size), (status, status_size)]:
+            self.mm[position:position + len(data)] = data
+            position += size
+        self.mm[position:position + len(value)] = value
+        _SEQ.pack_into(self.mm, offset, seq + 2)
+
+    def snapshot(self) -> dict:
+        return {
+            "path":self.path,
+            "slots":self.slots,
+            "used":len(self.directory),
+            "dropped":self.dropped
+        }
+
+class LatestReader:
+    """Reads the table a LatestTable writes, from any process on the
+    same host. Lookups are plain memory reads, no syscalls and no
+    messages to the service.
+
+        reader = LatestReader("/dev/shm/pylogix-latest")
+        reader.get("BaseDINT")
+        # {'controller': '192.168.1.196', 'name': 'BaseDINT', 'value': 42, 'status': 'Success', 'timestamp': 1718.1}
+    """
+
+    def __init__(self, path: str, retries: int = 100) -> None:
+        self.path = path
+        self.retries = retries
+        self._file = open(path, "rb")
+        self.inode = os.fstat(self._file.fileno()).st_ino
+        self.mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic,
+         version,
+         self.slot_size,
+         self.slots,
+         _,
+         controller_size,
+         name_size,
+         status_size,
+         value_size,
+         self.created) = _HEADER.unpack_from(self.mm, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"not a latest value table: {path}")
+        self.sizes = (controller_size, name_size, status_size, value_size)
+        self.directory: dict[str, dict[str, int]] = {}
+        self.known = 0
+
+    def close(self):
+        self.mm.close()
+        self._file.close()
+
+    def stale(self) -> bool:
+        """True once the service was restarted and wrote a new table, reopen to follow it."""
+        try:
+            return os.stat(self.path).st_ino != self.inode
+        except FileNotFoundError:
+            return True
+
+    def _scan(self):
+        used = struct.unpack_from("<I", self.mm, _USED_OFFSET)[0]
+        for slot in range(self.known, used):
+            entry = self._read_slot(slot)
+            if entry is None:
+                # still being written, the next scan starts here again
+                break
+            self.directory.setdefault(entry["name"], {})[entry["controller"]] = slot
+            self.known = slot + 1
+
+    def _read_slot(self, slot: int) -> dict | None:
+        controller_size, name_size, status_size, value_size = self.sizes
+        offset = _HEADER_SIZE + slot * self.slot_size
+        for _ in range(self.retries):
+            before = _SEQ.unpack_from(self.mm, offset)[0]
+            if before & 1:
+                continue
+            raw = self.mm[offset:offset + self.slot_size]
+            if _SEQ.unpack_from(self.mm, offset)[0] != before:
+                continue
+            _, timestamp, kind, controller_len, name_len, status_len, value_len = _SLOT.unpack_from(raw, 0)
+            position = _SLOT.size
+            controller = raw[position:position + controller_len].decode("utf-8")
+            position += controller_size
+            name = raw[position:position + name_len].decode("utf-8")
+            position += name_size
+            status = raw[position:position + status_len].decode("utf-8")
+            position += status_size
+            return {
+                "controller":controller,
+                "name":name,
+                "value":_decode(kind, raw[position:position + value_len]),
+                "status":status,
+                "timestamp":timestamp
+            }
+        # the writer kept the slot busy for all retries
+        return None
+
+    def get(self, tag: str, controller: str | None = None) -> dict | None:
+        """Latest sample of a tag, from the given controller or any that has it."""
+        slot = self._find(tag, controller)
+        if slot is None:
+            # only tags new since the last scan are looked for again
+            self._scan()
+            slot = self._find(tag, controller)
+        return self._read_slot(slot) if slot is not None else None
+
+    def _find(self, tag: str, controller: str | None) -> int | None:
+        slots = self.directory.get(tag, None)
+        if not slots:
+            return None
+        return slots.get(controller, None) if controller is not None else next(iter(slots.values()))
+
+    def read(self, tags: list[str], controller: str | None = None) -> list[dict | None]:
+        return [self.get(x, controller) for x in tags]
+
+    def snapshot(self) -> list[dict]:
+        """Every tag in the table."""
+        self._scan()
+        return [x for x in (self._read_slot(slot) for slot in range(self.known)) if x]
@@ -0,0 +1,80 @@
+import re
+from bisect import bisect_left
+from fnmatch import fnmatchcase
+
+_WILDCARDS = re.compile(r"[*?\[]")
+
+class TagIndex:
+    """Browse index over the tag list of one controller. Names are kept
+    sorted so a prefix is a bisected range, the other filters are
+    precomputed sets of positions in that order."""
+
+    def __init__(self, tags: list[dict]) -> None:
+        self.tags = sorted(tags, key=lambda x: x["TagName"])
+        self.names = [x["TagName"] for x in self.tags]
+        self.by_type: dict[str, set[int]] = {}
+        self.by_program: dict[str, set[int]] = {}
+        self.arrays: set[int] = set()
+        self.structs: set[int] = set()
+        for idx, x in enumerate(self.tags):
+            self.by_type.setdefault(x["DataType"], set()).add(idx)
+            name = x["TagName"]
+            # controller scope is the empty string, "Program:Main" on its own is a controller symbol
+            program = name.partition(".")[0] if name.startswith("Program:") and "." in name else ""
+            self.by_program.setdefault(program, set()).add(idx)
+            if x["Array"]:
+                self.arrays.add(idx)
+            if x["Struct"]:
+                self.structs.add(idx)
+
+    def __len__(self) -> int:
+        return len(self.tags)
+
+    def _prefix_range(self, prefix: str) -> range:
+        start = bisect_left(self.names, prefix)
+        # every name with the prefix sorts before prefix followed by the highest code point
+        end = bisect_left(self.names, prefix + "\U0010ffff", lo=start)
+        return range(start, end)
+
+    def find(self,
+             prefix: str | None = None,
+             glob: str | None = None,
+             datatype: str | None = None,
+             array: bool | None = None,
+             struct: bool | None = None,
+             program: str | None = None,
+             offset: int = 0,
+             limit: int = 100) -> tuple[int, list[dict]]:
+        """Returns (total matches, one page of matches in name order)."""
+        candidates = self._prefix_range(prefix or "")
+        if glob:
+            # the literal start of the pattern narrows the range before matching
+            literal = _WILDCARDS.split(glob, 1)[0]
+            if literal.startswith(prefix or ""):
+                candidates = self._prefix_range(literal)
+        required = []
+        excluded = []
+        if datatype is not None:
+            required.append(self.by_type.get(datatype, set()))
+        if program is not None:
+            required.append(self.by_program.get(program, set()))
+        for flag, members in [(array, self.arrays), (struct, self.structs)]:
+            if flag is True:
+                required.append(members)
+            elif flag is False:
+                excluded.append(members)
+        # walk the smallest set instead of the range when it is smaller
+        required.sort(key=len)
+        if required and len(required[0]) < len(candidates):
+            positions = sorted(x for x in required[0] if x in candidates)
+            required = required[1:]
+        else:
+            positions = candidates
+        matches = []
+        for idx in positions:
+            if any(idx not in x for x in required) or any(idx in x for x in excluded):
+                continue
+            if glob and not fnmatchcase(self.names[idx], glob):
+                continue
+            matches.append(idx)
+        return len(matches), [self.tags[x] for x in matches[offset:offset + limit]]
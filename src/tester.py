@@ -1,5 +1,8 @@
+import os
 import zmq
 import json
+import time
+import asyncio
 import unittest
 import argparse
 
@@ -11,7 +14,7 @@ class TestClient(unittest.TestCase):
         self.provider_address = "192.168.1.196"
         self.context = zmq.Context()
         self.socket  = self.context.socket(zmq.DEALER)
-        self.socket.connect(f"tcp://{args.server_address}:{args.server_port}")
+        self.socket.connect(args.server_url or f"tcp://{args.server_address}:{args.server_port}")
 
         payload =  {
             "command": "connect",
@@ -166,6 +169,23 @@ class TestClient(unittest.TestCase):
         ])
         date_time = datetime.datetime.strptime(decoded_msg["msg"]["value"], '%Y-%m-%d %H:%M:%S.%f')
 
+    def test_get_plc_time_live(self):
+        for live in [True, False]:
+            payload =  {
+                "command": "get-plc-time",
+                "msg": {
+                    "raw": True,
+                    "live": live
+                }
+            }
+            self._send(payload)
+            server_id, decoded_msg = self._recv()
+            assert all([
+                decoded_msg["command"] == "get-plc-time",
+                decoded_msg["msg"]["status"] == "Success",
+                int(decoded_msg["msg"]["value"]) > 0
+            ])
+
     def test_set_plc_time(self):
         payload = {
             "command": "set-plc-time",
@@ -217,7 +237,7 @@ class TestClient(unittest.TestCase):
         payload =  {
             "command": "get-program-tag-list",
             "msg": {
-                "program_name": ""
+                "program_name": "Program:MainProgram"
             }
         }
         self._send(payload)
@@ -288,7 +308,8 @@ class TestClient(unittest.TestCase):
                 isinstance(x["SerialNumber"], int),
                 isinstance(x["ProductNameLength"], int),
                 isinstance(x["ProductName"], str),
-                isinstance(x["State"], int)
+                isinstance(x["State"], int),
+                x["FirstSeen"] <= x["LastSeen"]
             ])
 
     def test_get_module_properties(self):
@@ -347,6 +368,391 @@ class TestClient(unittest.TestCase):
             decoded_msg["msg"]["status"] == "Success"
         ])
 
+    def test_history(self):
+        payload = {
+            "command": "read",
+            "msg": {
+                "tag": "BaseINT",
+                "count": 1,
+                "datatype": 195
+            }
+        }
+        self._send(payload)
+        server_id, decoded_msg = self._recv()
+        payload = {
+            "command": "history",
+            "msg": {
+                "tag": "BaseINT",
+                "start": None,
+                "end": None,
+                "limit": 10
+            }
+        }
+        self._send(payload)
+        server_id, decoded_msg = self._recv()
+        if decoded_msg["msg"]["status"] == "Feature Not Enabled":
+            self.skipTest("historian not enabled")
+        assert all([
+            decoded_msg["command"] == "history",
+            decoded_msg["msg"]["name"] == "BaseINT",
+            decoded_msg["msg"]["status"] == "Success",
+            len(decoded_msg["msg"]["value"]) > 0
+        ])
+        for x in decoded_msg["msg"]["value"]:
+            assert all([
+                x["name"] == "BaseINT",
+                x["status"] == "Success",
+                isinstance(x["timestamp"], float)
+            ])
+
+    def test_latest_table(self):
+        payload = {
+            "command": "read",
+            "msg": {
+                "tag": "BaseINT",
+                "count": 1,
+                "datatype": 195
+            }
+        }
+        self._send(payload)
+        server_id, read_msg = self._recv()
+        self._send({"command": "stats", "msg": None})
+        server_id, decoded_msg = self._recv()
+        latest = decoded_msg["msg"]["value"]["latest"]
+        if latest is None:
+            self.skipTest("shared memory table not enabled")
+        # only readable from the same host as the service
+        from shmtable import LatestReader
+        reader = LatestReader(latest["path"])
+        entry = reader.get("BaseINT", self.provider_address)
+        reader.close()
+        assert all([
+            latest["used"] > 0,
+            entry is not None,
+            entry["value"] == read_msg["msg"]["value"],
+            entry["status"] == "Success",
+            isinstance(entry["timestamp"], float)
+        ])
+
+    def test_capture(self):
+        self._send({"command": "stats", "msg": None})
+        server_id, decoded_msg = self._recv()
+        capture = decoded_msg["msg"]["value"]["capture"]
+        if capture is None:
+            self.skipTest("capture not enabled")
+        payload = {
+            "command": "read",
+            "msg": {
+                "tag": "BaseDINT",
+                "count": 1,
+                "datatype": None
+            },
+            "id": "capture-check"
+        }
+        self._send(payload)
+        server_id, decoded_msg = self._recv()
+        # only readable from the same host as the service, written by a thread of its own
+        from capture import read_capture
+        entries = []
+        for _ in range(50):
+            entries = [
+                x for x in read_capture(capture["path"])
+                if isinstance(x.get("request", None), dict) and x["request"].get("id", None) == "capture-check"
+            ]
+            if entries:
+                break
+            time.sleep(0.05)
+        assert all([
+            len(entries) >= 1,
+            entries[-1]["request"] == payload,
+            isinstance(entries[-1]["t"], float),
+            isinstance(entries[-1]["client"], str),
+            entries[-1]["duration"] >= 0
+        ])
+
+    def test_trace(self):
+        payload =  {
+            "command": "read",
+            "trace": True,
+            "msg": {
+                "tag": "BaseINT",
+                "count": 1,
+                "datatype": 195
+            }
+        }
+        self._send(payload)
+        server_id, decoded_msg = self._recv()
+        assert all([
+            decoded_msg["command"] == "read",
+            decoded_msg["msg"]["status"] == "Success",
+            isinstance(decoded_msg["trace"], dict)
+        ])
+        for x in ["receive_decode", "queue_wait", "validation", "thread_handoff",
+                  "plc_io", "result_conversion", "encode", "total"]:
+            assert isinstance(decoded_msg["trace"][x], float)
+
+    def test_stats(self):
+        payload = {
+            "command": "stats",
+            "msg": None
+        }
+        self._send(payload)
+        server_id, decoded_msg = self._recv()
+        assert all([
+            decoded_msg["command"] == "stats",
+            decoded_msg["msg"]["name"] is None,
+            decoded_msg["msg"]["status"] == "Success",
+            isinstance(decoded_msg["msg"]["value"]["requests"], list),
+            isinstance(decoded_msg["msg"]["value"]["thread_pool_size"], int),
+            isinstance(decoded_msg["msg"]["value"]["rate_limits"], dict),
+            isinstance(decoded_msg["msg"]["value"]["watchdog"]["stalls"], dict),
+            isinstance(decoded_msg["msg"]["value"]["logging"]["dropped"], int),
+            isinstance(decoded_msg["msg"]["value"]["scaling"]["scaled"], int)
+        ])
+        for x in decoded_msg["msg"]["value"]["requests"]:
+            assert all([
+                isinstance(x["command"], str),
+                isinstance(x["controller"], str),
+                isinstance(x["status"], str),
+                isinstance(x["count"], int),
+                x["buckets"]["+Inf"] == x["count"]
+            ])
+
+    def test_stream_tag_list(self):
+        payload = {
+            "command": "get-tag-list",
+            "stream": True,
+            "chunk_size": 5,
+            "msg": {
+                "all_tags": True
+            }
+        }
+        self._send(payload)
+        tags = []
+        seq = 0
+        while True:
+            server_id, decoded_msg = self._recv()
+            assert all([
+                decoded_msg["command"] == "get-tag-list",
+                decoded_msg["seq"] == seq,
+                decoded_msg["msg"]["status"] == "Success",
+                len(decoded_msg["msg"]["value"]) <= 5
+            ])
+            tags.extend(decoded_msg["msg"]["value"])
+            seq += 1
+            if decoded_msg["end"]:
+                break
+        assert decoded_msg["count"] == len(tags)
+        for x in tags:
+            assert isinstance(x["TagName"], str)
+
+    def test_find_tags(self):
+        payload = {
+            "command": "find-tags",
+            "msg": {
+                "prefix": "Base",
+                "array": True,
+                "limit": 2
+            }
+        }
+        self._send(payload)
+        server_id, decoded_msg = self._recv()
+        assert all([
+            decoded_msg["command"] == "find-tags",
+            decoded_msg["msg"]["status"] == "Success",
+            isinstance(decoded_msg["msg"]["value"]["total"], int),
+            decoded_msg["msg"]["value"]["offset"] == 0,
+            len(decoded_msg["msg"]["value"]["tags"]) <= 2
+        ])
+        for x in decoded_msg["msg"]["value"]["tags"]:
+            assert all([
+                x["TagName"].startswith("Base"),
+                x["Array"]
+            ])
+
+    def test_scan_chassis(self):
+        payload = {
+            "command": "scan-chassis",
+            "msg": {
+                "slots": 6,
+                "concurrency": 3,
+                "refresh": True
+            }
+        }
+        self._send(payload)
+        server_id, decoded_msg = self._recv()
+        assert all([
+            decoded_msg["command"] == "scan-chassis",
+            decoded_msg["msg"]["status"] == "Success",
+            decoded_msg["msg"]["value"]["cached"] is False,
+            decoded_msg["msg"]["value"]["device"]["status"] == "Success",
+            len(decoded_msg["msg"]["value"]["slots"]) == 6
+        ])
+        for idx, x in enumerate(decoded_msg["msg"]["value"]["slots"]):
+            assert all([
+                x["slot"] == idx,
+                isinstance(x["status"], str),
+                isinstance(x["value"]["VendorID"], int) or x["status"] != "Success"
+            ])
+
+    def test_bad_format(self):
+        payload = {
+            "command": "read",
+            "msg": {
+                "tag": ["BaseINT", 1],
+                "count": None,
+                "datatype": None
+            }
+        }
+        self._send(payload)
+        server_id, decoded_msg = self._recv()
+        expected = {
+            "name": None,
+            "value": [{"field": "msg.tag[1]", "error": "expected string, got integer"}],
+            "status": "Bad Message Format"
+        }
+        assert decoded_msg == expected
+
+    def test_arrow(self):
+        payload = {
+            "command": "read",
+            "msg": {
+                "tag": ["BaseINT", "BaseREAL", "BaseSTRING"],
+                "count": None,
+                "datatype": None
+            },
+            "format": "arrow"
+        }
+        self._send(payload)
+        server_id, raw_msg, *frames = self.socket.recv_multipart()
+        decoded_msg = json.loads(raw_msg.decode("utf-8"))
+        if decoded_msg["msg"]["status"] == "Feature Not Enabled":
+            self.skipTest("pyarrow not installed")
+        from columnar import decode
+        table = decode(frames[0])
+        assert all([
+            decoded_msg["msg"]["status"] == "Success",
+            decoded_msg["msg"]["value"]["rows"] == 3,
+            table.column_names == ["tag", "timestamp", "value", "status"],
+            table.column("tag").to_pylist() == payload["msg"]["tag"],
+            set(table.column("status").to_pylist()) == {"Success"}
+        ])
+        # only read and history answer in arrow
+        self._send({"command": "stats", "msg": None, "format": "arrow"})
+        server_id, decoded_msg = self._recv()
+        assert decoded_msg["status"] == "Bad Message Format"
+
+    def test_scaling(self):
+        self._send({"command": "write", "msg": {"tag": "BaseDINT", "value": 100, "datatype": None}})
+        self._recv()
+        payload = {
+            "command": "set-scaling",
+            "msg": {
+                "tag": ["BaseDINT", "BaseINTArray"],
+                "scaling": {"poly": [5, 2], "clamp": {"max": 1000}}
+            }
+        }
+        self._send(payload)
+        server_id, decoded_msg = self._recv()
+        assert all([
+            decoded_msg["command"] == "set-scaling",
+            decoded_msg["msg"]["status"] == "Success",
+            decoded_msg["msg"]["value"] == payload["msg"]["scaling"]
+        ])
+        try:
+            self._send({"command": "read", "msg": {"tag": "BaseDINT", "count": 1, "datatype": None}})
+            server_id, decoded_msg = self._recv()
+            assert decoded_msg["msg"]["value"] == 205.0
+            # the elements of an array tag are scaled with it
+            self._send({"command": "read", "msg": {"tag": "BaseINTArray[0]", "count": 20, "datatype": None}})
+            server_id, decoded_msg = self._recv()
+            assert len(decoded_msg["msg"]["value"]) == 20
+            assert all(isinstance(x, float) and x <= 1000 for x in decoded_msg["msg"]["value"])
+            self._send({"command": "set-scaling", "msg": {"tag": "BaseDINT", "scaling": {"linear": {"raw_min": 0, "raw_max": 0, "eu_min": 0, "eu_max": 1}}}})
+            server_id, decoded_msg = self._recv()
+            assert decoded_msg["status"] == "Bad Message Format"
+        finally:
+            self._send({"command": "set-scaling", "msg": {"tag": ["BaseDINT", "BaseINTArray"], "scaling": None}})
+            self._recv()
+        self._send({"command": "read", "msg": {"tag": "BaseDINT", "count": 1, "datatype": None}})
+        server_id, decoded_msg = self._recv()
+        assert decoded_msg["msg"]["value"] == 100
+
+    def test_ready(self):
+        payload = {
+            "command": "ready",
+            "msg": None
+        }
+        self._send(payload)
+        server_id, decoded_msg = self._recv()
+        assert all([
+            decoded_msg["command"] == "ready",
+            decoded_msg["msg"]["status"] == "Success",
+            isinstance(decoded_msg["msg"]["value"]["ready"], bool),
+            isinstance(decoded_msg["msg"]["value"]["controllers"], dict)
+        ])
+        for x in decoded_msg["msg"]["value"]["controllers"].values():
+            assert x["state"] in ["pending", "warming", "ready", "failed"]
+
+    def test_poll_rates(self):
+        self._send({"command": "stats", "msg": None})
+        server_id, decoded_msg = self._recv()
+        poller = decoded_msg["msg"]["value"]["poller"]
+        if poller is None:
+            self.skipTest("no tag groups configured")
+        for x in poller["groups"].values():
+            assert all([
+                x["min_period"] <= x["period"] <= x["max_period"],
+                abs(x["rate"] - 1 / x["period"]) < 1e-9,
+                isinstance(x["tag_errors"], dict),
+                x["controller"] in poller["controllers"]
+            ])
+        for x in poller["controllers"].values():
+            assert x["state"] in ["normal", "slow"]
+
+    def test_request_id(self):
+        payload = {
+            "command": "read",
+            "msg": {
+                "tag": "BaseINT",
+                "count": 1,
+                "datatype": 195
+            },
+            "id": "read-1"
+        }
+        self._send(payload)
+        server_id, decoded_msg = self._recv()
+        # replies to malformed requests carry it too
+        self._send({"command": "read", "msg": None, "id": 7})
+        server_id, bad_msg = self._recv()
+        assert all([
+            decoded_msg["id"] == "read-1",
+            decoded_msg["msg"]["status"] == "Success",
+            bad_msg["id"] == 7,
+            bad_msg["status"] == "Bad Message Format"
+        ])
+
+    def test_pipelined_client(self):
+        from client import Client
+
+        async def run():
+            async with Client(args.server_url or f"tcp://{args.server_address}:{args.server_port}") as client:
+                await client.connect(self.provider_address)
+                tags = [f"BaseINTArray[{x}]" for x in range(50)]
+                # all outstanding at once on one socket
+                results = await asyncio.gather(*[client.read(x) for x in tags])
+                streamed = [x async for x in client.stream("get-tag-list", {"all_tags": True}, chunk_size=5)]
+                closed = await client.close_plc()
+                return tags, results, streamed, closed
+        tags, results, streamed, closed = asyncio.run(run())
+        assert all([
+            [x["name"] for x in results] == tags,
+            all(x["status"] == "Success" for x in results),
+            len(streamed) > 0,
+            all("TagName" in x for x in streamed),
+            closed["status"] == "Success"
+        ])
+
     def tearDown(self):
         payload = {
             "command": "close",
@@ -366,6 +772,261 @@ class TestClient(unittest.TestCase):
         self.socket.close()
         self.context.term()
 
+class TestEmbedded(unittest.TestCase):
+
+    def test_inproc(self):
+        # hosts its own simulated service in this process
+        from embed import EmbeddedService
+        with EmbeddedService(name="pylogix-as-service-tester", simulate=True, clock_sample_interval=None) as embedded:
+            connected = embedded.request("connect", {"ip": "192.168.1.196", "slot": 0, "timeout": 5, "micro800": False})
+            read = embedded.request("read", {"tag": "BaseINT", "count": 1, "datatype": 195})
+            closed = embedded.request("close", None)
+        assert all([
+            connected["msg"]["status"] == "Success",
+            read["command"] == "read",
+            read["msg"]["name"] == "BaseINT",
+            read["msg"]["status"] == "Success",
+            closed["msg"]["status"] == "Success"
+        ])
+
+    def test_recording(self):
+        # the historian, shared memory table, capture and tag group poller
+        # are tested here whatever flags the service under test runs with
+        import tempfile
+        from embed import EmbeddedService
+        from historian import Historian
+        from shmtable import LatestTable, LatestReader
+        from capture import Capture, read_capture
+        config = {
+            "controllers": [{"ip": "192.168.1.196"}],
+            "scan_classes": {"fast": {"period": 0.05}},
+            "tag_groups": [{"name": "line1", "controller": "192.168.1.196", "scan_class": "fast", "tags": ["BaseDINT", "BaseREAL"]}]
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            latest_path = os.path.join(directory, "latest")
+            capture_path = os.path.join(directory, "capture.jsonl")
+            with EmbeddedService(name="pylogix-as-service-recording", simulate=True, clock_sample_interval=None,
+                                 historian=Historian(os.path.join(directory, "history")), latest=LatestTable(latest_path),
+                                 capture=Capture(capture_path), config=config) as embedded:
+                embedded.request("connect", {"ip": "192.168.1.196", "slot": 0, "timeout": 5, "micro800": False})
+                read = embedded.request("read", {"tag": "BaseINT", "count": 1, "datatype": 195}, id="recorded")
+                history = embedded.request("history", {"tag": "BaseINT", "start": None, "end": None, "limit": 10})
+                # a few polls of the tag group
+                time.sleep(0.3)
+                polled = embedded.request("history", {"tag": ["BaseDINT", "BaseREAL"], "start": None, "end": None, "limit": None})
+                stats = embedded.request("stats", None)
+                reader = LatestReader(latest_path)
+                entry = reader.get("BaseINT", "192.168.1.196")
+                reader.close()
+            # the capture is complete once the service closed it
+            entries = [x for x in read_capture(capture_path) if isinstance(x.get("request", None), dict) and x["request"].get("id", None) == "recorded"]
+        poller = stats["msg"]["value"]["poller"]
+        assert all([
+            history["msg"]["status"] == "Success",
+            [x["value"] for x in history["msg"]["value"]] == [read["msg"]["value"]],
+            polled["msg"]["status"] == "Success",
+            {x["name"] for x in polled["msg"]["value"]} == {"BaseDINT", "BaseREAL"},
+            poller["groups"]["line1"]["polls"] > 1,
+            poller["groups"]["line1"]["errors"] == 0,
+            entry is not None,
+            entry["value"] == read["msg"]["value"],
+            len(entries) == 1,
+            entries[0]["request"]["msg"]["tag"] == "BaseINT"
+        ])
+
+    def test_pipelined_batches(self):
+        # more requests in flight on one socket than a wake up of the
+        # receive loop takes, with a discover taking half a second among them
+        from embed import EmbeddedService
+        from mock import load_mock_config
+        mock_config = load_mock_config()
+        mock_config = {**mock_config, "model": {**mock_config["model"], "discover_latency": 0.5}}
+        with EmbeddedService(name="pylogix-as-service-pipelined", simulate=True, clock_sample_interval=None,
+                             recv_batch=4, mock_config=mock_config) as embedded:
+            sock = embedded.socket()
+            connect = {"command": "connect", "msg": {"ip": "192.168.1.196", "slot": 0, "timeout": 5, "micro800": False}}
+            sock.send_multipart([json.dumps(connect).encode("utf-8")])
+            sock.recv_multipart()
+            fast = [{"command": "read", "msg": {"tag": f"BaseINTArray[{x}]", "count": 1, "datatype": 195}, "id": f"read-{x}"} for x in range(10)]
+            fast += [{"command": "stats", "msg": None, "id": f"stats-{x}"} for x in range(3)]
+            requests = fast + [{"command": "discover", "msg": None, "id": "slow"}]
+            requests += [{"command": "read", "msg": {"tag": "BaseINT", "count": 1, "datatype": 195}, "id": f"after-{x}"} for x in range(10)]
+            sent = time.perf_counter()
+            for request in requests:
+                sock.send_multipart([json.dumps(request).encode("utf-8")])
+            replies = {}
+            order = []
+            while len(order) < len(requests) and sock.poll(5000):
+                _, raw_msg, *_ = sock.recv_multipart()
+                decoded_msg = json.loads(raw_msg)
+                order.append(decoded_msg.get("id", None))
+                replies[order[-1]] = (decoded_msg, time.perf_counter() - sent)
+            sock.close()
+        assert all([
+            # every id back exactly once, in the order sent
+            order == [x["id"] for x in requests],
+            all(x["msg"]["status"] == "Success" for x, _ in replies.values()),
+            # whatever was queued ahead of the discover did not wait for it,
+            # those batched with it included
+            max(replies[x["id"]][1] for x in fast) < 0.25,
+            replies["slow"][1] >= 0.5
+        ])
+
+    def test_rate_limit_busy(self):
+        # one request a second and no waiting, every call to the plc after
+        # the first is refused, those answered by the service are not
+        from embed import EmbeddedService
+        from ratelimit import RateLimiter
+        with EmbeddedService(name="pylogix-as-service-busy", simulate=True, clock_sample_interval=None,
+                             rate_limiter=RateLimiter(requests=1, burst=1, max_delay=0.1)) as embedded:
+            embedded.request("connect", {"ip": "192.168.1.196", "slot": 0, "timeout": 5, "micro800": False})
+            # no clock estimate yet, sampled from the plc
+            sampled = embedded.request("get-plc-time", {"raw": True})
+            estimated = embedded.request("get-plc-time", {"raw": True})
+            live = embedded.request("get-plc-time", {"raw": True, "live": True})
+            uploaded = embedded.request("find-tags", {"prefix": "Base"})
+            stats = embedded.request("stats", None)
+        budget = stats["msg"]["value"]["rate_limits"]["192.168.1.196"]
+        assert all([
+            sampled["msg"]["status"] == "Success",
+            estimated["msg"]["status"] == "Success",
+            live["msg"]["status"] == "Controller Busy",
+            uploaded["msg"]["status"] == "Controller Busy",
+            budget["busy"] == 2
+        ])
+
+    def test_rate_limit_wait(self):
+        # five requests a second with room for one, the tag list upload
+        # on refresh waits for the one before it to be paid back
+        from embed import EmbeddedService
+        from ratelimit import RateLimiter
+        with EmbeddedService(name="pylogix-as-service-throttled", simulate=True, clock_sample_interval=None,
+                             rate_limiter=RateLimiter(requests=5, burst=0.2, max_delay=1)) as embedded:
+            embedded.request("connect", {"ip": "192.168.1.196", "slot": 0, "timeout": 5, "micro800": False})
+            uploaded = embedded.request("find-tags", {"prefix": "Base"})
+            started = time.perf_counter()
+            refreshed = embedded.request("find-tags", {"prefix": "Base", "refresh": True})
+            waited = time.perf_counter() - started
+            started = time.perf_counter()
+            cached = embedded.request("find-tags", {"prefix": "Base"})
+            answered = time.perf_counter() - started
+            stats = embedded.request("stats", None)
+        budget = stats["msg"]["value"]["rate_limits"]["192.168.1.196"]
+        assert all([
+            uploaded["msg"]["status"] == "Success",
+            refreshed["msg"]["status"] == "Success",
+            cached["msg"]["status"] == "Success",
+            waited >= 0.15,
+            answered < 0.1,
+            budget["throttled"] == 1,
+            budget["throttled_seconds"] >= 0.15,
+            budget["busy"] == 0
+        ])
+
+    def test_watchdog_stall(self):
+        # converting a tag list of fifty thousand tags holds the loop
+        # well past the threshold
+        from embed import EmbeddedService
+        from mock import load_mock_config
+        from watchdog import Watchdog
+        mock_config = {**load_mock_config(), "tags": {f"Tag{x}": "DINT" for x in range(50000)}}
+        with EmbeddedService(name="pylogix-as-service-watchdog", simulate=True, clock_sample_interval=None,
+                             mock_config=mock_config, watchdog=Watchdog(threshold=0.02, interval=0.01, stacks=8)) as embedded:
+            # simulated controllers live as long as the process, the first
+            # one made at an address keeps its tags
+            embedded.request("connect", {"ip": "192.168.1.150", "slot": 0, "timeout": 5, "micro800": False})
+            tags = embedded.request("get-tag-list", {"all_tags": True})
+            # the stall is recorded on the first heartbeat after it
+            time.sleep(0.1)
+            stats = embedded.request("stats", None)
+        watchdog = stats["msg"]["value"]["watchdog"]
+        stall = watchdog["stalls"].get("get-tag-list:result_conversion", None)
+        stacks = [x for x in watchdog["stacks"] if x["culprit"] == "get-tag-list:result_conversion"]
+        assert all([
+            tags["msg"]["status"] == "Success",
+            len(tags["msg"]["value"]) == 50000,
+            stall is not None,
+            stall["count"] >= 1,
+            stall["max"] > watchdog["threshold"],
+            len(stacks) >= 1,
+            "_get_tag_list" in stacks[0]["stack"]
+        ])
+
+class TestComponents(unittest.TestCase):
+
+    def test_history_clock_step(self):
+        # samples are stamped with the controller clock, a resync can
+        # move it backwards in the middle of a segment
+        import tempfile
+        from historian import Historian
+        with tempfile.TemporaryDirectory() as directory:
+            historian = Historian(directory, index_every=2)
+            for timestamp in [100.0, 101.0, 102.0, 103.0, 90.0, 91.0, 104.0, 92.0]:
+                historian.append("192.168.1.196", [("BaseINT", timestamp, "Success")], timestamp=timestamp)
+            window = historian.query("192.168.1.196", start=90.5, end=100.5)
+            before = historian.query("192.168.1.196", end=95.0)
+            after = historian.query("192.168.1.196", start=103.5)
+            historian.close()
+        assert all([
+            [x["timestamp"] for x in window] == [100.0, 91.0, 92.0],
+            [x["timestamp"] for x in before] == [90.0, 91.0, 92.0],
+            [x["timestamp"] for x in after] == [104.0]
+        ])
+
+    def test_latest_busy_slot(self):
+        # a reader scanning while the writer is in the middle of a slot
+        import struct
+        import tempfile
+        from shmtable import LatestTable, LatestReader, _HEADER_SIZE
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "latest")
+            table = LatestTable(path, slots=16)
+            table.update("192.168.1.196", [("BaseINT", 1, "Success"), ("BaseDINT", 2, "Success"), ("BaseREAL", 3.0, "Success")])
+            offset = _HEADER_SIZE + table.slot_size
+            sequence = struct.unpack_from("<Q", table.mm, offset)[0]
+            # an odd sequence marks the second slot as being written
+            struct.pack_into("<Q", table.mm, offset, sequence + 1)
+            reader = LatestReader(path, retries=2)
+            busy = reader.get("BaseDINT")
+            struct.pack_into("<Q", table.mm, offset, sequence + 2)
+            written = reader.get("BaseDINT")
+            after = reader.get("BaseREAL")
+            reader.close()
+            table.close()
+        assert all([
+            busy is None,
+            written is not None and written["value"] == 2,
+            after is not None and after["value"] == 3.0
+        ])
+
+    def test_poll_group_sizes(self):
+        # a group of two tags and one of two hundred on one controller,
+        # each answering in its own steady time
+        from poller import Poller, TagGroup
+        small = TagGroup("small", "192.168.1.196", "fast", 0.01, ["BaseINT", "BaseDINT"])
+        large = TagGroup("large", "192.168.1.196", "fast", 0.01, [f"BaseINTArray[{x}]" for x in range(200)])
+
+        async def read(group):
+            latency = 0.0005 if group is small else 0.005
+            await asyncio.sleep(latency)
+            return [(x, 0, "Success") for x in group.tags], latency
+
+        async def run():
+            poller = Poller([small, large], read)
+            try:
+                await asyncio.wait_for(poller.run(), 0.5)
+            except asyncio.TimeoutError:
+                pass
+            return poller.snapshot()
+        snapshot = asyncio.run(run())
+        assert all([
+            small.polls > 10,
+            large.polls > 10,
+            snapshot["controllers"]["192.168.1.196"] == {"state": "normal", "slow_groups": []},
+            small.period == small.min_period,
+            large.period == large.min_period
+        ])
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         prog="pylogix-as-service-tester",
@@ -374,14 +1035,23 @@ if __name__ == "__main__":
     parser.add_argument(
         '--server-address',
         dest="server_address",
-        required=True,
+        required=False,
         help="The address for this service to bind to, eg. 127.0.0.1."
     )
     parser.add_argument(
         '--server-port',
         dest="server_port",
-        required=True,
+        required=False,
         help="The port for this service to list on, eg. 7777."
     )
+    parser.add_argument(
+        '--server-url',
+        dest="server_url",
+        default=None,
+        required=False,
+        help="Endpoint of the service instead of address and port, eg. ipc:///tmp/pylogix.ipc."
+    )
     args = parser.parse_args()
+    if not args.server_url and not (args.server_address and args.server_port):
+        parser.error("either --server-url or --server-address and --server-port are required")
     unittest.main(argv=[''])
@@ -0,0 +1,26 @@
+import time
+from contextvars import ContextVar
+
+class Trace:
+    """Per request timing breakdown, every lap charges the time
+    since the previous lap to the named stage."""
+
+    def __init__(self, started: float) -> None:
+        self.started = started
+        self.last = started
+        self.stages: dict[str, float] = {}
+
+    def lap(self, stage: str, now: float | None = None):
+        """now defaults to the current time."""
+        now = now if now is not None else time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.last
+        self.last = now
+
+    def to_dict(self) -> dict:
+        """Stage durations in milliseconds."""
+        container = {k: round(v * 1000, 3) for k, v in self.stages.items()}
+        container["total"] = round((self.last - self.started) * 1000, 3)
+        return container
+
+# copied into worker threads by asyncio.to_thread
+current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
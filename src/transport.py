@@ -0,0 +1,26 @@
+import zmq
+
+# keyword names, as on the command line, to zeromq socket options
+SOCKET_OPTIONS = {
+    "sndhwm":              zmq.SNDHWM,
+    "rcvhwm":              zmq.RCVHWM,
+    "sndbuf":              zmq.SNDBUF,
+    "rcvbuf":              zmq.RCVBUF,
+    "tcp_keepalive":       zmq.TCP_KEEPALIVE,
+    "tcp_keepalive_idle":  zmq.TCP_KEEPALIVE_IDLE,
+    "tcp_keepalive_intvl": zmq.TCP_KEEPALIVE_INTVL,
+    "tcp_keepalive_cnt":   zmq.TCP_KEEPALIVE_CNT
+}
+
+def socket_options(**values) -> dict[int, int]:
+    """zeromq options from keyword values, None keeps the zeromq default."""
+    return {SOCKET_OPTIONS[k]: v for k, v in values.items() if v is not None}
+
+def bind(sock, urls: str | list[str], options: dict[int, int] | None = None):
+    """Bind to every endpoint, tcp://, ipc:// or inproc://. The options
+    are set first, zeromq only applies them to connections made later."""
+    sock.setsockopt(zmq.LINGER, 0)
+    for option, value in (options or {}).items():
+        sock.setsockopt(option, value)
+    for url in [urls] if isinstance(urls, str) else urls:
+        sock.bind(url)
@@ -0,0 +1,113 @@
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+
+class Watchdog:
+    """Measures how late the event loop runs a heartbeat and, from a
+    thread of its own, notices when the loop is stuck for longer than
+    threshold seconds. A stall is blamed on the stage the loop was last
+    marked to be in, eg. "get-tag-list:result_conversion", or on the
+    name of the task that was running when that is another task, and
+    with stacks the stack of the loop thread is sampled while stuck.
+    Without a threshold nothing runs and mark only costs a store."""
+
+    def __init__(self,
+                 threshold: float | None = None,
+                 interval: float = 0.1,
+                 stacks: int = 0,
+                 stack_interval: float = 1.0,
+                 metrics=None) -> None:
+        self.threshold = threshold
+        self.interval = interval
+        self.stack_interval = stack_interval
+        self.metrics = metrics
+        # (task, command, stage) the loop was last marked to be in
+        self.current = (None, None, "idle")
+        self.stalls: dict[str, list] = {}
+        self.stacks = deque(maxlen=stacks) if stacks else None
+        self.stalled: dict | None = None
+        self.captured: dict[str, float] = {}
+        self.beat = time.monotonic()
+        self.loop = None
+        self.loop_thread = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def mark(self, command: str | None, stage: str):
+        self.current = (asyncio.current_task(), command, stage)
+
+    async def run(self):
+        if not self.threshold:
+            return
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread = threading.get_ident()
+        self.beat = time.monotonic()
+        monitor = threading.Thread(target=self._monitor, name="watchdog", daemon=True)
+        monitor.start()
+        try:
+            while True:
+                expected = time.monotonic() + self.interval
+                await asyncio.sleep(self.interval)
+                now = time.monotonic()
+                lag = max(0.0, now - expected)
+                with self._lock:
+                    self.beat = now
+                    stalled, self.stalled = self.stalled, None
+                if self.metrics:
+                    self.metrics.observe_loop_lag(lag)
+                if lag > self.threshold:
+                    self._record(stalled or {"culprit":"unknown", "stack":None}, lag)
+        finally:
+            self._stop.set()
+
+    def _culprit(self, frame) -> str:
+        task, command, stage = self.current
+        running = asyncio.current_task(self.loop)
+        if running is None:
+            # waiting in select yet late, other threads kept the GIL
+            if frame is not None and frame.f_code.co_filename.endswith("selectors.py"):
+                return "gil"
+            return "callback"
+        if running is not task:
+            return running.get_name()
+        return f"{command}:{stage}" if command else stage
+
+    def _monitor(self):
+        while not self._stop.wait(self.threshold / 4):
+            with self._lock:
+                if self.stalled is not None or time.monotonic() - self.beat < self.interval + self.threshold:
+                    continue
+                frame = sys._current_frames().get(self.loop_thread, None)
+                culprit = self._culprit(frame)
+                self.stalled = {"culprit":culprit, "stack":None}
+                # sampled per culprit, a frequent one does not crowd out the rest
+                now = time.monotonic()
+                if self.stacks is not None and frame is not None \
+                        and now - self.captured.get(culprit, -self.stack_interval) >= self.stack_interval:
+                    self.captured[culprit] = now
+                    self.stalled["stack"] = traceback.format_stack(frame)
+                del frame
+
+    def _record(self, stalled: dict, lag: float):
+        culprit = stalled["culprit"]
+        entry = self.stalls.setdefault(culprit, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += lag
+        entry[2] = max(entry[2], lag)
+        if self.metrics:
+            self.metrics.observe_stall(culprit, lag)
+        if stalled["stack"] and self.stacks is not None:
+            self.stacks.append({"time":time.time(), "culprit":culprit, "lag":lag, "stack":"".join(stalled["stack"])})
+        logging.warning(f"event loop stalled for {lag:.3f}s in {culprit}")
+
+    def snapshot(self) -> dict:
+        return {
+            "threshold":self.threshold,
+            "interval":self.interval,
+            "stalls":{k: {"count":v[0], "seconds":v[1], "max":v[2]} for k, v in self.stalls.items()},
+            "stacks":list(self.stacks) if self.stacks is not None else None
+        }